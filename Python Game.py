@@ -1,5 +1,9 @@
-import csv
-from copy import deepcopy
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
 
 groupNumber = 17
 groupName = {'Victoria Li' : 'u5568587',\
@@ -9,529 +13,50 @@ groupName = {'Victoria Li' : 'u5568587',\
              'Zhe Kai Ng' : 'u5565323'}
 
 
-###############################################################################
-# Task 1
-
-def newGame(p1, p2):
-    """
-    Initialises a new game with two players.
-
-    Args:
-        p1 (str): Name of Player 1.
-        p2 (str): Name of Player 2.
-
-    Returns:
-        dict: A dictionary containing the game state, including player names,
-              the current player, and the game board.
-
-    Raises:
-        TypeError: If p1 or p2 is not a string.
-    """
-    
-    #Both players must be valid strings
-    if not isinstance(p1, str) or not isinstance(p2, str):
-        raise TypeError("Player names must be strings.")
-
-    return { #dictionary
-        #player names
-        'Player 1': p1,
-        'Player 2': p2,
-        
-        #First turn is player 1
-        'Who': 1,
-        
-        #3D Board game initialized to 0's
-        'Board': [[[0 for _ in range(6)] for _ in range(6)] for _ in range(4)]
-    }
-
-###############################################################################
-
-###############################################################################
-# Task 2
-
-def printBoard(board):
-    """
-    Returns a formatted string representation of the game board.
-
-    Args:
-        board (list): A 3D list representing the board state.
-
-    Returns:
-        str: A string representation of the board with proper alignment and spacing.
-
-    Raises:
-        TypeError: If board is not a 3D list.
-    """
-
-    #Check if input is a valid board(4x6x6)
-    if not (isinstance(board, list) and len(board) == 4 and
-            all(isinstance(layer, list) and len(layer) == 6 for layer in board) and
-            all(isinstance(row, list) and len(row) == 6 for layer in board for row in layer)):
-        raise TypeError("Invalid board structure.")
-        
-        
-    #Row and collumn labels
-    row_labels = ['a', 'b', 'c', 'd', 'e', 'f']
-    col_labels = ['A', 'B', 'C', 'D', 'E', 'F']
-    
-    #Headers and collumn labels
-    board_str = "   Layer 1    |   Layer 2    |   Layer 3    |   Layer 4\n"
-    
-    #Add collumn labels for each layer, seperated by |
-    board_str += "  " + " |  ".join(["|".join(col_labels)] * 4) + "\n"
-    
-    #Seperators between labels and grid
-    board_str += " " + "| ".join(["-+-+-+-+-+-+-"] * 4) + "\n"
-    
-    
-    #Loop through each row
-    for row in range(6):
-        #Add label
-        row_str = [row_labels[row]] 
-        #Loop through each level
-        for level in range(4):
-            #Add row values. 0's replaced with spaces
-            row_str.append("|" + "|".join(
-                str(board[level][row][col]) if board[level][row][col] != 0 else " " for col in range(6))) 
-            #row seperators
-            if level < 3: row_str.append(" |" + row_labels[row])
-        board_str += "".join(row_str) + "\n"
-        
-
-    return board_str
-
-###############################################################################
-
-###############################################################################
-# Task 3
-
-
-class ColumnFullError(Exception):
-    '''
-    
-    Error raised when there is an insertion attempt into a full collumn
-    
-    '''
-    
-    pass
-
-class InvalidColumnFormat(Exception):
-    
-    '''
-    
-    Error raised when inserted collumn format is incorrect
-    
-    '''
-    
-    
-def posToIndex(col,board):
-    
-    '''
-    
-    Converts collumn identifier in letter form (Eg. Aa) into board indices
-    
-    Input:
-        col(str): Collumn identifier of length 2. Contains 1 uppercase letter A-F (collumn)
-                  and 1 lower case letter a-f (row)
-        board (list): A 3D array representning the game board (4 x 6 x 6 board)
-        
-    Returns:
-        list: The indices of the first empty slot in the collumn col in form
-              [k, j, i] where k is the level, j is the row index, and i is the collumn index
-    
-    Raises:
-        ColumnFullError: If the column is full.
-        InvalidColumnFormatError: If col is wrongly formatted
-    
-    '''
-
-    #Create dictionaries (row_letters, col_letters) to map row and collumn
-    #letters to corresponding indices in the 3D board array
-    
-    row_letters = {'a': 0, 'b': 1, 'c': 2, 'd' : 3, 'e' : 4, 'f' : 5}
-    
-    col_letters = {'A': 0, 'B': 1, 'C': 2, 'D' : 3, 'E' : 4, 'F' : 5}
-    
-    
-    #Checks if col input is exactly 2 characters, one lower case and one upper
-    #case to define rows and collumns. If not, raise exception.
-    
-    if len(col) != 2 or not ((col[0] in row_letters and col[1] in col_letters) or 
-                             (col[1] in row_letters and col[0] in col_letters)):
-        
-        raise InvalidColumnFormat(f"Invalid column format: {col}")
-        
-
-    # Extracting indices from the letters
-
-    
-    #row index is the lowercase letter. For characters in col, find the lowercase letter
-    row_index = row_letters[col[0]] if col[0] in row_letters else row_letters[col[1]]
-    
-    #collumn index is the uppercase letter. For characters in col, find the uppercase letter
-    col_index = col_letters[col[0]] if col[0] in col_letters else col_letters[col[1]]
-    
-
-    # Iterate through all floor_lvls. 
-    #Find the first available slot in the column
-    
-    for floor_lvl in range(4):
-        if board[floor_lvl][row_index][col_index] == 0:
-            return [floor_lvl, row_index, col_index]
-
-
-    # No empty space found. Raise collumn full error
-    raise ColumnFullError(f"Column {col} is full")
-
-
-
-###############################################################################
-
-###############################################################################
-# Task 4
-
-class IndexOutOfRange(Exception):
-    
-    '''
-    Error raised when inserted index is invalid
-    
-    '''
-    
-    pass
-
-
-def indexToPos(ind):
-    
-    '''
-    Converts a list of board indices to corresponding letter collumn indentifiers
-    
-    Input:
-        ind(list): List of integers representing the board indices in 2D or 3D cases.
-    
-    Return:
-        str: Letter collumn identifier in form 'Xx'
-        
-    Raises:
-        IndexOutOfRange: If i or j are not between 0 and 5.
-    
-    '''
-    
-    
-    #Map row and collumn indices to letter collumn identifiers
-    row_indices = {0:'a', 1:'b', 2:'c', 3:'d', 4:'e', 5:'f'}
-    
-    col_indices = {0:'A', 1:'B', 2:'C', 3:'D', 4:'E', 5:'F'}
-    
-    
-    #Splitting 2D,3D, and invalid cases
-    if len(ind) == 2:
-        j = ind[0] #j = row index
-        i = ind[1] #i = collumn index
-    elif len(ind) == 3:
-        j = ind[1] #j = row index
-        i = ind[2] #i = collumn index
-    else:
-        raise IndexOutOfRange(f" Index must be of length 2 or 3: {ind}")
-        
-    #Invalid index error checks
-    if j not in row_indices or i not in col_indices:
-        raise IndexOutOfRange(f"Invalid index: {ind}")
-        
-        
-    #Display collumn index first then row index to be in form 'Xx'
-    return col_indices[i] + row_indices[j] 
-        
-    
-
-
-###############################################################################
-
-###############################################################################
-# Task 5
-
-def saveGame(game, fname):
-    """
-    Saves the game state to a CSV file.
+#The game itself is in the game3d package next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-    Args:
-        game (dict): The current game state.
-        fname (str): The filename to save the game to.
-    """
-    with open(fname, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        
-        # Write player information
-        writer.writerow(["Player 1", game['Player 1']])
-        writer.writerow(["Player 2", game['Player 2']])
-        writer.writerow(["Who", game['Who']])
-        writer.writerow(["Board"])  
-        
-        # Flatten the 3D board into 2D format 
-        for layer in game['Board']:
-            for row in layer:
-                writer.writerow(row)
-                
-
-
-###############################################################################
-
-###############################################################################
-# Task 6
-
-def loadGame(fname):
-    """
-    Loads the game state from a CSV file.
-
-    Args:
-        fname (str): The filename to load the game from.
-
-    Returns:
-        dict: The restored game state dictionary.
-    """
-    with open(fname, mode='r', newline='') as file:
-        reader = csv.reader(file)
-        
-        # Read player names
-        player1 = next(reader)[1]
-        player2 = next(reader)[1]
-        
-        # Read current turn
-        who = next(reader)[1]
-        
-        # Skip 'Board' line
-        next(reader)
-        
-        # Read board values
-        board = []
-        for _ in range(4):  # Read 4 layers
-            layer = [list(map(int, next(reader))) for _ in range(6)]
-            board.append(layer)
-        
-        return {
-            'Player 1': player1,
-            'Player 2': player2,
-            'Who': who,
-            'Board': board
-        }
-    
-
-
-###############################################################################
-
-###############################################################################
-# Task 7
-
-def findValidMoves(board):
-    """
-    Finds all non-full columns in the board and returns them as valid moves.
-
-    Args:
-        board (list): The 3D board representation.
-
-    Returns:
-        list: A list of valid moves in the form of 'xX' or 'Xx'.
-    """
-    row_labels = ['a', 'b', 'c', 'd', 'e', 'f']
-    col_labels = ['A', 'B', 'C', 'D', 'E', 'F']
-    valid_moves = []
-    
-    for row in range(6):
-        for col in range(6):
-            # If the top layer (highest) at (row, col) is empty (0), it's a valid move
-            if board[3][row][col] == 0:
-                #valid_moves.append(f"{row_labels[row]}{col_labels[col]}")
-                valid_moves.append(f"{col_labels[col]}{row_labels[row]}")
-    
-    return valid_moves
-    
+from game3d.board import *
+from game3d.render import *
+from game3d.storage import *
+from game3d.sessions import *
+from game3d.engine import *
+from game3d.net import *
+from game3d.strategies import *
+from game3d.server import *
+from game3d.analysis import *
 
-###############################################################################
-
-###############################################################################
-# Task 8
-
-class MoveNotMade(Exception):
-    """
-    Exception raised when a move cannot be made due to an invalid column reference,
-    incorrect format, or if the column is full.
-    """
-    pass
-
-def makeMove(game, move):
-    """
-    Attempts to place a piece in the specified column.
-    
-    Args:
-        game (dict): The current game state.
-        move (str): A string representing the column in the form 'xX' or 'Xx'.
-    
-    Returns:
-        dict: A new game state dictionary after the move is made.
-    
-    Raises:
-        MoveNotMade: If the move is invalid or the column is full.
-    """
-
-    # Validate move format
-    if len(move) != 2 or not (move[0].isalpha() and move[1].isalpha()):
-        raise MoveNotMade("Invalid move format. Must be 'xX' or 'Xx'.")
-        
-    try:
-        # Get the indices for the move
-        k, j, i = posToIndex(move, game['Board'])
-    except (InvalidColumnFormat, ColumnFullError) as e:
-        raise MoveNotMade(str(e))
-    
-    # Create a deep copy of the game
-    new_game = deepcopy(game)
-    
-    # Place the current player's piece in the determined location
-    new_game['Board'][k][j][i] = new_game['Who']
-    
-    # Switch to the next player
-    new_game['Who'] = 1 if new_game['Who'] == 2 else 2
-    
-    return new_game
-
-
-
-###############################################################################
-
-###############################################################################
-# Task 9
-
-def isWinner(game):
-    """
-    Checks whether there is a winner in the current board of the given game.
-    
-    Args:
-        game (dict): The current game state.
-        
-    Returns:
-       1 if Player 1 has won,
-       2 if Player 2 has won,
-       0 if there is no winner and the board is not full,
-      -1 if there is no winner and the board is full.
-    """
-    board = game['Board']  # layer 4 x row 6 x col 6
-    
-    # A quick helper to check if the board is completely filled (no 0s).
-    def board_is_full(bd):
-        for k in range(4):
-            for j in range(6):
-                for i in range(6):
-                    if bd[k][j][i] == 0:
-                        return False
-        return True
-
-    # Directions in 3D to check for 4 in a row:
-    # (dk, dj, di) indicates how we move in layer (k), row (j), and col (i)
-    directions = [
-        (1, 0, 0),  # through layers
-        (0, 1, 0),  # along rows
-        (0, 0, 1),  # along columns
-        (1, 1, 0),
-        (1, 0, 1),
-        (0, 1, 1),
-        (1, -1, 0),
-        (1, 0, -1),
-        (0, 1, -1),
-        (1, 1, 1),
-        (1, 1, -1),
-        (1, -1, 1),
-        (1, -1, -1)
-    ]
-    
-    # Check all positions as potential "starting" points
-    for k in range(4):       # layer index
-        for j in range(6):   # row index
-            for i in range(6):  # column index
-                player = board[k][j][i]
-                # Only check if this cell is occupied (1 or 2)
-                if player != 0:
-                    # Explore each direction
-                    for dk, dj, di in directions:
-                        ''' 
-                        We want to see if we can get 3 more cells (total of 4)
-                        in that direction without going out of bounds,
-                        and if they match player.
-                        '''
-                        valid_line = True
-                        for step in range(1, 4):  # steps of 1,2,3
-                            nk = k + dk * step
-                            nj = j + dj * step
-                            ni = i + di * step
-                            # Check boundaries
-                            if not (0 <= nk < 4 and 0 <= nj < 6 and 0 <= ni < 6):
-                                valid_line = False
-                                break
-                            # Check if same player
-                            if board[nk][nj][ni] != player:
-                                valid_line = False
-                                break
-                        # If all 4 in a row matched, we have a winner
-                        if valid_line:
-                            return player  # either 1 or 2
-
-    # If no winner, check if board is full
-    if board_is_full(board):
-        return -1
-    else:
-        return 0
-    
-    
-    
-
-###############################################################################
 
 ###############################################################################
 # Task 10
-
-class GameOverError(Exception):
-    """
-    Error raised when no valid moves remain (i.e. the game is over).
-    """
-    pass
-
-def suggestMove(game):
-    """
-    Suggests a valid move for the next player in the form 'xX' or 'Xx'.
-    If there are no valid moves, raises GameOverError.
-
-    Args:
-        game (dict): The current game state.
-
-    Returns:
-        str: A valid move, e.g., 'aA' or 'Aa'.
-
-    Raises:
-        GameOverError: If no valid moves remain (the board is full).
-    """
-    # Get all valid moves from Task 7
-    valid_moves = findValidMoves(game['Board'])
-
-    # If no valid moves, game is over
-    if not valid_moves:
-        raise GameOverError("No valid moves left. The board is full.")
-
-    # Otherwise, return any valid move (e.g. the first one)
-    return valid_moves[0]
-    
-
-
+#
+# suggestMove (game3d.strategies) and GameOverError (game3d.board) are
+# imported above with the rest of the game.
 ###############################################################################
 
 ###############################################################################
 # Task 11
 
-def playGame():
+def playGame(strategy=None, geometry=DEFAULT_GEOMETRY):
     """
     
     Function that plays the game with 2 players (human or AI). The game
     continues until there is a winner or the board is full. Supports saving, 
     loading, and move validation
     
+    Args:
+        strategy (function): Chooses the moves of players named C, given the
+                             game. By default suggestMove, which then also
+                             thinks about its replies while a person is
+                             choosing a move (see Ponderer).
+        geometry (Geometry): Board size and win length of a new game. A
+                             loaded game keeps its own.
+    
     """
+    ponderer = None
+    if strategy is None:
+        strategy = suggestMove
+        ponderer = Ponderer()
     
     # Ask for Player 1’s name (or load an existing game)
     p1 = input("Input Player 1's name (or type 'load' to resume playing): ").strip()
@@ -547,12 +72,14 @@ def playGame():
     else:
         # Start a new game
         p2 = input("Enter Player 2's name: ").strip() 
-        game = newGame(p1, p2)  # Using task 1 to create a new game
+        game = newGame(p1, p2, geometry)  # Using task 1 to create a new game
         
+    # Prints the same text as Task 2, redrawing only the cells that changed
+    renderer = BoardRenderer(gameGeometry(game))
         
     while True:
         # Print the board using Task 2
-        print(printBoard(game['Board']))
+        print(renderer.render(game['Board']))
 
         # Find who's turn it is
         current_player = game['Who']
@@ -563,15 +90,23 @@ def playGame():
         
         if player_name == 'C': #Playing against AI
             try:
-                move = suggestMove(game)  # Using task 10
+                if ponderer is not None:
+                    move = ponderer.suggest(game)  # Task 10, using what was pondered
+                else:
+                    move = strategy(game)  # Using task 10
                 print(f"Computer plays: {move}")
-                game = makeMove(game, move)  # Using task 8
+                applyMove(game, move)  # Using task 8
             except GameOverError: #Board full. Error handling
                 print("Games over! It's a draw.")
                 break
         else:
+            # Think about the computer's replies while waiting
+            if ponderer is not None and game[f'Player {3 - current_player}'] == 'C':
+                ponderer.start(game)
+            
             while True:
-                move = input("Enter your move ('xX'), or type 'save' to save the game: ").strip()
+                move = input("Enter your move ('xX'), or type 'save' to save the game, "
+                             "'undo' or 'redo': ").strip()
 
                 # Save the game
                 if move.lower() == 'save':
@@ -580,28 +115,45 @@ def playGame():
                     print("Game saved")
                     continue  # Ask for a move again
 
+                # Take back or replay a move, along with the computer's reply
+                if move.lower() in ('undo', 'redo'):
+                    step = undoMove if move.lower() == 'undo' else redoMove
+                    if step(game) is None:
+                        print(f"Nothing to {move.lower()}")
+                        continue
+                    while game[f"Player {game['Who']}"] == 'C' and step(game) is not None:
+                        pass
+                    move = None
+                    break
+
                 # Otherwise make the move
                 try:
-                    game = makeMove(game, move)  # Uses Task 8 function
+                    applyMove(game, move)  # Uses Task 8 function
                     break  # Move successful, exit loop
                 except MoveNotMade as e:
                     print(f"Invalid move: {e}. Input again")  # Handles invalid moves
+            
+            if ponderer is not None:
+                ponderer.stop()
                     
                     
                     
-        # After every move, check for a winner
-        result = isWinner(game)
+        if move is None:
+            continue  # A move was taken back or replayed
+
+        # After every move, check the lines through the new piece for a winner
+        result = isWinnerAfter(game, move)
 
         if result == 1:
-            print(printBoard(game['Board']))
+            print(renderer.render(game['Board']))
             print(f"\n{game['Player 1']} (Player 1) wins")
             break
         elif result == 2:
-            print(printBoard(game['Board']))
+            print(renderer.render(game['Board']))
             print(f"\n{game['Player 2']} (Player 2) wins")
             break
         elif result == -1:
-            print(printBoard(game['Board']))
+            print(renderer.render(game['Board']))
             print("\nIt's a draw. Game over")
             break
 
@@ -727,3 +279,223 @@ type "y" to proceed: ')
     else:
          print('You have chosen not to proceed.')   
 ###############################################################################
+
+
+###############################################################################
+# Command line
+
+def _addGeometryArguments(parser):
+    parser.add_argument('--size', default='4x6x6', help="board size as LAYERSxROWSxCOLS")
+    parser.add_argument('--win', type=int, default=4, help="pieces in a row needed to win")
+
+
+def _geometryFromArguments(parser, args):
+    try:
+        layers, rows, cols = map(int, args.size.lower().split('x'))
+        return getGeometry(layers, rows, cols, args.win)
+    except ValueError as e:
+        parser.error(f"invalid --size or --win: {e}")
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    python "Python Game.py" play
+    python "Python Game.py" tournament random engine:50 --games 20
+    python "Python Game.py" play --size 5x7x7 --win 5
+    """
+    parser = argparse.ArgumentParser(description="3D four in a row.")
+    commands = parser.add_subparsers(dest='command')
+
+    play = commands.add_parser('play', help="play an interactive game")
+    play.add_argument('--computer', default='engine',
+                      help="strategy for players named C, as for tournament")
+    _addGeometryArguments(play)
+
+    tournament = commands.add_parser('tournament', help="play strategies against each other")
+    tournament.add_argument('players', nargs='+',
+                            help="strategies: random, first, engine, engine:MS, depth:N, "
+                                 "eval, eval:MS, net, net:MS, mcts or mcts:MS. "
+                                 "Use NAME=STRATEGY to name them.")
+    tournament.add_argument('--games', type=int, default=10, help="games per pair of players")
+    tournament.add_argument('--workers', type=int, default=None, help="processes to use")
+    tournament.add_argument('--output', help="JSONL file to append game records to")
+    tournament.add_argument('--seed', type=int, default=0)
+    tournament.add_argument('--book', help="opening book for the engine strategies")
+    tournament.add_argument('--net', help="value network for the net strategies")
+    _addGeometryArguments(tournament)
+
+    serve = commands.add_parser('serve', help="host games over TCP")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--workers', type=int, default=None, help="engine processes")
+    serve.add_argument('--time-ms', type=float, default=100, help="engine budget per move")
+
+    load = commands.add_parser('loadtest', help="play many games against a server")
+    load.add_argument('--host', default='127.0.0.1')
+    load.add_argument('--port', type=int, default=8765)
+    load.add_argument('--concurrency', type=int, default=100, help="games at once")
+    load.add_argument('--games', type=int, default=1, help="games per connection")
+    load.add_argument('--opponent', default='C', help="player 2; C for the engine")
+
+    bench = commands.add_parser('bench', help="time the core functions")
+    bench.add_argument('--output', help="JSON file to save the results to")
+    bench.add_argument('--baseline', help="JSON results to compare against")
+    bench.add_argument('--max-slowdown', type=float, default=1.25,
+                       help="fail if a case is this many times slower than the baseline")
+    bench.add_argument('--repeat', type=int, default=5, help="timing runs per case")
+    bench.add_argument('--only', help="only run cases whose name contains this")
+
+    book = commands.add_parser('book', help="build an opening book")
+    book.add_argument('path', help="book file to write")
+    book.add_argument('--plies', type=int, default=2, help="moves from the start to cover")
+    book.add_argument('--depth', type=int, default=4, help="search depth per position")
+    book.add_argument('--workers', type=int, default=None, help="processes to use")
+
+    analyze = commands.add_parser('analyze', help="annotate the moves of finished games")
+    analyze.add_argument('sources', nargs='+', help="tournament records (.jsonl) or game archives")
+    analyze.add_argument('--output', required=True, help="annotation file to write")
+    analyze.add_argument('--depth', type=int, default=4, help="search depth per position")
+    analyze.add_argument('--time-ms', type=float, default=None, help="search time per position")
+    analyze.add_argument('--workers', type=int, default=None, help="processes to use")
+    analyze.add_argument('--blunder', type=int, default=100, help="score lost that makes a blunder")
+    analyze.add_argument('--batch', type=int, default=64, help="games searched at a time")
+    _addGeometryArguments(analyze)
+
+    index = commands.add_parser('index', help="index stored games by position and threats")
+    index.add_argument('path', help="index file, created if missing")
+    index.add_argument('sources', nargs='+', help="tournament records (.jsonl) or game archives")
+    _addGeometryArguments(index)
+
+    search = commands.add_parser('search', help="find indexed games")
+    search.add_argument('path', help="index file")
+    search.add_argument('moves', nargs='*', help="find games reaching the position after these moves")
+    search.add_argument('--symmetric', action='store_true', help="match rotations and reflections too")
+    search.add_argument('--feature', choices=INDEX_FEATURES, help="find games with this threat instead")
+    search.add_argument('--player', type=int, choices=(1, 2), default=1, help="player with the threat")
+    search.add_argument('--layer', type=int, help="layer of the threat, from 1 at the bottom")
+    search.add_argument('--limit', type=int, default=20, help="results to show")
+
+    train = commands.add_parser('train', help="train a value network from self-play")
+    train.add_argument('output', help="network file to write (.npz)")
+    train.add_argument('--rounds', type=int, default=3, help="rounds of self-play and training")
+    train.add_argument('--games', type=int, default=100, help="self-play games per round")
+    train.add_argument('--depth', type=int, default=2, help="search depth of the self-play moves")
+    train.add_argument('--epochs', type=int, default=10, help="training passes per round")
+    train.add_argument('--seed', type=int, default=0)
+    _addGeometryArguments(train)
+
+    perft_command = commands.add_parser('perft', help="count the leaves of the game tree")
+    perft_command.add_argument('moves', nargs='*', help="moves from the empty board")
+    perft_command.add_argument('--depth', type=int, default=3, help="plies to look ahead")
+    perft_command.add_argument('--position', choices=sorted(PERFT_POSITIONS),
+                               help="start from a standard position instead")
+    perft_command.add_argument('--backend', default='bitboard', choices=sorted(PERFT_BACKENDS))
+    perft_command.add_argument('--divide', action='store_true', help="count below each move")
+    perft_command.add_argument('--compare', action='store_true',
+                               help="check the backend against the lists backend node for node")
+    perft_command.add_argument('--check', action='store_true',
+                               help="run the reference counts instead")
+    _addGeometryArguments(perft_command)
+
+    args = parser.parse_args(argv)
+    if args.command == 'play':
+        #The default engine also ponders on the player's time
+        strategy = None if args.computer == 'engine' else parseStrategy(args.computer)
+        playGame(strategy, _geometryFromArguments(parser, args))
+    elif args.command == 'serve':
+        server = GameServer(args.host, args.port, args.workers, args.time_ms)
+        try:
+            asyncio.run(server.serveForever())
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'loadtest':
+        report = asyncio.run(loadTest(args.host, args.port, args.concurrency, args.games, args.opponent))
+        printLoadTest(report, args.concurrency)
+    elif args.command == 'bench':
+        results = runBenchmarks(args.repeat, args.only)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=1)
+        if args.baseline:
+            print()
+            slower = compareBenchmarks(results, args.baseline, args.max_slowdown)
+            if slower:
+                print(f"\n{len(slower)} case(s) more than {args.max_slowdown}x slower than the baseline")
+                sys.exit(1)
+    elif args.command == 'book':
+        buildOpeningBook(args.path, args.plies, args.depth, workers=args.workers)
+    elif args.command == 'analyze':
+        analyzeGames(args.sources, args.output, args.depth, args.time_ms, args.workers, args.blunder,
+                     args.batch, geometry=_geometryFromArguments(parser, args))
+    elif args.command == 'index':
+        index = PositionIndex(args.path, _geometryFromArguments(parser, args))
+        index.update(args.sources, quiet=False)
+        print(f"{len(index)} games in the index")
+    elif args.command == 'search':
+        index = PositionIndex(args.path)
+        started = time.perf_counter()
+        if args.feature:
+            found = index.findFeature(args.feature, args.player, args.layer)
+        else:
+            game = newGame('Player 1', 'Player 2', index.geometry)
+            for move in args.moves:
+                game = makeMove(game, move)
+            found = index.find(game, args.symmetric)
+        elapsed = time.perf_counter() - started
+        print(f"{len(found)} found in {elapsed * 1000:.1f} ms")
+        for game_id, ply in found[:args.limit]:
+            info = index.gameInfo(game_id)
+            print(f"Game {game_id} ({os.path.basename(info['Source'])} #{info['Number']}), "
+                  f"ply {ply} of {info['Plies']}: {' '.join(info['Moves'][:ply])}")
+    elif args.command == 'train':
+        trainFromSelfPlay(args.output, args.rounds, args.games, args.depth, args.epochs,
+                          geometry=_geometryFromArguments(parser, args), seed=args.seed)
+    elif args.command == 'perft':
+        if args.check:
+            if checkPerft(args.backend):
+                sys.exit(1)
+            return
+        if args.position:
+            game = perftPosition(args.position)
+        else:
+            game = newGame('Player 1', 'Player 2', _geometryFromArguments(parser, args))
+        for move in args.moves:
+            game = makeMove(game, move)
+        if args.compare:
+            difference = comparePerft(game, args.depth, args.backend)
+            if difference is None:
+                print(f"{args.backend} agrees with lists to depth {args.depth}")
+                return
+            print(f"{args.backend} differs after {' '.join(difference['Moves']) or 'no moves'}, "
+                  f"depth {difference['Depth']}: expected {difference['Expected']}, "
+                  f"found {difference['Found']}")
+            sys.exit(1)
+        if args.divide:
+            for move, result in perftDivide(game, args.depth, args.backend).items():
+                print(f"{move}: {result['Nodes']:,}")
+        result = perft(game, args.depth, args.backend)
+        print(f"Depth {args.depth}: {result['Nodes']:,} nodes (player 1 wins {result['Player 1 wins']:,}, "
+              f"player 2 wins {result['Player 2 wins']:,}, draws {result['Draws']:,}) "
+              f"in {result['Time']:.3f}s, {result['Nodes/sec']:,.0f} nodes/sec")
+    elif args.command == 'tournament':
+        if args.book:
+            setOpeningBook(args.book)
+        if args.net:
+            setValueNet(args.net)
+        players = {}
+        for spec in args.players:
+            name, _, strategy = spec.rpartition('=')
+            name = name or strategy
+            while name in players:
+                name += "'"
+            players[name] = strategy
+        runTournament(players, args.games, args.workers, args.output, args.seed,
+                      geometry=_geometryFromArguments(parser, args))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""3D four in a row: the game, its engine and tools, used by "Python Game.py"."""
@@ -0,0 +1,974 @@
+"""Benchmarks, instrumentation, perft and analysis of finished games."""
+
+import contextlib
+import functools
+import importlib
+import json
+import os
+import platform
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the batch functions
+    np = None
+
+from .board import (
+    DEFAULT_GEOMETRY, Game, MoveNotMade, _benchmarkPositions, applyMove, canonicalKey,
+    findValidMoves, gameGeometry, gameMoves, getBitBoard, getGeometry, isWinner, isWinnerAfter,
+    loadGame, makeMove, newGame, printBoard, saveGame, undoMove)
+from .storage import ArchiveError, GameArchive, _historyRebuilds
+from .engine import Engine, WIN_SCORE, availableCores, searchMove
+from .server import _percentile
+
+
+###############################################################################
+# Benchmark suite
+#
+# Times the core functions on fixed positions so that runs can be compared.
+# Each case is timed with timeit: enough loops to take about 0.2 seconds,
+# repeated, with the median time per call kept. Results are saved as JSON
+# along with a description of the machine, and can be compared against an
+# earlier run saved as a baseline.
+
+@contextlib.contextmanager
+def _benchmarkCases(seed=0):
+    #Gives (name, function to time, function to run before each repeat) for
+    #each case; the file the cases save is removed afterwards
+    positions = _benchmarkPositions(seed)
+    opening = positions.pop('opening')
+    mid = positions['mid']
+    move = findValidMoves(mid['Board'])[0]
+    engines = {}
+
+    def roundTrip():
+        saveGame(mid, path)
+        return loadGame(path)
+
+    def searcher(nodes):
+        def search():
+            return searchMove(opening, None, max_nodes=nodes, engine=engines[nodes], book=False)
+        return search
+
+    def freshEngine(nodes):
+        def reset():
+            engines[nodes] = Engine()
+        return reset
+
+    cases = [('newGame', lambda: newGame('A', 'B'), None),
+             ('makeMove', lambda: makeMove(mid, move), None)]
+    for name, game in positions.items():
+        cases.append((f'isWinner[{name}]', functools.partial(isWinner, game), None))
+    cases += [('findValidMoves', functools.partial(findValidMoves, mid['Board']), None),
+              ('printBoard', functools.partial(printBoard, mid['Board']), None),
+              ('saveGame+loadGame', roundTrip, None)]
+    for nodes in (1000, 10000):
+        cases.append((f'suggestMove[{nodes} nodes]', searcher(nodes), freshEngine(nodes)))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.csv')
+        yield cases
+
+
+def machineInfo():
+    """Returns a description of this machine and Python for benchmark results."""
+    return {'Platform': platform.platform(), 'Machine': platform.machine(),
+            'Processor': platform.processor(), 'Python': platform.python_version(),
+            'Implementation': platform.python_implementation(),
+            'CPUs': os.cpu_count(), 'Available cores': availableCores(),
+            'NumPy': np.__version__ if np is not None else None}
+
+
+def runBenchmarks(repeat=5, only=None, seed=0, quiet=False):
+    """
+    Times each benchmark case.
+
+    Args:
+        repeat (int): Timing runs per case; the median is reported.
+        only (str): Only run cases whose name contains this text.
+        seed (int): Seed for the positions.
+        quiet (bool): If True, print nothing.
+
+    Returns:
+        dict: 'Machine' (see machineInfo), 'Date', 'Repeat' and 'Results',
+              which maps each case name to a dict of 'Median', 'Min' and
+              'Max' seconds per call and the 'Loops' per timing run.
+    """
+    results = {}
+    with _benchmarkCases(seed) as cases:
+        for name, function, setup in cases:
+            if only and only not in name:
+                continue
+            if setup is not None:
+                #Cases with state (an engine's table) start afresh every loop
+                times = []
+                for _ in range(repeat):
+                    setup()
+                    started = time.perf_counter()
+                    function()
+                    times.append(time.perf_counter() - started)
+                loops = 1
+            else:
+                timer = timeit.Timer(function)
+                loops = timer.autorange()[0]
+                times = [total / loops for total in timer.repeat(repeat, loops)]
+            times.sort()
+            results[name] = {'Median': times[len(times) // 2], 'Min': times[0], 'Max': times[-1],
+                             'Loops': loops}
+            if not quiet:
+                print(f"{name:28} {_formatSeconds(results[name]['Median']):>10}  "
+                      f"(min {_formatSeconds(times[0])}, {loops} loops x {repeat})")
+    return {'Machine': machineInfo(), 'Date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'Repeat': repeat, 'Results': results}
+
+
+def _formatSeconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def compareBenchmarks(results, baseline, max_slowdown=1.25, quiet=False):
+    """
+    Compares benchmark results with a baseline run.
+
+    Args:
+        results (dict): Returned by runBenchmarks.
+        baseline (dict): An earlier result of runBenchmarks, or a JSON file
+                         holding one.
+        max_slowdown (float): Largest ratio of new to baseline median time
+                              that still passes.
+        quiet (bool): If True, print nothing.
+
+    Returns:
+        list: Names of the cases slower than allowed. Cases missing from
+              either run are skipped.
+    """
+    if isinstance(baseline, str):
+        with open(baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+    if not quiet and baseline.get('Machine') != results.get('Machine'):
+        print("Warning: the baseline was recorded on a different machine or Python")
+    slower = []
+    for name, result in results['Results'].items():
+        if name not in baseline['Results']:
+            continue
+        ratio = result['Median'] / baseline['Results'][name]['Median']
+        failed = ratio > max_slowdown
+        if failed:
+            slower.append(name)
+        if not quiet:
+            print(f"{name:28} {_formatSeconds(baseline['Results'][name]['Median']):>10} -> "
+                  f"{_formatSeconds(result['Median']):>10}  {ratio:5.2f}x{'  SLOWER' if failed else ''}")
+    return slower
+
+###############################################################################
+
+
+###############################################################################
+# Instrumentation
+#
+# Off by default and then free: nothing is wrapped. enableInstrumentation
+# replaces the public game functions with timing wrappers, in every loaded
+# module that holds them (and Engine.search with one that also totals the
+# engine's counters), and disableInstrumentation puts the originals back.
+# Calls made through names looked up before it was enabled, such as a
+# functools.partial built earlier, are not seen. Each process records only
+# its own calls, from any of its threads.
+
+INSTRUMENTED = ('newGame', 'printBoard', 'posToIndex', 'indexToPos', 'saveGame', 'loadGame',
+                'findValidMoves', 'makeMove', 'applyMove', 'undoMove', 'redoMove', 'isWinner',
+                'isWinnerAfter', 'suggestMove', 'searchMove', 'parallelSearch', 'mctsMove',
+                'evaluate', 'evaluateBoards', 'solvePosition', 'saveGameBinary', 'loadGameBinary')
+
+_SAMPLES = 4096
+
+#Modules defining the functions in INSTRUMENTED
+_INSTRUMENTED_MODULES = ('.board', '.engine', '.storage', '.strategies')
+
+
+class Instrumentation:
+    """
+    Call statistics gathered while instrumentation is enabled.
+
+    Attributes:
+        calls (dict): Function name to number of calls.
+        totals (dict): Function name to total seconds spent in it,
+                       including any instrumented functions it called.
+        samples (dict): Function name to a sample of call times in seconds
+                        (every call, or a uniform sample of them once there
+                        are more than 4096).
+        engine (dict): Totals over every Engine.search: 'Searches', 'Nodes',
+                       'Cutoffs', 'TT probes', 'TT hits' and 'Time'.
+    """
+
+    def __init__(self):
+        #Other threads, such as the Ponderer's, run instrumented code too
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Forgets everything recorded."""
+        with self._lock:
+            self.calls = {}
+            self.totals = {}
+            self.samples = {}
+            self.engine = {'Searches': 0, 'Nodes': 0, 'Cutoffs': 0, 'TT probes': 0, 'TT hits': 0,
+                           'Time': 0.0}
+            self._random = random.Random(0)
+
+    def record(self, name, seconds):
+        """Records one call of a function."""
+        with self._lock:
+            calls = self.calls.get(name, 0) + 1
+            self.calls[name] = calls
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+            samples = self.samples.setdefault(name, [])
+            if len(samples) < _SAMPLES:
+                samples.append(seconds)
+            else:
+                #Reservoir sampling keeps every call equally likely to be kept
+                slot = self._random.randrange(calls)
+                if slot < _SAMPLES:
+                    samples[slot] = seconds
+
+    def recordSearch(self, seconds, nodes, cutoffs, probes, hits):
+        """Records one Engine.search and adds its counters to engine."""
+        with self._lock:
+            engine = self.engine
+            engine['Searches'] += 1
+            engine['Nodes'] += nodes
+            engine['Cutoffs'] += cutoffs
+            engine['TT probes'] += probes
+            engine['TT hits'] += hits
+            engine['Time'] += seconds
+            self.record('Engine.search', seconds)
+
+    def snapshot(self):
+        """
+        Returns the statistics as a dict mapping each function name to
+        'Calls', 'Total', 'Mean', 'p50', 'p99' and 'Max' (seconds), plus
+        'Engine' for the engine totals with 'Nodes/sec' and 'TT hit rate'.
+        """
+        result = {}
+        with self._lock:
+            for name, calls in sorted(self.calls.items()):
+                ordered = sorted(self.samples[name])
+                result[name] = {'Calls': calls, 'Total': self.totals[name],
+                                'Mean': self.totals[name] / calls,
+                                'p50': _percentile(ordered, 0.50), 'p99': _percentile(ordered, 0.99),
+                                'Max': ordered[-1]}
+            engine = dict(self.engine)
+        engine['Nodes/sec'] = engine['Nodes'] / engine['Time'] if engine['Time'] > 0 else 0.0
+        engine['TT hit rate'] = engine['TT hits'] / engine['TT probes'] if engine['TT probes'] else 0.0
+        result['Engine'] = engine
+        return result
+
+    def prometheus(self):
+        """Returns the statistics in the Prometheus text format."""
+        snapshot = self.snapshot()
+        engine = snapshot.pop('Engine')
+        lines = ['# HELP game_calls_total Calls of each instrumented function.',
+                 '# TYPE game_calls_total counter']
+        lines += [f'game_calls_total{{function="{name}"}} {stats["Calls"]}'
+                  for name, stats in snapshot.items()]
+        lines += ['# HELP game_call_seconds Time spent in each instrumented function.',
+                  '# TYPE game_call_seconds summary']
+        for name, stats in snapshot.items():
+            for key, quantile in (('p50', '0.5'), ('p99', '0.99')):
+                lines.append(f'game_call_seconds{{function="{name}",quantile="{quantile}"}} '
+                             f'{stats[key]:.9g}')
+            lines.append(f'game_call_seconds_sum{{function="{name}"}} {stats["Total"]:.9g}')
+            lines.append(f'game_call_seconds_count{{function="{name}"}} {stats["Calls"]}')
+        for key, metric, kind in (('Searches', 'game_engine_searches_total', 'counter'),
+                                  ('Nodes', 'game_engine_nodes_total', 'counter'),
+                                  ('Cutoffs', 'game_engine_cutoffs_total', 'counter'),
+                                  ('TT probes', 'game_engine_tt_probes_total', 'counter'),
+                                  ('TT hits', 'game_engine_tt_hits_total', 'counter'),
+                                  ('Time', 'game_engine_seconds_total', 'counter'),
+                                  ('Nodes/sec', 'game_engine_nodes_per_second', 'gauge')):
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.append(f'{metric} {engine[key]:.9g}')
+        return '\n'.join(lines) + '\n'
+
+    def writePrometheus(self, path):
+        """
+        Writes the statistics in the Prometheus text format to a file, such
+        as one read by node_exporter's textfile collector. The file is
+        replaced in one step, so a reader never sees half of it.
+        """
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            file.write(self.prometheus())
+        os.replace(path + '.tmp', path)
+
+
+instrumentation = Instrumentation()
+#(namespace, name, original) for each function replaced
+_originals = []
+
+
+def _timed(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            instrumentation.record(name, time.perf_counter() - started)
+    return wrapper
+
+
+def _timedSearch(search):
+    @functools.wraps(search)
+    def wrapper(self, *args, **kwargs):
+        probes, hits = self.table.probes, self.table.hits
+        started = time.perf_counter()
+        try:
+            return search(self, *args, **kwargs)
+        finally:
+            instrumentation.recordSearch(time.perf_counter() - started, self.nodes, self.cutoffs,
+                                         self.table.probes - probes, self.table.hits - hits)
+    return wrapper
+
+
+def instrumentationEnabled():
+    """Returns True while instrumentation is enabled."""
+    return bool(_originals)
+
+
+def enableInstrumentation():
+    """Starts recording calls of the public functions. Has no effect if
+    instrumentation is already enabled."""
+    if _originals:
+        return
+    wrappers = {}
+    for name in INSTRUMENTED:
+        for source in _INSTRUMENTED_MODULES:
+            module = importlib.import_module(source, __package__)
+            if name in vars(module):
+                function = vars(module)[name]
+                wrappers[id(function)] = (name, function, _timed(name, function))
+                break
+    #Every module that imported a function calls it through its own name
+    for module in list(sys.modules.values()):
+        namespace = getattr(module, '__dict__', None)
+        if namespace is None:
+            continue
+        for name, function, wrapper in wrappers.values():
+            if namespace.get(name) is function:
+                _originals.append((module, name, function))
+                setattr(module, name, wrapper)
+    _originals.append((Engine, 'search', Engine.search))
+    Engine.search = _timedSearch(Engine.search)
+
+
+def disableInstrumentation():
+    """Stops recording calls, leaving what was recorded in instrumentation."""
+    for target, name, original in reversed(_originals):
+        setattr(target, name, original)
+    _originals.clear()
+
+
+@contextlib.contextmanager
+def profiling(reset=True):
+    """
+    Records calls for the duration of a with block.
+
+        with profiling() as stats:
+            playHeadlessGame(randomMove, suggestMove)
+        print(stats.snapshot()['makeMove'])
+
+    Args:
+        reset (bool): If True, forget earlier statistics first.
+
+    Yields:
+        Instrumentation: The statistics being recorded.
+    """
+    was_enabled = instrumentationEnabled()
+    if reset:
+        instrumentation.reset()
+    enableInstrumentation()
+    try:
+        yield instrumentation
+    finally:
+        if not was_enabled:
+            disableInstrumentation()
+
+###############################################################################
+
+
+###############################################################################
+# Perft
+#
+# Counts the leaves of the game tree to a fixed depth from a position, the
+# way chess programs check their move generators. A leaf is a position at
+# that depth or a game that ended sooner, and leaves are split by result.
+# Each backend walks the tree its own way; 'lists' plays on nested lists
+# with its own move generation and line scan, sharing no code with the game
+# functions, and is the reference the others are checked against. Another
+# backend is any function walk(game, depth, counts) that adds 1 to
+# counts[isWinner result] for each leaf, so counts[-1] holds the draws.
+
+#Directions of the lines through a cell as (layer, row, collumn) steps, each
+#line counted once, as isWinner scanned them before the bitboard
+_LINE_DIRECTIONS = ((1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, 0, 1), (0, 1, 1),
+                    (1, -1, 0), (1, 0, -1), (0, 1, -1), (1, 1, 1), (1, 1, -1), (1, -1, 1),
+                    (1, -1, -1))
+
+
+def _listsWinner(board, win):
+    #isWinner worked out by scanning every line of a nested list board
+    layers, rows, columns = len(board), len(board[0]), len(board[0][0])
+    full = True
+    for k in range(layers):
+        for j in range(rows):
+            for i in range(columns):
+                player = board[k][j][i]
+                if not player:
+                    full = False
+                    continue
+                for dk, dj, di in _LINE_DIRECTIONS:
+                    end_k, end_j, end_i = k + dk * (win - 1), j + dj * (win - 1), i + di * (win - 1)
+                    if not (0 <= end_k < layers and 0 <= end_j < rows and 0 <= end_i < columns):
+                        continue
+                    if all(board[k + dk * step][j + dj * step][i + di * step] == player
+                           for step in range(1, win)):
+                        return player
+    return -1 if full else 0
+
+
+def _perftLists(game, depth, counts):
+    #A collumn is open while its top cell is empty, and a piece drops to its
+    #lowest empty cell
+    board = [[list(row) for row in layer] for layer in game['Board']]
+    win = gameGeometry(game).win
+
+    def walk(who, depth):
+        result = _listsWinner(board, win)
+        if result or depth == 0:
+            counts[result] += 1
+            return
+        for j, row in enumerate(board[-1]):
+            for i, value in enumerate(row):
+                if value == 0:
+                    k = next(k for k in range(len(board)) if board[k][j][i] == 0)
+                    board[k][j][i] = who
+                    walk(3 - who, depth - 1)
+                    board[k][j][i] = 0
+
+    walk(int(game['Who']), depth)
+
+
+def _perftInPlace(game, depth, counts):
+    #Plays each move on a copy of the game, taking it back afterwards
+    game = Game(game)
+
+    def walk(depth):
+        for move in findValidMoves(game['Board']):
+            applyMove(game, move)
+            result = isWinnerAfter(game, move)
+            if result or depth == 1:
+                counts[result] += 1
+            else:
+                walk(depth - 1)
+            undoMove(game)
+
+    result = isWinner(game)
+    if result or depth == 0:
+        counts[result] += 1
+    else:
+        walk(depth)
+
+
+def _perftBitBoard(game, depth, counts):
+    #Walks a copy of the bitboard, taking moves from its legal mask
+    bitboard = getBitBoard(game).copy()
+    full = bitboard.geometry.full
+
+    def walk(depth):
+        legal = bitboard.legal
+        while legal:
+            low = legal & -legal
+            legal ^= low
+            cell = bitboard.play(low.bit_length() - 1)
+            if bitboard.wonAfter(cell):
+                counts[3 - bitboard.who] += 1
+            elif bitboard.bits[1] | bitboard.bits[2] == full:
+                counts[-1] += 1
+            elif depth == 1:
+                counts[0] += 1
+            else:
+                walk(depth - 1)
+            bitboard.undo()
+
+    result = bitboard.winner()
+    if result or depth == 0:
+        counts[result] += 1
+    else:
+        walk(depth)
+
+
+PERFT_BACKENDS = {'lists': _perftLists, 'inplace': _perftInPlace, 'bitboard': _perftBitBoard}
+
+#Standard positions: the board size and win length, and the moves from
+#the empty board
+PERFT_POSITIONS = {
+    'empty': ((4, 6, 6, 4), ()),
+    'opening': ((4, 6, 6, 4), ('Cc', 'Dd')),
+    'threats': ((4, 6, 6, 4), ('Aa', 'Ff', 'Ba', 'Fe', 'Ca', 'Fd')),
+    'small': ((2, 3, 3, 3), ()),
+    'tictactoe': ((1, 3, 3, 3), ()),
+}
+
+#Reference counts for each (position, depth): leaves, then the leaves won
+#by player 1, won by player 2 and drawn. The tictactoe board played out
+#gives the well known 255168 games.
+PERFT_COUNTS = {
+    ('empty', 1): (36, 0, 0, 0),
+    ('empty', 2): (1296, 0, 0, 0),
+    ('empty', 3): (46656, 0, 0, 0),
+    ('empty', 4): (1679616, 0, 0, 0),
+    ('opening', 1): (36, 0, 0, 0),
+    ('opening', 2): (1296, 0, 0, 0),
+    ('opening', 3): (46656, 0, 0, 0),
+    ('opening', 4): (1679614, 0, 0, 0),
+    ('threats', 1): (36, 1, 0, 0),
+    ('threats', 2): (1261, 1, 34, 0),
+    ('threats', 3): (44171, 1192, 34, 0),
+    ('threats', 4): (1547240, 1192, 40528, 0),
+    ('small', 1): (9, 0, 0, 0),
+    ('small', 2): (81, 0, 0, 0),
+    ('small', 3): (720, 0, 0, 0),
+    ('small', 4): (6264, 0, 0, 0),
+    ('small', 5): (52920, 2640, 0, 0),
+    ('small', 6): (411048, 2640, 15120, 0),
+    ('small', 7): (3067248, 340320, 15120, 0),
+    ('tictactoe', 5): (15120, 1440, 0, 0),
+    ('tictactoe', 9): (255168, 131184, 77904, 46080),
+}
+
+
+def _perftBackend(backend):
+    if callable(backend):
+        return backend
+    if backend not in PERFT_BACKENDS:
+        raise ValueError(f"Unknown perft backend {backend!r}; expected one of {sorted(PERFT_BACKENDS)}")
+    return PERFT_BACKENDS[backend]
+
+
+def perftPosition(name):
+    """
+    Returns one of the standard positions of PERFT_POSITIONS as a game.
+
+    Raises:
+        KeyError: If there is no such position.
+    """
+    dimensions, moves = PERFT_POSITIONS[name]
+    game = newGame('Player 1', 'Player 2', getGeometry(*dimensions))
+    for move in moves:
+        game = makeMove(game, move)
+    return game
+
+
+def perft(game, depth, backend='bitboard'):
+    """
+    Counts the leaves of the game tree below a position.
+
+    Args:
+        game (dict): The position to start from.
+        depth (int): Number of plies to look ahead.
+        backend (str or function): A name from PERFT_BACKENDS, or a walk
+                                   function as described above.
+
+    Returns:
+        dict: 'Nodes' (leaves), 'Player 1 wins', 'Player 2 wins', 'Draws'
+              and 'Unfinished' (leaves at the full depth with the game
+              still going), 'Time' (seconds) and 'Nodes/sec'.
+
+    Raises:
+        ValueError: If depth is negative or the backend is unknown.
+    """
+    if depth < 0:
+        raise ValueError(f"Perft depth must not be negative: {depth}")
+    walk = _perftBackend(backend)
+    counts = [0, 0, 0, 0]
+    started = time.perf_counter()
+    walk(game, depth, counts)
+    elapsed = time.perf_counter() - started
+    nodes = sum(counts)
+    return {'Nodes': nodes, 'Player 1 wins': counts[1], 'Player 2 wins': counts[2],
+            'Draws': counts[-1], 'Unfinished': counts[0], 'Time': elapsed,
+            'Nodes/sec': nodes / elapsed if elapsed > 0 else 0.0}
+
+
+def _perftKey(result):
+    return (result['Nodes'], result['Player 1 wins'], result['Player 2 wins'], result['Draws'])
+
+
+def perftDivide(game, depth, backend='bitboard'):
+    """
+    Runs perft below each move from a position.
+
+    Returns:
+        dict: The perft result after each valid move, by move, for a depth
+              one less. Empty if the game is already over or depth is 0.
+    """
+    if depth < 1 or isWinner(game):
+        return {}
+    return {move: perft(makeMove(game, move), depth - 1, backend)
+            for move in findValidMoves(game['Board'])}
+
+
+def comparePerft(game, depth, backend, reference='lists'):
+    """
+    Checks a backend against the reference node for node. Where the counts
+    differ, the moves are divided to find the first position whose own
+    leaves (or whose list of moves) the two disagree on.
+
+    Args:
+        game (dict): The position to start from.
+        depth (int): Number of plies to look ahead.
+        backend (str or function): The backend to check.
+        reference (str or function): The backend taken to be right.
+
+    Returns:
+        dict: None if the backends agree, otherwise 'Moves' (from game to
+              the position they disagree on), 'Depth' (left from there),
+              'Expected' and 'Found' ((leaves, player 1 wins, player 2
+              wins, draws) from each).
+    """
+    expected = _perftKey(perft(game, depth, reference))
+    found = _perftKey(perft(game, depth, backend))
+    if expected == found:
+        return None
+    path = []
+    while True:
+        #Look for a move below which they disagree; if there is none the
+        #difference is in this position itself
+        for move, result in perftDivide(game, depth, reference).items():
+            child = makeMove(game, move)
+            child_found = _perftKey(perft(child, depth - 1, backend))
+            if child_found != _perftKey(result):
+                game, depth = child, depth - 1
+                expected, found = _perftKey(result), child_found
+                path.append(move)
+                break
+        else:
+            return {'Moves': path, 'Depth': depth, 'Expected': expected, 'Found': found}
+
+
+def checkPerft(backend='bitboard', max_nodes=500000, quiet=False):
+    """
+    Runs the reference counts of PERFT_COUNTS with a backend.
+
+    Args:
+        backend (str or function): The backend to check.
+        max_nodes (int): Skip entries with more leaves than this, or None
+                         to run them all.
+        quiet (bool): If True, nothing is printed.
+
+    Returns:
+        list: (position, depth, expected, found) for each entry whose
+              counts were wrong; empty if all were right.
+    """
+    wrong = []
+    for (name, depth), expected in PERFT_COUNTS.items():
+        if max_nodes is not None and expected[0] > max_nodes:
+            continue
+        result = perft(perftPosition(name), depth, backend)
+        found = _perftKey(result)
+        if found != expected:
+            wrong.append((name, depth, expected, found))
+        if not quiet:
+            print(f"{name:<9} depth {depth}: {result['Nodes']:>10,} nodes "
+                  f"{result['Nodes/sec']:>12,.0f} nodes/sec  {'ok' if found == expected else 'WRONG'}")
+    return wrong
+
+
+def benchmarkPerft(depth=3, position='opening'):
+    """
+    Times every backend on a standard position and prints nodes per second.
+
+    Returns:
+        dict: The perft result of each backend, by name.
+    """
+    game = perftPosition(position)
+    results = {}
+    for name in PERFT_BACKENDS:
+        results[name] = perft(game, depth, name)
+    base = results['lists']['Nodes/sec']
+    for name, result in results.items():
+        print(f"{name:<9}: {result['Nodes']:,} nodes in {result['Time']:.3f}s, "
+              f"{result['Nodes/sec']:>12,.0f} nodes/sec ({result['Nodes/sec'] / base:.1f}x)")
+    return results
+
+###############################################################################
+
+###############################################################################
+# Game analysis
+#
+# Replays finished games and searches every position in them to a fixed
+# budget, marking the moves that threw away much of the score. Games are
+# read a batch at a time, from tournament records or archives, and the
+# positions of a batch are searched on a pool of processes. Results are
+# kept in a cache by canonical key, so an opening (or any reflection of
+# it) that many games share is searched once.
+#
+# Annotations are written to a columnar file:
+#
+#   header: magic b'G3DN', format version, layers, rows, cols, win (bytes)
+#   then for each batch of games, a row group: the number of rows (uint32)
+#           followed by every value of each column in turn, in the order of
+#           ANNOTATION_COLUMNS
+#
+# so a reader wanting one column skips over the others.
+
+ANNOTATION_MAGIC = b'G3DN'
+ANNOTATION_VERSION = 1
+_ANNOTATION_HEADER = struct.Struct('<4sBBBBB')
+
+#Each column and its struct format. Moves are collumn numbers. Evals are
+#for the player who moved: 'Eval' is the score of the position before the
+#move, 'Played eval' after it, and 'Delta' the difference.
+ANNOTATION_COLUMNS = (('Game', 'I'), ('Ply', 'H'), ('Player', 'B'), ('Move', 'H'), ('Best', 'H'),
+                      ('Eval', 'i'), ('Played eval', 'i'), ('Delta', 'i'), ('Blunder', 'B'))
+
+
+def _annotationGroup(rows):
+    #One row group; rows are tuples in the order of ANNOTATION_COLUMNS
+    parts = [struct.pack('<I', len(rows))]
+    for index, (name, code) in enumerate(ANNOTATION_COLUMNS):
+        parts.append(struct.pack(f'<{len(rows)}{code}', *[row[index] for row in rows]))
+    return b''.join(parts)
+
+
+def readAnnotations(path, columns=None):
+    """
+    Reads a file written by analyzeGames.
+
+    Args:
+        path (str): The annotation file.
+        columns (list): Names of the columns to read, or None for all.
+
+    Returns:
+        tuple: (geometry, dict of column name to list of values).
+
+    Raises:
+        ArchiveError: If the file is not an annotation file.
+    """
+    names = [name for name, code in ANNOTATION_COLUMNS]
+    wanted = names if columns is None else list(columns)
+    for name in wanted:
+        if name not in names:
+            raise ValueError(f"Unknown annotation column {name!r}")
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < _ANNOTATION_HEADER.size:
+        raise ArchiveError(f"{path} is not an annotation file")
+    magic, version, layers, rows, cols, win = _ANNOTATION_HEADER.unpack_from(data)
+    if magic != ANNOTATION_MAGIC:
+        raise ArchiveError(f"{path} is not an annotation file")
+    if version != ANNOTATION_VERSION:
+        raise ArchiveError(f"{path} has unsupported version {version}")
+
+    values = {name: [] for name in wanted}
+    offset = _ANNOTATION_HEADER.size
+    while offset < len(data):
+        (count,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        for name, code in ANNOTATION_COLUMNS:
+            size = struct.calcsize(f'<{count}{code}')
+            if offset + size > len(data):
+                raise ArchiveError(f"Row group at byte {offset} is cut short")
+            if name in values:
+                values[name] += struct.unpack_from(f'<{count}{code}', data, offset)
+            offset += size
+    return getGeometry(layers, rows, cols, win), values
+
+
+def _analysisRecords(sources, geometry):
+    #Yields the moves of each game: tournament records (JSONL) are read
+    #line by line and archives game by game. Games without a history,
+    #such as those imported from CSV files, yield None.
+    for source in sources:
+        if isinstance(source, dict):
+            yield gameMoves(source) if _historyRebuilds(getBitBoard(source)) else None
+        elif str(source).endswith('.jsonl'):
+            with open(source, encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        yield json.loads(line).get('Moves')
+        else:
+            archive = GameArchive(source)
+            if archive.geometry is not geometry:
+                raise ArchiveError(f"{source} holds games of another board size")
+            for game in archive:
+                bitboard = getBitBoard(game)
+                yield gameMoves(game) if _historyRebuilds(bitboard) else None
+
+
+def _replayPositions(moves, geometry):
+    #The position before each move and after the last, stopping at an
+    #invalid move or the end of the game
+    game = newGame('Player 1', 'Player 2', geometry)
+    positions = [getBitBoard(game).copy()]
+    for move in moves:
+        try:
+            applyMove(game, move)
+        except MoveNotMade:
+            break
+        positions.append(getBitBoard(game).copy())
+        if isWinnerAfter(game, move) != 0:
+            break
+    return positions
+
+
+_analysisEngine = None
+
+
+def _analysisWorker(positions, max_depth, time_ms):
+    #(score, best collumn) for each position, for the player to move. Each
+    #search starts from an empty table, so its result does not depend on
+    #which positions this process happened to search before.
+    global _analysisEngine
+    if _analysisEngine is None:
+        _analysisEngine = Engine(1 << 16)
+    results = []
+    for bitboard in positions:
+        _analysisEngine.table.clear()
+        result = _analysisEngine.search(bitboard, time_ms, max_depth)
+        results.append((result['Score'], result['Move']))
+    return results
+
+
+def analyzeGames(sources, output, max_depth=4, time_ms=None, workers=None, blunder=100,
+                 batch=64, cache=None, geometry=DEFAULT_GEOMETRY, quiet=False):
+    """
+    Searches every position of many games and writes annotations of each
+    move: the engine's best move, how much the move played lost against
+    it, and whether that makes it a blunder.
+
+    Args:
+        sources (list): Tournament record files ('.jsonl', with 'Moves'),
+                        game archives, or games made with makeMove.
+        output (str): Annotation file to write (see readAnnotations).
+        max_depth (int): Depth to search each position to, or None.
+        time_ms (float): Time budget per position, or None. A depth alone
+                         gives the same annotations on every run.
+        workers (int): Number of processes, None for one per available core.
+                       With 1, positions are searched in this process.
+        blunder (int): Score lost by a move other than the best one that
+                       makes it a blunder.
+        batch (int): Games read and searched at a time.
+        cache (dict): Results from an earlier call with the same budget, to
+                      add to and reuse, or None to start afresh.
+        geometry (Geometry): Board size and win length of the games.
+        quiet (bool): If True, nothing is printed.
+
+    Returns:
+        dict: 'Games', 'Skipped' (games without a history), 'Moves',
+              'Searched' (positions searched), 'Cached' (positions found
+              in the cache), 'Blunders', 'Time' (seconds) and 'Moves/sec'.
+
+    Raises:
+        ValueError: If neither max_depth nor time_ms is given.
+    """
+    if max_depth is None and time_ms is None:
+        raise ValueError("A depth or a time budget is needed")
+    workers = workers or availableCores()
+    cache = {} if cache is None else cache
+    summary = {'Games': 0, 'Skipped': 0, 'Moves': 0, 'Searched': 0, 'Cached': 0, 'Blunders': 0}
+    started = time.perf_counter()
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    records = _analysisRecords(sources, geometry)
+    try:
+        with open(output, 'wb') as out:
+            out.write(_ANNOTATION_HEADER.pack(ANNOTATION_MAGIC, ANNOTATION_VERSION, geometry.layers,
+                                              geometry.rows, geometry.cols, geometry.win))
+            while True:
+                games = []
+                for moves in records:
+                    if moves is None:
+                        summary['Skipped'] += 1
+                        continue
+                    games.append((summary['Games'], _replayPositions(moves, geometry)))
+                    summary['Games'] += 1
+                    if len(games) == batch:
+                        break
+                if not games:
+                    break
+
+                #Each position not yet in the cache is searched once
+                keys = {}
+                pending = {}
+                for number, positions in games:
+                    for bitboard in positions:
+                        if bitboard.winner() != 0:
+                            continue
+                        keys[id(bitboard)] = key, symmetry = canonicalKey(bitboard)
+                        if key in cache:
+                            summary['Cached'] += 1
+                        elif key not in pending:
+                            pending[key] = (bitboard, symmetry)
+                        else:
+                            summary['Cached'] += 1
+                pending = list(pending.items())
+                if pool is None:
+                    results = _analysisWorker([bitboard for _, (bitboard, _) in pending], max_depth, time_ms)
+                else:
+                    size = -(-len(pending) // (workers * 4)) or 1
+                    chunks = [[bitboard for _, (bitboard, _) in pending[start:start + size]]
+                              for start in range(0, len(pending), size)]
+                    results = []
+                    for chunk in pool.map(_analysisWorker, chunks, [max_depth] * len(chunks),
+                                          [time_ms] * len(chunks)):
+                        results += chunk
+                for (key, (bitboard, symmetry)), (score, column) in zip(pending, results):
+                    #Best moves are kept in the canonical frame
+                    cache[key] = (score, geometry.symmetries[symmetry][column])
+                summary['Searched'] += len(pending)
+
+                rows = []
+                for number, positions in games:
+                    for ply in range(len(positions) - 1):
+                        before, after = positions[ply], positions[ply + 1]
+                        key, symmetry = keys[id(before)]
+                        score, best = cache[key]
+                        best = geometry.inverseSymmetries[symmetry][best]
+                        played = after.history[-1] % geometry.columns
+                        result = after.winner()
+                        if result == 0:
+                            played_score = -cache[keys[id(after)][0]][0]
+                        else:
+                            played_score = WIN_SCORE - 1 if result == before.who else 0
+                        delta = score - played_score
+                        flagged = played != best and delta >= blunder
+                        rows.append((number, ply + 1, before.who, played, best, score, played_score,
+                                     delta, int(flagged)))
+                        summary['Blunders'] += flagged
+                summary['Moves'] += len(rows)
+                out.write(_annotationGroup(rows))
+                if not quiet:
+                    print(f"{summary['Games']} games, {summary['Moves']} moves, "
+                          f"{summary['Searched']} positions searched, {summary['Cached']} cached")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    summary['Time'] = elapsed
+    summary['Moves/sec'] = summary['Moves'] / elapsed if elapsed > 0 else 0.0
+    if not quiet:
+        print(f"\n{summary['Blunders']} blunders in {summary['Moves']} moves; "
+              f"{summary['Skipped']} games had no moves to replay. "
+              f"{summary['Time']:.2f}s, {summary['Moves/sec']:.1f} moves/sec")
+    return summary
+
+###############################################################################
@@ -0,0 +1,1708 @@
+"""Board geometry, game state and the basic game functions."""
+
+import csv
+import random
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+
+###############################################################################
+# Bitboard game state
+#
+# The board is held as one integer per player. Columns are numbered
+# j*6 + i (row j, collumn i) and cells k*36 + j*6 + i (layer k), so the bit for
+# a cell is set when that player has a piece there. The nested 'Board' list in
+# a game dictionary is a view of these integers.
+#
+# Those numbers are for the usual 4 layer, 6x6 board with four in a row to
+# win. Other sizes and win lengths each have a Geometry, built once and
+# shared, holding every table that depends on them.
+
+class Geometry:
+    """
+    Board dimensions and the tables derived from them.
+
+    Attributes:
+        layers (int): Number of layers (the height of each collumn).
+        rows (int): Number of rows in a layer.
+        cols (int): Number of collumns in a layer.
+        win (int): Number of pieces in a row needed to win.
+        columns (int): Number of drop collumns (rows * cols).
+        lines (list): Bitmask of every possible winning line.
+        cellLines (list): For each cell, the winning lines passing through it.
+        cellWeights (list): Number of winning lines through each cell.
+        centreOrder (list): Collumn numbers, nearest the centre first.
+        zobrist (list): zobrist[player][cell] hash keys.
+        sideKey (int): Hash key included when player 2 is to move.
+        symmetries (list): Collumn permutations for each rotation and
+                           reflection of the footprint, identity first.
+        inverseSymmetries (list): The inverse of each permutation.
+        moveColumns (dict): Collumn number of each move string ('Aa' or 'aA').
+        moveNames (tuple): The 'Xx' move string of each collumn number.
+        cells (int): Number of cells on the board.
+        full (int): Bitmask with every cell set.
+        directions (list): (dk, dj, di) steps a winning line can take.
+        shifts (list): For each direction, a (start mask, bit shifts) pair.
+                       A cell in the start mask has room for a whole line in
+                       that direction, and the shifts move each later cell of
+                       the line onto its first cell.
+    """
+
+    def __init__(self, layers=4, rows=6, cols=6, win=4):
+        self.layers = layers
+        self.rows = rows
+        self.cols = cols
+        self.win = win
+        self.columns = rows * cols
+        self.cells = layers * self.columns
+        self.full = (1 << self.cells) - 1
+
+        #Every direction whose first non-zero step is positive, so each line
+        #is only found once (13 directions in 3D)
+        self.directions = [(dk, dj, di)
+                           for dk in (0, 1) for dj in (-1, 0, 1) for di in (-1, 0, 1)
+                           if (dk, dj, di) > (0, 0, 0)]
+
+        self.shifts = []
+        for dk, dj, di in self.directions:
+            step = dk * self.columns + dj * cols + di
+            start = 0
+            for k in range(layers):
+                for j in range(rows):
+                    for i in range(cols):
+                        end_k = k + dk * (win - 1)
+                        end_j = j + dj * (win - 1)
+                        end_i = i + di * (win - 1)
+                        if 0 <= end_k < layers and 0 <= end_j < rows and 0 <= end_i < cols:
+                            start |= 1 << self.cell(k, j, i)
+            self.shifts.append((start, tuple(step * n for n in range(1, win))))
+
+        #Every winning line as a bitmask, and the lines through each cell,
+        #both as bitmasks and as positions in self.lines
+        self.lines = []
+        lines_through = [[] for _ in range(self.cells)]
+        ids_through = [[] for _ in range(self.cells)]
+        for start, shifts in self.shifts:
+            while start:
+                first = (start & -start).bit_length() - 1
+                start &= start - 1
+                line_cells = [first] + [first + shift for shift in shifts]
+                line = 0
+                for cell in line_cells:
+                    line |= 1 << cell
+                for cell in line_cells:
+                    lines_through[cell].append(line)
+                    ids_through[cell].append(len(self.lines))
+                self.lines.append(line)
+        self.cellLines = [tuple(lines) for lines in lines_through]
+        self.cellLineIds = [tuple(ids) for ids in ids_through]
+
+        #Every cell of each collumn
+        self.columnCells = [sum(1 << (k * self.columns + c) for k in range(layers))
+                            for c in range(self.columns)]
+
+        #Number of lines through each cell, a simple measure of its value
+        self.cellWeights = [len(lines) for lines in self.cellLines]
+
+        #Collumns ordered from the centre of the footprint outwards
+        centre_j = (rows - 1) / 2
+        centre_i = (cols - 1) / 2
+        self.centreOrder = sorted(range(self.columns),
+                                  key=lambda c: (c // cols - centre_j) ** 2 + (c % cols - centre_i) ** 2)
+
+        #Zobrist keys: one random 64 bit number per (player, cell), plus one
+        #for player 2 to move. Seeded so keys are the same in every process.
+        rng = random.Random(0x5EED0000 + self.cells * 100 + win)
+        self.zobrist = [None,
+                        [rng.getrandbits(64) for _ in range(self.cells)],
+                        [rng.getrandbits(64) for _ in range(self.cells)]]
+        self.sideKey = rng.getrandbits(64)
+
+        #Rotations and reflections of the footprint, as collumn permutations.
+        #symmetries[s][c] is where collumn c goes under symmetry s; the
+        #identity is first. A square footprint has 8, otherwise 4.
+        def column_map(transform):
+            images = [transform(c // cols, c % cols) for c in range(self.columns)]
+            return tuple(j * cols + i for j, i in images)
+        transforms = [lambda j, i: (j, i),
+                      lambda j, i: (rows - 1 - j, i),
+                      lambda j, i: (j, cols - 1 - i),
+                      lambda j, i: (rows - 1 - j, cols - 1 - i)]
+        if rows == cols:
+            transforms += [lambda j, i: (i, j),
+                           lambda j, i: (i, cols - 1 - j),
+                           lambda j, i: (rows - 1 - i, j),
+                           lambda j, i: (rows - 1 - i, cols - 1 - j)]
+        self.symmetries = [column_map(transform) for transform in transforms]
+        self.inverseSymmetries = [tuple(sorted(range(self.columns), key=perm.__getitem__))
+                                  for perm in self.symmetries]
+
+        #Collumn numbers of the move strings, accepted as 'Xx' or 'xX', and
+        #the 'Xx' string of each collumn. All are interned, so moves read
+        #from input are looked up by identity once interned themselves.
+        self.moveColumns = {}
+        self.moveNames = []
+        for j in range(rows):
+            for i in range(cols):
+                upper = chr(ord('A') + i)
+                lower = chr(ord('a') + j)
+                self.moveColumns[sys.intern(upper + lower)] = j * cols + i
+                self.moveColumns[sys.intern(lower + upper)] = j * cols + i
+                self.moveNames.append(sys.intern(upper + lower))
+        self.moveNames = tuple(self.moveNames)
+
+        #chunkMoves[c][mask] lists the moves of the c-th run of chunkBits
+        #collumn numbers whose collumns are set in mask, the slice of a
+        #legal move mask for that run. Runs are at most 8 collumns, so the
+        #tables stay small however wide the board.
+        self.chunkBits = min(self.columns, 8)
+        self.chunkMask = (1 << self.chunkBits) - 1
+        self.chunkMoves = tuple(
+            tuple(tuple(self.moveNames[first + b] for b in range(self.chunkBits)
+                        if mask >> b & 1 and first + b < self.columns)
+                  for mask in range(1 << self.chunkBits))
+            for first in range(0, self.columns, self.chunkBits))
+
+    def cell(self, k, j, i):
+        """Returns the bit index of layer k, row j, collumn i."""
+        return k * self.columns + j * self.cols + i
+
+    def unpack(self, cell):
+        """Returns the [k, j, i] board indices of a bit index."""
+        k, column = divmod(cell, self.columns)
+        j, i = divmod(column, self.cols)
+        return [k, j, i]
+
+    def lineStarts(self, bits):
+        """
+        Finds every cell that starts a complete line of the given pieces.
+
+        Args:
+            bits (int): Bitmask of one player's pieces.
+
+        Returns:
+            int: Bitmask of the first cell of each complete line.
+        """
+        found = 0
+        for start, shifts in self.shifts:
+            run = bits & start
+            for shift in shifts:
+                run &= bits >> shift
+            found |= run
+        return found
+
+    def threats(self, bits):
+        """
+        Finds the cells that would complete a line for a player.
+
+        Args:
+            bits (int): Bitmask of one player's pieces.
+
+        Returns:
+            int: Bitmask of cells (empty or not) that finish a line whose other
+                 cells are all in bits.
+        """
+        found = 0
+        for start, shifts in self.shifts:
+            parts = [bits]
+            for shift in shifts:
+                parts.append(bits >> shift)
+            #owned[p] is the line with every cell but the p-th filled
+            prefix = [start]
+            for part in parts[:-1]:
+                prefix.append(prefix[-1] & part)
+            suffix = -1
+            for p in range(self.win - 1, -1, -1):
+                owned = prefix[p] & suffix
+                if owned:
+                    found |= owned << (shifts[p - 1] if p else 0)
+                suffix &= parts[p]
+        return found & self.full
+
+
+    def __reduce__(self):
+        #Other processes use their own cached copy of the tables
+        return (getGeometry, (self.layers, self.rows, self.cols, self.win))
+
+
+_geometries = {}
+
+
+def getGeometry(layers=4, rows=6, cols=6, win=4):
+    """
+    Returns the shared Geometry for a board size and win length, building
+    its tables the first time it is asked for.
+
+    Raises:
+        ValueError: If a dimension or the win length is not a positive
+                    integer, or rows or cols is more than 26 (the letters
+                    of a move).
+    """
+    key = (layers, rows, cols, win)
+    geometry = _geometries.get(key)
+    if geometry is None:
+        if not all(isinstance(n, int) and not isinstance(n, bool) and n > 0 for n in key):
+            raise ValueError(f"Invalid board geometry: {key}")
+        if rows > 26 or cols > 26:
+            raise ValueError(f"Rows and collumns are limited to 26: {key}")
+        geometry = _geometries[key] = Geometry(layers, rows, cols, win)
+    return geometry
+
+
+DEFAULT_GEOMETRY = getGeometry()
+
+
+class BitBoard:
+    """
+    Compact game state: a bitmask per player and the drop height of each
+    collumn. Moves are made and taken back in constant time with play() and
+    undo().
+
+    Attributes:
+        geometry (Geometry): Board dimensions and tables.
+        bits (list): bits[1] and bits[2] are the pieces of players 1 and 2.
+        heights (bytearray): Lowest empty layer of each collumn
+                             (geometry.layers when the collumn is full).
+        legal (int): Bitmask of the collumns that are not full.
+        who (int): The player to move, 1 or 2.
+        history (list): Cells played with play(), most recent last.
+        key (int): Zobrist hash of the position, kept up to date by play()
+                   and undo().
+    """
+
+    __slots__ = ('geometry', 'bits', 'heights', 'legal', 'who', 'history', 'key')
+
+    def __init__(self, geometry=DEFAULT_GEOMETRY, who=1):
+        self.geometry = geometry
+        self.bits = [0, 0, 0]
+        self.heights = bytearray(geometry.columns)
+        self.legal = (1 << geometry.columns) - 1
+        self.who = who
+        self.history = []
+        self.key = geometry.sideKey if who == 2 else 0
+
+    @classmethod
+    def fromBoard(cls, board, who=1, geometry=DEFAULT_GEOMETRY):
+        """
+        Builds a BitBoard from a nested board list.
+
+        Args:
+            board (list): A 3D list representing the board state.
+            who (int or str): The player to move.
+            geometry (Geometry): Dimensions of the board.
+
+        Returns:
+            BitBoard: The equivalent bitboard.
+        """
+        bitboard = cls(geometry, 2 if str(who) == '2' else 1)
+        bits = bitboard.bits
+        for k, layer in enumerate(board):
+            for j, row in enumerate(layer):
+                for i, value in enumerate(row):
+                    if value == 1 or value == 2:
+                        cell = geometry.cell(k, j, i)
+                        bits[value] |= 1 << cell
+                        bitboard.key ^= geometry.zobrist[value][cell]
+        bitboard._resetHeights()
+        return bitboard
+
+    def copy(self):
+        """Returns an independent copy of the bitboard."""
+        other = BitBoard.__new__(BitBoard)
+        other.geometry = self.geometry
+        other.bits = self.bits[:]
+        other.heights = self.heights[:]
+        other.legal = self.legal
+        other.who = self.who
+        other.history = self.history[:]
+        other.key = self.key
+        return other
+
+    def _lowestEmpty(self, column, level):
+        #Normally the first layer tried is empty; pieces left floating by
+        #editing the board directly are stepped over
+        occupied = self.bits[1] | self.bits[2]
+        geometry = self.geometry
+        while level < geometry.layers and occupied >> (level * geometry.columns + column) & 1:
+            level += 1
+        return level
+
+    def _resetHeights(self):
+        #Works out the heights and legal moves from the pieces alone
+        self.legal = 0
+        for column in range(self.geometry.columns):
+            self.heights[column] = self._lowestEmpty(column, 0)
+            if self.heights[column] < self.geometry.layers:
+                self.legal |= 1 << column
+
+    def occupied(self):
+        """Returns the bitmask of all filled cells."""
+        return self.bits[1] | self.bits[2]
+
+    def canPlay(self, column):
+        """Returns True if the collumn has room for another piece."""
+        return self.heights[column] < self.geometry.layers
+
+    def play(self, column):
+        """
+        Drops a piece for the player to move and passes the turn.
+
+        Args:
+            column (int): Collumn number j*cols + i. Must not be full.
+
+        Returns:
+            int: The cell the piece landed in.
+        """
+        level = self.heights[column]
+        cell = level * self.geometry.columns + column
+        self.bits[self.who] |= 1 << cell
+        self.key ^= self.geometry.zobrist[self.who][cell] ^ self.geometry.sideKey
+        self.heights[column] = self._lowestEmpty(column, level + 1)
+        if self.heights[column] == self.geometry.layers:
+            self.legal &= ~(1 << column)
+        self.history.append(cell)
+        self.who = 3 - self.who
+        return cell
+
+    def undo(self):
+        """
+        Takes back the last piece played and returns the turn to its player.
+
+        Returns:
+            int: The cell that was emptied.
+        """
+        cell = self.history.pop()
+        self.who = 3 - self.who
+        self.bits[self.who] &= ~(1 << cell)
+        self.key ^= self.geometry.zobrist[self.who][cell] ^ self.geometry.sideKey
+        level, column = divmod(cell, self.geometry.columns)
+        self.heights[column] = level
+        self.legal |= 1 << column
+        return cell
+
+    def lastCell(self, column):
+        """
+        Returns the cell most recently filled in a collumn, or None if the
+        collumn is empty.
+        """
+        if self.history and self.history[-1] % self.geometry.columns == column:
+            return self.history[-1]
+        occupied = self.occupied()
+        level = self.heights[column] - 1
+        while level >= 0 and not occupied >> (level * self.geometry.columns + column) & 1:
+            level -= 1
+        return level * self.geometry.columns + column if level >= 0 else None
+
+    def wonAfter(self, cell):
+        """
+        Checks only the winning lines through one filled cell.
+
+        Args:
+            cell (int): A filled cell, normally the one just played.
+
+        Returns:
+            bool: True if the piece in the cell completes a line.
+        """
+        bits = self.bits[1] if self.bits[1] >> cell & 1 else self.bits[2]
+        for line in self.geometry.cellLines[cell]:
+            if bits & line == line:
+                return True
+        return False
+
+    def winner(self):
+        """
+        Returns the result of the position with the same meaning as isWinner:
+        1 or 2 for the winning player, -1 for a full board, otherwise 0.
+        """
+        starts1 = self.geometry.lineStarts(self.bits[1])
+        starts2 = self.geometry.lineStarts(self.bits[2])
+        if starts1 or starts2:
+            #Report the line starting on the lowest cell, as a scan of the
+            #board layer by layer would
+            if not starts2 or (starts1 and (starts1 & -starts1) < (starts2 & -starts2)):
+                return 1
+            return 2
+        if self.occupied() == self.geometry.full:
+            return -1
+        return 0
+
+
+class _BoardList(list):
+    """
+    One level (board, layer or row) of the nested board list of a Game.
+    Any change to it marks the game's bitboard as stale.
+    """
+
+    __slots__ = ('game',)
+
+    def __reduce__(self):
+        #Copies and pickles are plain lists
+        return (list, (list(self),))
+
+    def __setitem__(self, index, value):
+        list.__setitem__(self, index, value)
+        game = self.game
+        if game is not None:
+            game.bitboard = None
+            if not isinstance(value, int):
+                game.tracked = False
+
+
+def _staleAfter(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args):
+        result = method(self, *args)
+        game = self.game
+        if game is not None:
+            game.bitboard = None
+            game.tracked = False
+        return result
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in ('__delitem__', '__iadd__', '__imul__', 'append', 'extend', 'insert',
+              'pop', 'remove', 'clear', 'reverse', 'sort'):
+    setattr(_BoardList, _name, _staleAfter(_name))
+
+
+class Game(dict):
+    """
+    Game state dictionary backed by a BitBoard.
+
+    A Game has the same keys as the dictionary returned by newGame, and its
+    'Board' is an ordinary-looking nested list kept in step with the bitboard.
+    Writing to 'Who' or to the board marks the bitboard as stale so that it is
+    rebuilt from 'Board' the next time it is needed. Constructing a Game from
+    another dictionary copies its board.
+
+    Moves taken back with undoMove are kept in redo, most recent last, until
+    redoMove replays them or applyMove makes a different move.
+
+    The geometry is that of the board and win length the game was created
+    with, or None to go by the size of 'Board' (see gameGeometry).
+    """
+
+    __slots__ = ('bitboard', 'tracked', 'redo', 'geometry')
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.bitboard = None
+        self.tracked = False
+        self.redo = []
+        self.geometry = getattr(args[0], 'geometry', None) if args else None
+        if 'Board' in self:
+            dict.__setitem__(self, 'Board', _boardView(self, self['Board']))
+            self.tracked = True
+
+    def __reduce__(self):
+        return (Game, (dict(self),), self.geometry)
+
+    def __setstate__(self, geometry):
+        self.geometry = geometry
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        if key == 'Board':
+            self.tracked = isinstance(value, _BoardList) and value.game is self
+            self.bitboard = None
+        elif key == 'Who':
+            self.bitboard = None
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.bitboard = None
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+def _boardView(game, board):
+    #Copy a nested board list into _BoardLists owned by game
+    layers = _BoardList()
+    for layer in board:
+        rows = _BoardList()
+        for row in layer:
+            row_view = _BoardList(row)
+            row_view.game = game
+            list.append(rows, row_view)
+        rows.game = game
+        list.append(layers, rows)
+    layers.game = game
+    return layers
+
+
+def getBitBoard(game):
+    """
+    Returns the bitboard of a game, rebuilding it from 'Board' and 'Who' when
+    the game is a plain dictionary or its board has been edited directly.
+
+    The bitboard belongs to the game; copy it before calling play() or undo().
+
+    Args:
+        game (dict): The current game state.
+
+    Returns:
+        BitBoard: The game state as bitmasks.
+    """
+    bitboard = getattr(game, 'bitboard', None)
+    if bitboard is None:
+        bitboard = BitBoard.fromBoard(game['Board'], game['Who'], gameGeometry(game))
+        if isinstance(game, Game) and game.tracked:
+            game.bitboard = bitboard
+    return bitboard
+
+
+def gameFromBitBoard(bitboard, p1, p2):
+    """
+    Builds a game dictionary around a bitboard.
+
+    Args:
+        bitboard (BitBoard): The position. The game takes ownership of it.
+        p1 (str): Name of Player 1.
+        p2 (str): Name of Player 2.
+
+    Returns:
+        Game: The game state.
+    """
+    geometry = bitboard.geometry
+    bits1, bits2 = bitboard.bits[1], bitboard.bits[2]
+    board = [[[1 if bits1 >> geometry.cell(k, j, i) & 1 else 2 if bits2 >> geometry.cell(k, j, i) & 1 else 0
+               for i in range(geometry.cols)]
+              for j in range(geometry.rows)]
+             for k in range(geometry.layers)]
+    game = Game({'Player 1': p1, 'Player 2': p2, 'Who': bitboard.who, 'Board': board})
+    game.bitboard = bitboard
+    game.geometry = geometry
+    return game
+
+
+def _boardGeometry(board, win=4):
+    #The geometry matching the size of a nested board list, going by its
+    #first layer and row, or None if it is not a 3D list
+    if not isinstance(board, list):
+        return None
+    try:
+        return getGeometry(len(board), len(board[0]), len(board[0][0]), win)
+    except (TypeError, IndexError, KeyError, ValueError):
+        return None
+
+
+def _geometryOf(board, geometry=None):
+    #The geometry given, else that of the game owning the board, else the
+    #one matching its size, else the usual one
+    if geometry is not None:
+        return geometry
+    if isinstance(board, _BoardList):
+        game = board.game
+        if game is not None and dict.get(game, 'Board') is board:
+            return gameGeometry(game)
+    return _boardGeometry(board) or DEFAULT_GEOMETRY
+
+
+def gameGeometry(game):
+    """
+    Returns the Geometry of a game: the one it was created or loaded with,
+    or for a plain dictionary the one matching the size of its board, with
+    the usual four in a row to win.
+
+    Args:
+        game (dict): The current game state.
+
+    Returns:
+        Geometry: Board dimensions, win length and tables.
+    """
+    geometry = getattr(game, 'geometry', None)
+    if geometry is None:
+        bitboard = getattr(game, 'bitboard', None)
+        if bitboard is not None:
+            return bitboard.geometry
+        geometry = _boardGeometry(game['Board']) or DEFAULT_GEOMETRY
+    return geometry
+
+
+def gameMoves(game):
+    """
+    Returns the moves that led to a game, oldest first, in the form 'Xx'.
+    Only moves made through makeMove (or a BitBoard) since the game was
+    created or loaded are known.
+    """
+    geometry = getBitBoard(game).geometry
+    return [geometry.moveNames[cell % geometry.columns] for cell in getBitBoard(game).history]
+
+###############################################################################
+
+
+###############################################################################
+# Task 1
+
+def newGame(p1, p2, geometry=DEFAULT_GEOMETRY):
+    """
+    Initialises a new game with two players.
+
+    Args:
+        p1 (str): Name of Player 1.
+        p2 (str): Name of Player 2.
+        geometry (Geometry): Board size and win length, from getGeometry.
+                             The usual 4 layer, 6x6 board, four in a row to
+                             win, by default.
+
+    Returns:
+        Game: A dictionary containing the game state, including player names,
+              the current player, and the game board.
+
+    Raises:
+        TypeError: If p1 or p2 is not a string.
+    """
+    
+    #Both players must be valid strings
+    if not isinstance(p1, str) or not isinstance(p2, str):
+        raise TypeError("Player names must be strings.")
+
+    game = Game({ #dictionary
+        #player names
+        'Player 1': p1,
+        'Player 2': p2,
+        
+        #First turn is player 1
+        'Who': 1,
+        
+        #3D Board game initialized to 0's
+        'Board': [[[0 for _ in range(geometry.cols)] for _ in range(geometry.rows)]
+                  for _ in range(geometry.layers)]
+    })
+    game.bitboard = BitBoard(geometry)
+    game.geometry = geometry
+    return game
+
+###############################################################################
+
+###############################################################################
+# Task 2
+
+_boardTexts = {}
+
+
+def _boardText(geometry=DEFAULT_GEOMETRY):
+    #The fixed text of a printed board: the header, and the rows with a %s
+    #in place of each cell. Built once for each board size.
+    key = (geometry.layers, geometry.rows, geometry.cols)
+    if key in _boardTexts:
+        return _boardTexts[key]
+    layers, cols = geometry.layers, geometry.cols
+
+    #Row and collumn labels
+    row_labels = [chr(ord('a') + j) for j in range(geometry.rows)]
+    col_labels = [chr(ord('A') + i) for i in range(cols)]
+    
+    #Headers and collumn labels, each layer as wide as its rows
+    width = 2 * cols + 2
+    header = "|".join([f"   Layer {level + 1}".ljust(width) for level in range(layers)]).rstrip() + "\n"
+    
+    #Add collumn labels for each layer, seperated by |
+    header += "  " + " |  ".join(["|".join(col_labels)] * layers) + "\n"
+    
+    #Seperators between labels and grid
+    header += " " + "| ".join(["-" + "+-" * cols] * layers) + "\n"
+    
+    #Each row has a label, then the row of each level, with the label again
+    #between levels
+    rows = ""
+    for row in range(geometry.rows):
+        row_str = [row_labels[row]]
+        for level in range(layers):
+            row_str.append("|" + "|".join(["%s"] * cols))
+            if level < layers - 1: row_str.append(" |" + row_labels[row])
+        rows += "".join(row_str) + "\n"
+    _boardTexts[key] = (header, rows)
+    return header, rows
+
+
+def printBoard(board, geometry=None):
+    """
+    Returns a formatted string representation of the game board.
+
+    Args:
+        board (list): A 3D list representing the board state.
+        geometry (Geometry): The size the board must be. By default that of
+                             the game the board belongs to, or of the board
+                             itself.
+
+    Returns:
+        str: A string representation of the board with proper alignment and spacing.
+
+    Raises:
+        TypeError: If board is not a 3D list of that size.
+    """
+    geometry = _geometryOf(board, geometry)
+
+    #Check if input is a valid board(4x6x6 for the usual geometry)
+    if not (isinstance(board, list) and len(board) == geometry.layers and
+            all(isinstance(layer, list) and len(layer) == geometry.rows for layer in board) and
+            all(isinstance(row, list) and len(row) == geometry.cols for layer in board for row in layer)):
+        raise TypeError("Invalid board structure.")
+        
+        
+    #Gather the cells row by row, each row running through the levels, in
+    #the order they appear in the rows of _boardText. 0's replaced with spaces
+    header, rows = _boardText(geometry)
+    cells = []
+    for row in range(geometry.rows):
+        for layer in board:
+            cells += layer[row]
+    board_str = header + rows % tuple([" " if value == 0 else str(value) for value in cells])
+        
+
+    return board_str
+
+###############################################################################
+
+###############################################################################
+# Task 3
+
+
+class ColumnFullError(Exception):
+    '''
+    
+    Error raised when there is an insertion attempt into a full collumn
+    
+    '''
+    
+    pass
+
+class InvalidColumnFormat(Exception):
+    
+    '''
+    
+    Error raised when inserted collumn format is incorrect
+    
+    '''
+    
+    
+def posToIndex(col,board,geometry=None):
+    
+    '''
+    
+    Converts collumn identifier in letter form (Eg. Aa) into board indices
+    
+    Input:
+        col(str): Collumn identifier of length 2. Contains 1 uppercase letter A-F (collumn)
+                  and 1 lower case letter a-f (row)
+        board (list): A 3D array representning the game board (4 x 6 x 6 board)
+        geometry (Geometry): Size of the board. By default that of its game,
+                             or going by the size of the board itself.
+        
+    Returns:
+        list: The indices of the first empty slot in the collumn col in form
+              [k, j, i] where k is the level, j is the row index, and i is the collumn index
+    
+    Raises:
+        ColumnFullError: If the column is full.
+        InvalidColumnFormatError: If col is wrongly formatted
+    
+    '''
+
+    # A game's board has its geometry and drop heights on its bitboard
+    game = getattr(board, 'game', None)
+    bitboard = None
+    if game is not None and game.tracked and dict.get(game, 'Board') is board:
+        bitboard = getBitBoard(game)
+    geometry = bitboard.geometry if bitboard is not None else _geometryOf(board, geometry)
+    
+    #Look up the collumn number of either form of identifier. If there is
+    #none, raise exception.
+    column = geometry.moveColumns.get(col) if isinstance(col, str) else None
+    if column is None:
+        raise InvalidColumnFormat(f"Invalid column format: {col}")
+    
+    row_index, col_index = divmod(column, geometry.cols)
+    
+    if bitboard is not None:
+        floor_lvl = bitboard.heights[column]
+        if floor_lvl < geometry.layers:
+            return [floor_lvl, row_index, col_index]
+        raise ColumnFullError(f"Column {col} is full")
+
+    # Iterate through all floor_lvls. 
+    #Find the first available slot in the column
+    
+    for floor_lvl in range(geometry.layers):
+        if board[floor_lvl][row_index][col_index] == 0:
+            return [floor_lvl, row_index, col_index]
+
+
+    # No empty space found. Raise collumn full error
+    raise ColumnFullError(f"Column {col} is full")
+
+
+
+###############################################################################
+
+###############################################################################
+# Task 4
+
+class IndexOutOfRange(Exception):
+    
+    '''
+    Error raised when inserted index is invalid
+    
+    '''
+    
+    pass
+
+
+def indexToPos(ind, geometry=DEFAULT_GEOMETRY):
+    
+    '''
+    Converts a list of board indices to corresponding letter collumn indentifiers
+    
+    Input:
+        ind(list): List of integers representing the board indices in 2D or 3D cases.
+        geometry (Geometry): Size of the board (6x6 rows and collumns by default).
+    
+    Return:
+        str: Letter collumn identifier in form 'Xx'
+        
+    Raises:
+        IndexOutOfRange: If i or j are not between 0 and 5 (or the number of
+                         collumns and rows less one).
+    
+    '''
+    
+    
+    #Splitting 2D,3D, and invalid cases
+    if len(ind) == 2:
+        j = ind[0] #j = row index
+        i = ind[1] #i = collumn index
+    elif len(ind) == 3:
+        j = ind[1] #j = row index
+        i = ind[2] #i = collumn index
+    else:
+        raise IndexOutOfRange(f" Index must be of length 2 or 3: {ind}")
+        
+    #Invalid index error checks
+    if j not in range(geometry.rows) or i not in range(geometry.cols):
+        raise IndexOutOfRange(f"Invalid index: {ind}")
+        
+        
+    #Display collumn index first then row index to be in form 'Xx'
+    return geometry.moveNames[int(j) * geometry.cols + int(i)]
+        
+    
+
+
+###############################################################################
+
+###############################################################################
+# Task 5
+
+def saveGame(game, fname):
+    """
+    Saves the game state to a CSV file.
+
+    Args:
+        game (dict): The current game state.
+        fname (str): The filename to save the game to.
+    """
+    with open(fname, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        
+        # Write player information
+        writer.writerow(["Player 1", game['Player 1']])
+        writer.writerow(["Player 2", game['Player 2']])
+        writer.writerow(["Who", game['Who']])
+        
+        # Boards other than the usual one record their size and win length
+        geometry = gameGeometry(game)
+        if geometry is DEFAULT_GEOMETRY:
+            writer.writerow(["Board"])
+        else:
+            writer.writerow(["Board", geometry.layers, geometry.rows, geometry.cols, geometry.win])
+        
+        # Flatten the 3D board into 2D format 
+        for layer in game['Board']:
+            for row in layer:
+                writer.writerow(row)
+                
+
+
+###############################################################################
+
+###############################################################################
+# Task 6
+
+def loadGame(fname):
+    """
+    Loads the game state from a CSV file.
+
+    Args:
+        fname (str): The filename to load the game from.
+
+    Returns:
+        Game: The restored game state dictionary.
+    """
+    with open(fname, mode='r', newline='') as file:
+        reader = csv.reader(file)
+        
+        # Read player names
+        player1 = next(reader)[1]
+        player2 = next(reader)[1]
+        
+        # Read current turn
+        who = int(next(reader)[1])
+        
+        # 'Board' line, with the size and win length if not the usual ones
+        geometry = DEFAULT_GEOMETRY
+        dimensions = next(reader)[1:]
+        if dimensions:
+            geometry = getGeometry(*map(int, dimensions))
+        
+        # Read board values
+        board = []
+        for _ in range(geometry.layers):  # Read each layer
+            layer = [list(map(int, next(reader))) for _ in range(geometry.rows)]
+            board.append(layer)
+        
+        game = Game({
+            'Player 1': player1,
+            'Player 2': player2,
+            'Who': who,
+            'Board': board
+        })
+        game.geometry = geometry
+        return game
+    
+
+
+###############################################################################
+
+###############################################################################
+# Task 7
+
+def findValidMoves(board, geometry=None):
+    """
+    Finds all non-full columns in the board and returns them as valid moves.
+
+    Args:
+        board (list): The 3D board representation.
+        geometry (Geometry): Size of the board. By default that of its game,
+                             or going by the size of the board itself.
+
+    Returns:
+        list: A list of valid moves in the form of 'xX' or 'Xx'.
+    """
+    # The board of a game knows which collumns are open from its bitboard,
+    # so the moves are read from tables, a few collumns at a time. A
+    # collumn is open while its top cell is empty, as for a list below,
+    # which on an edited board with a floating piece on top is not the same
+    # as the bitboard's legal moves.
+    game = getattr(board, 'game', None)
+    if game is not None and game.tracked and dict.get(game, 'Board') is board:
+        bitboard = getBitBoard(game)
+        geometry = bitboard.geometry
+        columns = geometry.columns
+        legal = ~(bitboard.occupied() >> (geometry.layers - 1) * columns) & ((1 << columns) - 1)
+        valid_moves = []
+        for chunk_moves in geometry.chunkMoves:
+            valid_moves += chunk_moves[legal & geometry.chunkMask]
+            legal >>= geometry.chunkBits
+        return valid_moves
+    
+    geometry = _geometryOf(board, geometry)
+    move_names = geometry.moveNames
+    top = board[geometry.layers - 1]
+    cols = geometry.cols
+    valid_moves = []
+    
+    for row in range(geometry.rows):
+        for col in range(cols):
+            # If the top layer (highest) at (row, col) is empty (0), it's a valid move
+            if top[row][col] == 0:
+                valid_moves.append(move_names[row * cols + col])
+    
+    return valid_moves
+    
+
+###############################################################################
+
+###############################################################################
+# Task 8
+
+class MoveNotMade(Exception):
+    """
+    Exception raised when a move cannot be made due to an invalid column reference,
+    incorrect format, or if the column is full.
+    """
+    pass
+
+def makeMove(game, move):
+    """
+    Attempts to place a piece in the specified column.
+    
+    Args:
+        game (dict): The current game state.
+        move (str): A string representing the column in the form 'xX' or 'Xx'.
+    
+    Returns:
+        Game: A new game state dictionary after the move is made.
+    
+    Raises:
+        MoveNotMade: If the move is invalid or the column is full.
+    """
+
+    # Validate move format
+    if len(move) != 2 or not (move[0].isalpha() and move[1].isalpha()):
+        raise MoveNotMade("Invalid move format. Must be 'xX' or 'Xx'.")
+        
+    bitboard = getBitBoard(game)
+    
+    # Get the collumn for the move
+    column = bitboard.geometry.moveColumns.get(move)
+    if column is None:
+        raise MoveNotMade(f"Invalid column format: {move}")
+    if not bitboard.canPlay(column):
+        raise MoveNotMade(f"Column {move} is full")
+    
+    # Play the move on a copy of the bitboard
+    new_bitboard = bitboard.copy()
+    k, j, i = bitboard.geometry.unpack(new_bitboard.play(column))
+    
+    # Copy the game, keeping the other entries as deepcopy would
+    new_game = Game.__new__(Game)
+    for key, value in game.items():
+        if key == 'Board':
+            value = _boardView(new_game, value)
+        elif key != 'Who':
+            value = deepcopy(value)
+        dict.__setitem__(new_game, key, value)
+    
+    # Place the current player's piece in the determined location
+    list.__setitem__(new_game['Board'][k][j], i, bitboard.who)
+    
+    # Switch to the next player
+    dict.__setitem__(new_game, 'Who', new_bitboard.who)
+    new_game.bitboard = new_bitboard
+    new_game.tracked = True
+    new_game.redo = []
+    new_game.geometry = new_bitboard.geometry
+    
+    return new_game
+
+
+def _applyMove(game, move):
+    #Validates and plays a move in place, returning its undo token
+    if len(move) != 2 or not (move[0].isalpha() and move[1].isalpha()):
+        raise MoveNotMade("Invalid move format. Must be 'xX' or 'Xx'.")
+    bitboard = getBitBoard(game)
+    column = bitboard.geometry.moveColumns.get(move)
+    if column is None:
+        raise MoveNotMade(f"Invalid column format: {move}")
+    if not bitboard.canPlay(column):
+        raise MoveNotMade(f"Column {move} is full")
+    
+    # A game's own bitboard is played on directly; any other was built just
+    # for this call
+    player = bitboard.who
+    cell = bitboard.play(column)
+    k, j, i = bitboard.geometry.unpack(cell)
+    list.__setitem__(game['Board'][k][j], i, player)
+    dict.__setitem__(game, 'Who', bitboard.who)
+    return (move, cell, player)
+
+
+def applyMove(game, move):
+    """
+    Places a piece in the specified column, changing the game in place.
+    Unlike makeMove nothing is copied, so a search or replay can play and
+    take back moves without allocating a new game for every ply.
+    
+    Args:
+        game (dict): The current game state. It is changed.
+        move (str): A string representing the column in the form 'xX' or 'Xx'.
+    
+    Returns:
+        tuple: An undo token to pass to undoMove.
+    
+    Raises:
+        MoveNotMade: If the move is invalid or the column is full. The game
+                     is left unchanged.
+    """
+    token = _applyMove(game, move)
+    if isinstance(game, Game):
+        game.redo.clear()
+    return token
+
+
+def undoMove(game, token=None):
+    """
+    Takes back a move made with applyMove (or makeMove), changing the game
+    in place. Moves must be taken back in the reverse order to that in which
+    they were made. The move is added to the game's redo stack.
+    
+    Args:
+        game (dict): The current game state. It is changed.
+        token (tuple): The token applyMove returned, or None for the last
+                       move made since the game was created or loaded.
+    
+    Returns:
+        tuple: The token of the move taken back, or None if there was no
+               move to take back.
+    
+    Raises:
+        ValueError: If the move is not the last one made in its collumn.
+    """
+    bitboard = getBitBoard(game)
+    geometry = bitboard.geometry
+    if token is None:
+        if not bitboard.history:
+            return None
+        cell = bitboard.history[-1]
+        token = (geometry.moveNames[cell % geometry.columns], cell, 3 - bitboard.who)
+    move, cell, player = token
+    
+    # The piece must be the top one in its collumn
+    if not bitboard.bits[player] >> cell & 1 or bitboard.occupied() >> (cell + geometry.columns) & 1:
+        raise ValueError(f"Move {move} is not the last one made in its collumn")
+    
+    if bitboard.history and bitboard.history[-1] == cell:
+        bitboard.undo()
+    elif isinstance(game, Game):
+        game.bitboard = None
+    k, j, i = geometry.unpack(cell)
+    list.__setitem__(game['Board'][k][j], i, 0)
+    dict.__setitem__(game, 'Who', player)
+    if isinstance(game, Game):
+        game.redo.append(move)
+    return token
+
+
+def redoMove(game):
+    """
+    Makes again the move most recently taken back with undoMove.
+    
+    Args:
+        game (Game): The current game state. It is changed.
+    
+    Returns:
+        tuple: An undo token for the move, or None if there was nothing to
+               redo.
+    
+    Raises:
+        MoveNotMade: If the move can no longer be made. It is left on the
+                     redo stack and the game is unchanged.
+    """
+    if not game.redo:
+        return None
+    token = _applyMove(game, game.redo[-1])
+    game.redo.pop()
+    return token
+
+
+
+###############################################################################
+
+###############################################################################
+# Task 9
+
+def isWinner(game):
+    """
+    Checks whether there is a winner in the current board of the given game.
+    
+    Args:
+        game (dict): The current game state.
+        
+    Returns:
+       1 if Player 1 has won,
+       2 if Player 2 has won,
+       0 if there is no winner and the board is not full,
+      -1 if there is no winner and the board is full.
+    """
+    # The bitboard finds every line at once for each player
+    return getBitBoard(game).winner()
+
+
+def isWinnerAfter(game, move):
+    """
+    Checks for a winner after a move, looking only at the lines through the
+    cell that move filled. Faster than isWinner when the position before the
+    move is known to have no winner, as in playGame or when replaying games.
+    
+    Args:
+        game (dict): The game state after the move was made.
+        move (str): The move just made in the form 'xX' or 'Xx'.
+        
+    Returns:
+        The same values as isWinner.
+        
+    Raises:
+        InvalidColumnFormat: If move is wrongly formatted.
+    """
+    bitboard = getBitBoard(game)
+    column = bitboard.geometry.moveColumns.get(move)
+    if column is None:
+        raise InvalidColumnFormat(f"Invalid column format: {move}")
+    
+    cell = bitboard.lastCell(column)
+    if cell is not None and bitboard.wonAfter(cell):
+        return 1 if bitboard.bits[1] >> cell & 1 else 2
+    
+    return -1 if bitboard.occupied() == bitboard.geometry.full else 0
+
+
+class GameOverError(Exception):
+    """
+    Error raised when no valid moves remain (i.e. the game is over).
+    """
+    pass
+
+
+def _randomGames(count, seed=0, geometry=DEFAULT_GEOMETRY):
+    #Positions reached by random play, stopping at a random ply or a win
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        bitboard = BitBoard(geometry)
+        for _ in range(rng.randrange(geometry.cells + 1)):
+            open_columns = [c for c in range(geometry.columns) if bitboard.canPlay(c)]
+            if not open_columns:
+                break
+            if bitboard.wonAfter(bitboard.play(rng.choice(open_columns))):
+                break
+        board = [[[0] * geometry.cols for _ in range(geometry.rows)] for _ in range(geometry.layers)]
+        for player in (1, 2):
+            bits = bitboard.bits[player]
+            while bits:
+                low = bits & -bits
+                k, j, i = geometry.unpack(low.bit_length() - 1)
+                board[k][j][i] = player
+                bits ^= low
+        games.append({'Player 1': 'A', 'Player 2': 'B', 'Who': bitboard.who, 'Board': board})
+    return games
+
+
+def _benchmarkPositions(seed=0):
+    #An empty game, a quiet opening to search, one halfway through a random
+    #game and one with every cell filled
+    empty = newGame('A', 'B')
+    opening = empty
+    for move in ('Cc', 'Dd'):
+        opening = makeMove(opening, move)
+    moves = max(_randomMoveLists(20, seed), key=len)
+    mid = empty
+    for move in moves[:len(moves) // 2]:
+        mid = makeMove(mid, move)
+    rng = random.Random(seed)
+    full = empty
+    while True:
+        valid = findValidMoves(full['Board'])
+        if not valid:
+            break
+        full = makeMove(full, rng.choice(valid))
+    return {'empty': empty, 'opening': opening, 'mid': mid, 'full': full}
+    
+    
+    
+
+###############################################################################
+# In-place moves
+#
+# Compares replaying games and taking every move back again with makeMove,
+# which keeps a whole game per ply, and with applyMove/undoMove, which keep
+# one game and a small token per ply.
+
+def _randomMoveLists(count, seed=0, geometry=DEFAULT_GEOMETRY):
+    #Moves of complete random games, in the form 'Xx'
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        bitboard = BitBoard(geometry)
+        moves = []
+        while True:
+            open_columns = [c for c in range(geometry.columns) if bitboard.canPlay(c)]
+            if not open_columns:
+                break
+            column = rng.choice(open_columns)
+            moves.append(geometry.moveNames[column])
+            if bitboard.wonAfter(bitboard.play(column)):
+                break
+        games.append(moves)
+    return games
+
+
+def _replayCopying(games):
+    for moves in games:
+        states = [newGame('A', 'B')]
+        for move in moves:
+            states.append(makeMove(states[-1], move))
+        while len(states) > 1:
+            states.pop()
+
+
+def _replayInPlace(games):
+    for moves in games:
+        game = newGame('A', 'B')
+        tokens = [applyMove(game, move) for move in moves]
+        while tokens:
+            undoMove(game, tokens.pop())
+
+
+def benchmarkMoves(count=200, seed=0):
+    """
+    Replays random games to the end and takes every move back, once with
+    makeMove and once with applyMove/undoMove, and prints the time and the
+    memory used per ply by each.
+
+    Args:
+        count (int): Number of random games.
+        seed (int): Seed for the games.
+
+    Returns:
+        dict: For each of 'makeMove' and 'applyMove', a dict with 'Time/ply'
+              (microseconds to make and take back one move), 'Bytes/ply'
+              (peak memory held per ply played) and 'Blocks/ply' (memory
+              blocks allocated per ply).
+    """
+    games = _randomMoveLists(count, seed)
+    plies = sum(len(moves) for moves in games)
+    result = {}
+    for name, replay in (('makeMove', _replayCopying), ('applyMove', _replayInPlace)):
+        replay(games[:10])
+        started = time.perf_counter()
+        replay(games)
+        elapsed = time.perf_counter() - started
+
+        # Memory of the longest game, whose states are all held at once
+        longest = [max(games, key=len)]
+        tracemalloc.start()
+        replay(longest)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # Blocks allocated, whether or not they are freed again
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        replay(games[:20])
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        blocks = sum(stat.count_diff for stat in after.compare_to(before, 'lineno') if stat.count_diff > 0)
+
+        result[name] = {'Time/ply': elapsed / plies * 1e6, 'Bytes/ply': peak / len(longest[0]),
+                        'Blocks/ply': blocks / sum(len(moves) for moves in games[:20])}
+        print(f"{name:9}: {result[name]['Time/ply']:7.2f} us/ply  {result[name]['Bytes/ply']:8.0f} bytes/ply  "
+              f"{result[name]['Blocks/ply']:6.1f} blocks/ply")
+    print(f"{plies} plies, applyMove is {result['makeMove']['Time/ply'] / result['applyMove']['Time/ply']:.1f}x faster")
+    return result
+
+###############################################################################
+
+
+###############################################################################
+# Move lookups
+#
+# Times the move helpers on game boards, which answer from the bitboard's
+# heights and legal move mask, and on plain nested lists, which are scanned.
+
+def benchmarkLookups(count=2000, repeat=20, seed=0):
+    """
+    Prints the time per call of findValidMoves, posToIndex and the move
+    formatting used by suggestMove, on game boards and on plain lists.
+
+    Args:
+        count (int): Number of random positions.
+        repeat (int): Times each position is looked up.
+        seed (int): Seed for the positions.
+
+    Returns:
+        dict: Nanoseconds per call, keyed by (function, 'Game' or 'List').
+    """
+    plain = _randomGames(count, seed)
+    games = [Game(game) for game in plain]
+    for game in games:
+        getBitBoard(game)
+    moves = DEFAULT_GEOMETRY.moveNames
+
+    def posToIndexAll(board):
+        for move in moves:
+            try:
+                posToIndex(move, board)
+            except ColumnFullError:
+                pass
+
+    def formatAll(board):
+        for column in range(len(moves)):
+            indexToPos(divmod(column, 6))
+
+    def namesAll(board):
+        for column in range(len(moves)):
+            moves[column]
+
+    cases = [('findValidMoves', findValidMoves, 1),
+             ('posToIndex', posToIndexAll, len(moves)),
+             ('move name', None, len(moves))]
+    result = {}
+    for name, function, calls in cases:
+        for kind, boards in (('Game', [game['Board'] for game in games]), ('List', [game['Board'] for game in plain])):
+            if function is None:
+                #suggestMove now names its collumn from a table instead of
+                #building the string with indexToPos
+                call = namesAll if kind == 'Game' else formatAll
+            else:
+                call = function
+            started = time.perf_counter()
+            for _ in range(repeat):
+                for board in boards:
+                    call(board)
+            elapsed = time.perf_counter() - started
+            result[(name, kind)] = elapsed / (repeat * len(boards) * calls) * 1e9
+        print(f"{name:15}: {result[(name, 'Game')]:8.0f} ns on a game, {result[(name, 'List')]:8.0f} ns on a list "
+              f"({result[(name, 'List')] / result[(name, 'Game')]:.1f}x)")
+    return result
+
+###############################################################################
+
+
+###############################################################################
+# Symmetry
+#
+# Rotating or reflecting the footprint of the board (leaving the layers
+# alone) gives an equivalent position. The canonical form of a position is
+# whichever of its images has the smallest Zobrist key; caches keyed on
+# canonical keys store each family of equivalent positions once.
+
+_symmetryKeyTables = {}
+
+
+def _symmetryTables(geometry):
+    #For each symmetry and player, table[b][v] is the Zobrist key of the
+    #pieces in bitmask byte b having value v, after the symmetry is applied
+    if geometry not in _symmetryKeyTables:
+        size = (geometry.cells + 7) // 8
+        tables = []
+        for perm in geometry.symmetries:
+            per_player = [None]
+            for player in (1, 2):
+                keys = geometry.zobrist[player]
+                mapped = [keys[(cell // geometry.columns) * geometry.columns + perm[cell % geometry.columns]]
+                          if cell < geometry.cells else 0
+                          for cell in range(size * 8)]
+                byte_tables = []
+                for b in range(size):
+                    table = [0] * 256
+                    for value in range(1, 256):
+                        low = value & -value
+                        table[value] = table[value ^ low] ^ mapped[b * 8 + low.bit_length() - 1]
+                    byte_tables.append(table)
+                per_player.append(byte_tables)
+            tables.append(per_player)
+        _symmetryKeyTables[geometry] = tables
+    return _symmetryKeyTables[geometry]
+
+
+def canonicalKey(bitboard):
+    """
+    Finds the canonical Zobrist key of a position.
+
+    Args:
+        bitboard (BitBoard): The position.
+
+    Returns:
+        tuple: (key, symmetry) where key is the smallest key of any image of
+               the position and symmetry is the index of the transformation
+               that produces that image.
+    """
+    geometry = bitboard.geometry
+    size = (geometry.cells + 7) // 8
+    data = (bitboard.bits[1].to_bytes(size, 'little'), bitboard.bits[2].to_bytes(size, 'little'))
+    side = geometry.sideKey if bitboard.who == 2 else 0
+    best = None
+    for symmetry, tables in enumerate(_symmetryTables(geometry)):
+        key = side
+        for player in (1, 2):
+            byte_tables = tables[player]
+            for index, value in enumerate(data[player - 1]):
+                if value:
+                    key ^= byte_tables[index][value]
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    return best
+
+
+def transformBitBoard(bitboard, symmetry):
+    """
+    Returns the image of a position under one of geometry.symmetries. The
+    history is transformed too.
+    """
+    geometry = bitboard.geometry
+    perm = geometry.symmetries[symmetry]
+    columns = geometry.columns
+    image = BitBoard(geometry, bitboard.who)
+    for player in (1, 2):
+        bits = bitboard.bits[player]
+        while bits:
+            low = bits & -bits
+            cell = low.bit_length() - 1
+            image.bits[player] |= 1 << (cell - cell % columns + perm[cell % columns])
+            bits ^= low
+    image.legal = 0
+    for column in range(columns):
+        image.heights[perm[column]] = bitboard.heights[column]
+        if bitboard.legal >> column & 1:
+            image.legal |= 1 << perm[column]
+    image.history = [cell - cell % columns + perm[cell % columns] for cell in bitboard.history]
+    for player in (1, 2):
+        bits = image.bits[player]
+        while bits:
+            low = bits & -bits
+            image.key ^= geometry.zobrist[player][low.bit_length() - 1]
+            bits ^= low
+    return image
+
+
+def mapMove(move, symmetry, inverse=False, geometry=DEFAULT_GEOMETRY):
+    """
+    Maps a move string through a symmetry.
+
+    Args:
+        move (str): A move in the form 'xX' or 'Xx'.
+        symmetry (int): Index into geometry.symmetries, as returned by
+                        canonicalKey or canonicalForm.
+        inverse (bool): If True, map from the transformed position back to
+                        the original.
+        geometry (Geometry): Board size.
+
+    Returns:
+        str: The mapped move in the form 'Xx'.
+
+    Raises:
+        InvalidColumnFormat: If move is wrongly formatted.
+    """
+    column = geometry.moveColumns.get(move)
+    if column is None:
+        raise InvalidColumnFormat(f"Invalid column format: {move}")
+    perms = geometry.inverseSymmetries if inverse else geometry.symmetries
+    return geometry.moveNames[perms[symmetry][column]]
+
+
+def canonicalForm(game):
+    """
+    Returns the canonical image of a game.
+
+    A move m in the original game is the move mapMove(m, symmetry) in the
+    canonical game, and a move m' suggested for the canonical game is
+    mapMove(m', symmetry, inverse=True) in the original.
+
+    Args:
+        game (dict): The current game state.
+
+    Returns:
+        tuple: (canonical game, symmetry).
+    """
+    bitboard = getBitBoard(game)
+    key, symmetry = canonicalKey(bitboard)
+    return gameFromBitBoard(transformBitBoard(bitboard, symmetry),
+                            game['Player 1'], game['Player 2']), symmetry
+
+
+class CanonicalCache:
+    """
+    Cache of values for positions, keyed so that equivalent positions
+    share one entry. Values that are collumn numbers (such as best moves)
+    can be stored and fetched in the caller's own frame with
+    storeMove/lookupMove, which map them through the symmetry.
+
+    Attributes:
+        entries (dict): Canonical key to value.
+        hits (int): Successful lookups.
+        misses (int): Failed lookups.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, bitboard, default=None):
+        """Returns the value stored for a position or any image of it."""
+        key = canonicalKey(bitboard)[0]
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def store(self, bitboard, value):
+        """Stores a value for a position and all its images."""
+        self.entries[canonicalKey(bitboard)[0]] = value
+
+    def lookupMove(self, bitboard):
+        """Returns a collumn stored with storeMove, mapped onto bitboard."""
+        key, symmetry = canonicalKey(bitboard)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bitboard.geometry.inverseSymmetries[symmetry][self.entries[key]]
+
+    def storeMove(self, bitboard, column):
+        """Stores a collumn played in bitboard, in the canonical frame."""
+        key, symmetry = canonicalKey(bitboard)
+        self.entries[key] = bitboard.geometry.symmetries[symmetry][column]
+
+
+def benchmarkSymmetry(count=2000, plies=8, seed=0):
+    """
+    Replays the opening plies of random games through a position cache
+    keyed on raw Zobrist keys and through a CanonicalCache, and prints how
+    many positions each holds and how often each hits.
+
+    Args:
+        count (int): Number of random games.
+        plies (int): Opening plies of each game to look up.
+        seed (int): Seed for the games.
+
+    Returns:
+        dict: 'Raw entries', 'Canonical entries', 'Raw hit rate',
+              'Canonical hit rate' and 'Lookups/sec' for canonical keys.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        bitboard = BitBoard()
+        for _ in range(plies):
+            bitboard.play(rng.choice([c for c in range(bitboard.geometry.columns) if bitboard.canPlay(c)]))
+            positions.append(bitboard.copy())
+
+    raw = {}
+    raw_hits = 0
+    for bitboard in positions:
+        if bitboard.key in raw:
+            raw_hits += 1
+        raw[bitboard.key] = True
+
+    cache = CanonicalCache()
+    started = time.perf_counter()
+    for bitboard in positions:
+        if cache.lookup(bitboard) is None:
+            cache.store(bitboard, True)
+    elapsed = time.perf_counter() - started
+
+    result = {'Raw entries': len(raw), 'Canonical entries': len(cache),
+              'Raw hit rate': raw_hits / len(positions),
+              'Canonical hit rate': cache.hits / len(positions),
+              'Lookups/sec': len(positions) / elapsed if elapsed > 0 else 0.0}
+    print(f"{len(positions)} lookups")
+    print(f"Raw keys:       {result['Raw entries']} entries, {result['Raw hit rate']:.1%} hits")
+    print(f"Canonical keys: {result['Canonical entries']} entries, {result['Canonical hit rate']:.1%} hits "
+          f"({result['Raw entries'] / max(1, result['Canonical entries']):.1f}x fewer entries)")
+    print(f"Canonical lookups: {result['Lookups/sec']:,.0f}/sec")
+    return result
+
+###############################################################################
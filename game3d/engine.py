@@ -0,0 +1,1981 @@
+"""Alpha-beta search, evaluation, Monte Carlo tree search and their stores."""
+
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import random
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the batch functions
+    np = None
+
+from .board import (
+    BitBoard, DEFAULT_GEOMETRY, GameOverError, _randomGames, canonicalKey, findValidMoves,
+    getBitBoard, getGeometry, isWinner, posToIndex)
+from .storage import ArchiveError, _signedKey
+
+
+###############################################################################
+# Search engine
+#
+# Negamax alpha-beta over BitBoards with iterative deepening. Scores are from
+# the point of view of the player to move. A win is worth WIN_SCORE less the
+# number of plies needed to reach it, so quicker wins score higher.
+
+WIN_SCORE = 100000
+
+
+class _SearchTimeout(Exception):
+    """Raised inside the search when its time or node budget runs out."""
+    pass
+
+
+class TranspositionTable:
+    """
+    Fixed size table of search results indexed by Zobrist hash.
+
+    Each slot holds one entry (key, depth, flag, score, collumn, generation).
+    A new result replaces the stored one if it is for the same position, was
+    searched at least as deep, or the stored one is left over from an earlier
+    search.
+
+    Attributes:
+        size (int): Number of slots, a power of two.
+        probes (int): Number of lookups made.
+        hits (int): Number of lookups that found the position.
+    """
+
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, size=1 << 18):
+        self.size = 1 << max(0, size - 1).bit_length()
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        """Empties the table and resets its counters."""
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def newSearch(self):
+        """Starts a new generation, so older entries are replaced first."""
+        self.generation += 1
+
+    def probe(self, key):
+        """Returns the entry stored for key, or None."""
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, flag, score, column):
+        """Records a search result, subject to the replacement policy."""
+        index = key & self.mask
+        old = self.entries[index]
+        if old is None or old[0] == key or old[5] != self.generation or depth >= old[1]:
+            self.entries[index] = (key, depth, flag, score, column, self.generation)
+
+
+class Engine:
+    """
+    Alpha-beta searcher. An Engine keeps its transposition table between
+    searches, so successive moves in the same game reuse earlier work.
+
+    By default positions at the end of the search are scored by how many
+    lines pass through each side's pieces. An Engine given evaluation
+    weights scores them with an Evaluator instead, and one given an
+    evaluator (such as a NetEvaluator) scores them with that. An evaluator
+    with a scorePositions method is handed every leaf below a node at once.
+
+    Attributes:
+        table (TranspositionTable): Results of earlier searches.
+        evaluator (Evaluator): Scores positions at the end of the search, or
+                               None for the default score.
+        nodes (int): Positions visited by the current or last search.
+        cutoffs (int): Beta cutoffs in the current or last search.
+        iterations (list): (depth, collumn, score) for each iteration the
+                           last search completed.
+    """
+
+    def __init__(self, table_size=1 << 18, weights=None, evaluator=None):
+        self.table = TranspositionTable(table_size)
+        if evaluator is None and weights is not None:
+            evaluator = Evaluator(weights)
+        self.evaluator = evaluator
+        self._batch = evaluator if hasattr(evaluator, 'scorePositions') else None
+        self.nodes = 0
+        self.cutoffs = 0
+        self.iterations = []
+        self._deadline = None
+        self._max_nodes = None
+        self._root_moves = None
+        self._bounds = None
+        self._stop = None
+
+    def search(self, bitboard, time_ms=200, max_depth=None, max_nodes=None,
+               moves=None, bounds=None, stop=None):
+        """
+        Searches a position by iterative deepening until the budget runs out.
+
+        Args:
+            bitboard (BitBoard): The position to search. It is not changed.
+            time_ms (float): Time budget in milliseconds, or None for no limit.
+            max_depth (int): Deepest iteration to run, or None for no limit.
+            max_nodes (int): Node budget, or None for no limit.
+            moves (list): Collumns to consider at the root, or None for all.
+            bounds (_SharedBounds): Best root score found so far at each
+                           depth, shared with searches of the other root
+                           moves. Moves that cannot beat it are only
+                           searched far enough to show that.
+            stop (threading.Event): Ends the search, as if its budget had
+                           run out, once set.
+
+        Returns:
+            dict: 'Move' (the best collumn number found), 'Score', 'Depth' (the
+                  deepest iteration completed), 'Nodes', 'Time' (seconds) and
+                  'Nodes/sec'.
+
+        Raises:
+            GameOverError: If there are no valid moves.
+        """
+        geometry = bitboard.geometry
+        legal = [column for column in geometry.centreOrder if bitboard.canPlay(column)]
+        if not legal:
+            raise GameOverError("No valid moves left. The board is full.")
+        if moves is not None:
+            legal = [column for column in legal if column in moves]
+        self._root_moves = moves
+        self._bounds = bounds
+        self._stop = stop
+
+        started = time.perf_counter()
+        self._deadline = started + time_ms / 1000 if time_ms is not None else None
+        self._max_nodes = max_nodes
+        self.nodes = 0
+        self.cutoffs = 0
+        self.iterations = []
+        self.table.newSearch()
+
+        board = bitboard.copy()
+        static = self._static(board)
+        if self.evaluator is not None:
+            self.evaluator.reset(board)
+        empty = geometry.cells - bin(board.occupied()).count('1')
+        last_depth = min(max_depth or empty, empty)
+
+        best = {'Move': legal[0], 'Score': 0, 'Depth': 0}
+        for depth in range(1, last_depth + 1):
+            self._root_best = None
+            try:
+                score = self._negamax(board, depth, -WIN_SCORE - 1, WIN_SCORE + 1, 0, static)
+            except _SearchTimeout:
+                #Moves searched before time ran out are only compared against
+                #the previous best move, which is always searched first
+                if self._root_best is not None:
+                    best['Move'], best['Score'] = self._root_best
+                break
+            best = {'Move': self._root_best[0], 'Score': score, 'Depth': depth}
+            self.iterations.append((depth, best['Move'], score))
+            if abs(score) > WIN_SCORE - geometry.cells:
+                break
+
+        elapsed = time.perf_counter() - started
+        best['Nodes'] = self.nodes
+        best['Time'] = elapsed
+        best['Nodes/sec'] = self.nodes / elapsed if elapsed > 0 else 0.0
+        return best
+
+    def _static(self, bitboard):
+        #Sum of cell weights for the player to move less the opponent's
+        weights = bitboard.geometry.cellWeights
+        score = 0
+        for player, sign in ((bitboard.who, 1), (3 - bitboard.who, -1)):
+            bits = bitboard.bits[player]
+            while bits:
+                low = bits & -bits
+                score += sign * weights[low.bit_length() - 1]
+                bits ^= low
+        return score
+
+    def _checkBudget(self):
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise _SearchTimeout()
+        if self._max_nodes is not None and self.nodes >= self._max_nodes:
+            raise _SearchTimeout()
+        if self._stop is not None and self._stop.is_set():
+            raise _SearchTimeout()
+
+    def _negamax(self, board, depth, alpha, beta, ply, static):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self._checkBudget()
+
+        wins, blocks, quiet, losing = _classifyMoves(board)
+        if wins:
+            if ply == 0:
+                self._root_best = (wins[0], WIN_SCORE - 1)
+            return WIN_SCORE - ply - 1
+        if not blocks and not quiet and not losing:
+            return 0
+        if len(blocks) > 1:
+            #Two threats cannot both be stopped
+            if ply == 0:
+                self._root_best = (blocks[0], -(WIN_SCORE - 2))
+            return -(WIN_SCORE - ply - 2)
+        if depth <= 0:
+            if self.evaluator is not None:
+                return self.evaluator.score(board.who)
+            return static
+
+        key = board.key
+        table = self.table
+        entry = table.probe(key)
+        tt_column = None
+        if entry is not None:
+            tt_column = entry[4]
+            if entry[1] >= depth and ply > 0:
+                score = _scoreFromTable(entry[3], ply)
+                flag = entry[2]
+                if flag == TranspositionTable.EXACT:
+                    return score
+                if flag == TranspositionTable.LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        if blocks:
+            ordered = blocks
+        else:
+            if ply == 0 and self._batch is not None:
+                #A network's policy orders the root moves, after the best
+                #move of the last iteration
+                quiet = self._batch.order(board, quiet)
+            ordered = quiet + losing
+            if tt_column in quiet:
+                ordered.remove(tt_column)
+                ordered.insert(0, tt_column)
+        if ply == 0 and self._root_moves is not None:
+            ordered = [column for column in ordered if column in self._root_moves]
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_column = ordered[0]
+        if depth == 1 and ply > 0 and self._batch is not None:
+            #Every child is a leaf, so they are scored together and none
+            #is left to search
+            best_score, best_column = self._frontier(board, ordered, alpha, beta, ply)
+            if best_score >= beta:
+                self.cutoffs += 1
+            ordered = ()
+        weights = board.geometry.cellWeights
+        evaluator = self.evaluator
+        for column in ordered:
+            if ply == 0 and self._bounds is not None and depth < len(self._bounds):
+                #Only a score at least equal to the best found elsewhere
+                #matters, so ties are still decided the same way
+                alpha = max(alpha, self._bounds[depth] - 1)
+            cell = board.play(column)
+            if evaluator is not None:
+                evaluator.played(board, cell)
+            try:
+                score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1,
+                                       -(static + weights[cell]))
+            finally:
+                board.undo()
+                if evaluator is not None:
+                    evaluator.undone(board, cell)
+            if score > best_score:
+                best_score = score
+                best_column = column
+                if ply == 0:
+                    self._root_best = (column, score)
+                    if score > alpha and self._bounds is not None and depth < len(self._bounds):
+                        with self._bounds.get_lock():
+                            if score > self._bounds[depth]:
+                                self._bounds[depth] = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.cutoffs += 1
+                break
+
+        if best_score <= original_alpha:
+            flag = TranspositionTable.UPPER
+        elif best_score >= beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+        table.store(key, depth, flag, _scoreToTable(best_score, ply), best_column)
+        return best_score
+
+
+    def _frontier(self, board, ordered, alpha, beta, ply):
+        #Scores each move from a node one ply from the end of the search, as
+        #_negamax would at depth 0, with the leaves evaluated in batches of
+        #1, 2, 4... moves: the first moves are the likeliest to cut the node
+        #off, and the batches grow once they have not. Returns the best
+        #score and its move as the loop in _negamax would.
+        child_ply = ply + 1
+        batch = self._batch
+        geometry = board.geometry
+        scores = []
+        leaves = []
+        indices = []
+        size = 1
+        done = 0
+        best_score = -WIN_SCORE - 1
+        best_column = ordered[0]
+        for number, column in enumerate(ordered, 1):
+            self.nodes += 1
+            if self.nodes & 1023 == 0:
+                self._checkBudget()
+            board.play(column)
+            wins, blocks, quiet, losing = _classifyMoves(board)
+            if wins:
+                scores.append(-(WIN_SCORE - child_ply - 1))
+            elif not blocks and not quiet and not losing:
+                scores.append(0)
+            elif len(blocks) > 1:
+                scores.append(WIN_SCORE - child_ply - 2)
+            else:
+                indices.append(len(scores))
+                leaves.append((board.key, board.bits[board.who], board.bits[3 - board.who]))
+                scores.append(None)
+            board.undo()
+            if len(leaves) < size and number < len(ordered):
+                continue
+            if leaves:
+                for index, value in zip(indices, batch.scorePositions(leaves, geometry)):
+                    scores[index] = -value
+                leaves = []
+                indices = []
+                size *= 2
+            for score in scores[done:]:
+                if score > best_score:
+                    best_score = score
+                    best_column = ordered[done]
+                done += 1
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    return best_score, best_column
+        return best_score, best_column
+
+
+def _classifyMoves(board):
+    """
+    Sorts the valid collumns of a position, each list in centre order.
+
+    Returns:
+        tuple: (wins, blocks, quiet, losing) where wins complete a line for
+               the player to move, blocks stop the opponent completing one,
+               losing let the opponent win by playing on top, and quiet are
+               the rest.
+    """
+    geometry = board.geometry
+    columns = geometry.columns
+    heights = board.heights
+    me = board.who
+    mine = board.bits[me]
+    theirs = board.bits[3 - me]
+    occupied = mine | theirs
+
+    #Cells where each side could complete a line
+    my_threats = geometry.threats(mine) & ~occupied
+    their_threats = geometry.threats(theirs) & ~occupied
+
+    wins = []
+    blocks = []
+    quiet = []
+    losing = []
+    for column in geometry.centreOrder:
+        level = heights[column]
+        if level >= geometry.layers:
+            continue
+        cell = level * columns + column
+        if my_threats >> cell & 1:
+            wins.append(column)
+        elif their_threats >> cell & 1:
+            blocks.append(column)
+        elif their_threats >> (cell + columns) & 1 and level + 1 < geometry.layers:
+            #Playing here lets the opponent win on top
+            losing.append(column)
+        else:
+            quiet.append(column)
+    return wins, blocks, quiet, losing
+
+
+def _scoreToTable(score, ply):
+    #Win scores are stored relative to the position rather than the root
+    if score > WIN_SCORE // 2:
+        return score + ply
+    if score < -WIN_SCORE // 2:
+        return score - ply
+    return score
+
+
+def _scoreFromTable(score, ply):
+    if score > WIN_SCORE // 2:
+        return score - ply
+    if score < -WIN_SCORE // 2:
+        return score + ply
+    return score
+
+
+_defaultEngine = None
+
+
+def availableCores():
+    """Returns the number of CPU cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+_searchPools = {}
+_boundsManager = None
+
+
+class _SharedBounds:
+    #The best root score at each depth for one parallel search, with the
+    #lock that guards it. Both live in a manager process, so they can be
+    #sent with the tasks of a pool that other searches are using too.
+
+    def __init__(self, size=1024):
+        global _boundsManager
+        if _boundsManager is None:
+            _boundsManager = multiprocessing.Manager()
+        self.size = size
+        self.scores = _boundsManager.Array('q', [-2 * WIN_SCORE] * size)
+        self.lock = _boundsManager.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, depth):
+        return self.scores[depth]
+
+    def __setitem__(self, depth, score):
+        self.scores[depth] = score
+
+    def get_lock(self):
+        return self.lock
+
+
+def _searchWorker(board, moves, time_ms, max_depth, max_nodes, bounds):
+    engine = Engine()
+    result = engine.search(board, time_ms, max_depth, max_nodes, moves, bounds)
+    result['Iterations'] = engine.iterations
+    return result
+
+
+def _searchPool(workers):
+    #Pools are kept for reuse
+    if workers not in _searchPools:
+        _searchPools[workers] = ProcessPoolExecutor(workers)
+    return _searchPools[workers]
+
+
+def parallelSearch(bitboard, workers=None, time_ms=200, max_depth=None, max_nodes=None, seed=None):
+    """
+    Searches a position on several processes by splitting the root moves
+    between them. Each process deepens its own moves; while a time budget
+    applies they share the best score found at each depth, so moves that
+    cannot beat it are dismissed quickly.
+
+    Without a time budget nothing is shared, so for a given position,
+    max_depth (or max_nodes), workers and seed the result is always the same.
+    Given a seed and max_depth or max_nodes, the time budget is ignored so
+    that this holds.
+
+    Args:
+        bitboard (BitBoard): The position to search. It is not changed.
+        workers (int): Number of processes, or None for one per available core.
+        time_ms (float): Time budget in milliseconds, or None for no limit.
+        max_depth (int): Deepest iteration to run, or None for no limit.
+        max_nodes (int): Node budget shared between the processes, or None.
+        seed (int): Seeds how the root moves are dealt to the processes, or
+                    None to deal them as seed 0 does and keep the time budget.
+
+    Returns:
+        dict: As for Engine.search, with 'Depth' the deepest iteration every
+              process completed, plus 'Workers'.
+
+    Raises:
+        GameOverError: If there are no valid moves.
+    """
+    started = time.perf_counter()
+    workers = workers or availableCores()
+    if seed is not None and (max_depth is not None or max_nodes is not None):
+        time_ms = None
+
+    wins, blocks, quiet, losing = _classifyMoves(bitboard)
+    candidates = blocks or (quiet + losing)
+    if wins or len(candidates) <= 1:
+        #Nothing to share out: a win, a forced block or no moves at all
+        result = Engine(1 << 10).search(bitboard, None, 1)
+        result['Workers'] = 1
+        return result
+
+    dealt = candidates[:]
+    random.Random(seed or 0).shuffle(dealt)
+    groups = [dealt[w::workers] for w in range(min(workers, len(dealt)))]
+
+    pool = _searchPool(workers)
+    #Each search has bounds of its own, as searches may overlap on a pool
+    bounds = _SharedBounds() if time_ms is not None else None
+    if time_ms is not None:
+        time_ms = max(1.0, time_ms - (time.perf_counter() - started) * 1000)
+    if max_nodes is not None:
+        max_nodes = max(1, max_nodes // len(groups))
+
+    futures = [pool.submit(_searchWorker, bitboard, group, time_ms, max_depth, max_nodes, bounds)
+               for group in groups]
+    results = [future.result() for future in futures]
+
+    #Compare the processes at the deepest iteration they all finished. One
+    #that stopped early on a decided result counts as finished at any depth.
+    decided = WIN_SCORE - bitboard.geometry.cells
+    depth = None
+    for result in results:
+        if not result['Iterations']:
+            depth = 0
+            break
+        last_depth, _, last_score = result['Iterations'][-1]
+        if abs(last_score) <= decided:
+            depth = last_depth if depth is None else min(depth, last_depth)
+    if depth is None:
+        depth = max(result['Iterations'][-1][0] for result in results)
+
+    best = None
+    for result in results:
+        reached = [entry for entry in result['Iterations'] if entry[0] <= depth]
+        if not reached:
+            continue
+        _, column, score = reached[-1]
+        if (best is None or score > best[1] or
+                (score == best[1] and candidates.index(column) < candidates.index(best[0]))):
+            best = (column, score)
+    if best is None:
+        best = (candidates[0], 0)
+        depth = 0
+
+    elapsed = time.perf_counter() - started
+    nodes = sum(result['Nodes'] for result in results)
+    return {'Move': best[0], 'Score': best[1], 'Depth': depth, 'Nodes': nodes,
+            'Time': elapsed, 'Nodes/sec': nodes / elapsed if elapsed > 0 else 0.0,
+            'Workers': len(groups)}
+
+
+def searchMove(game, time_ms=200, max_depth=None, max_nodes=None, engine=None,
+               workers=1, seed=None, book=True):
+    """
+    Searches for the best move for the player to move and reports how the
+    search went.
+
+    Args:
+        game (dict): The current game state.
+        time_ms (float): Time budget in milliseconds, or None for no limit.
+        max_depth (int): Deepest iteration to run, or None for no limit.
+        max_nodes (int): Node budget, or None for no limit.
+        engine (Engine): Engine to search with. By default a shared engine is
+                         used, so its transposition table carries over
+                         between calls.
+        workers (int): Number of processes to search with (see
+                       parallelSearch), or None for one per available core.
+                       The default of 1 searches in this process.
+        seed (int): Seed for a parallel search. Given a seed and max_depth
+                    or max_nodes, time_ms is ignored and the search starts
+                    from an empty transposition table (a new engine unless
+                    one is given, whose table is then cleared), so the same
+                    position always gets the same move; otherwise the move
+                    depends on the speed of the machine and on earlier
+                    searches.
+        book (bool): If True and an opening book has been set with
+                     setOpeningBook, positions found in it are answered
+                     from the book without searching.
+
+    If an endgame solver has been set with setEndgameSolver, positions with
+    few enough empty cells are solved exactly instead of searched.
+
+    Returns:
+        dict: 'Move' (in the form 'Xx'), 'Score', 'Depth', 'Nodes', 'Time'
+              and 'Nodes/sec', as for Engine.search, plus 'Book' (True if
+              the move came from the opening book) and, for solved
+              positions, 'Solved'.
+
+    Raises:
+        GameOverError: If no valid moves remain.
+    """
+    global _defaultEngine
+    if seed is not None and (max_depth is not None or max_nodes is not None):
+        time_ms = None
+        if engine is None:
+            engine = Engine()
+        else:
+            engine.table.clear()
+    elif engine is None:
+        if _defaultEngine is None:
+            _defaultEngine = Engine()
+        engine = _defaultEngine
+
+    result = None
+    if book and _openingBook is not None:
+        result = _openingBook.probe(getBitBoard(game))
+    if result is None and _endgameSolver is not None:
+        result = _endgameSolver.probe(getBitBoard(game))
+    if result is None:
+        if workers == 1:
+            result = engine.search(getBitBoard(game), time_ms, max_depth, max_nodes)
+        else:
+            result = parallelSearch(getBitBoard(game), workers, time_ms, max_depth, max_nodes, seed)
+        result['Book'] = False
+    result['Move'] = getBitBoard(game).geometry.moveNames[result['Move']]
+    return result
+
+###############################################################################
+
+
+
+###############################################################################
+# Batch evaluation
+#
+# Scores many boards at once with NumPy. Boards are stacked into an integer
+# array of shape (N, 4, 6, 6) holding 0, 1 and 2 as in game['Board'].
+
+def _requireNumpy(name):
+    if np is None:
+        raise ImportError(f"{name} needs NumPy, which is not installed.")
+
+
+_lineArrays = {}
+
+
+def _lineTensor(geometry):
+    #Built once per geometry: a (cells, lines) matrix with a 1 where a cell
+    #is on a line, the first cell of each line, and the cell weights
+    if geometry not in _lineArrays:
+        incidence = np.zeros((geometry.cells, len(geometry.lines)), dtype=np.float32)
+        starts = np.zeros(len(geometry.lines), dtype=np.int64)
+        for index, line in enumerate(geometry.lines):
+            starts[index] = (line & -line).bit_length() - 1
+            while line:
+                low = line & -line
+                incidence[low.bit_length() - 1, index] = 1
+                line ^= low
+        _lineArrays[geometry] = (incidence, starts,
+                                 np.array(geometry.cellWeights, dtype=np.int64))
+    return _lineArrays[geometry]
+
+
+def boardArray(games):
+    """
+    Stacks boards into one array for evaluateBoards.
+
+    Args:
+        games (list): Game dictionaries or 3D board lists.
+
+    Returns:
+        numpy.ndarray: Array of shape (N, 4, 6, 6) with dtype int8.
+    """
+    _requireNumpy('boardArray')
+    return np.array([game['Board'] if isinstance(game, dict) else game for game in games],
+                    dtype=np.int8)
+
+
+def evaluateBoards(boards, who=None, geometry=DEFAULT_GEOMETRY, chunk=1 << 15):
+    """
+    Evaluates a stack of boards at once. Every result matches the function
+    that handles one board: isWinner, findValidMoves, posToIndex and the
+    search engine's static score.
+
+    Args:
+        boards (numpy.ndarray): Array of shape (N, 4, 6, 6).
+        who (numpy.ndarray): The player to move on each board. By default
+                             player 1 when both have played the same number
+                             of pieces, otherwise player 2.
+        geometry (Geometry): Dimensions of the boards.
+        chunk (int): Boards handled per step, limiting memory use.
+
+    Returns:
+        dict: 'Winner' (N,) with the values isWinner returns,
+              'Moves' (N, 6, 6) True where a collumn has room,
+              'Heights' (N, 6, 6) the layer the next piece would land on
+              (4 for a full collumn), and 'Score' (N,) the static score for
+              the player to move.
+
+    Raises:
+        TypeError: If boards does not have the right shape.
+    """
+    _requireNumpy('evaluateBoards')
+    boards = np.asarray(boards)
+    if boards.ndim != 4 or boards.shape[1:] != (geometry.layers, geometry.rows, geometry.cols):
+        raise TypeError("Invalid board structure.")
+
+    count = len(boards)
+    flat = boards.reshape(count, geometry.cells)
+    incidence, starts, weights = _lineTensor(geometry)
+
+    #A winner is whoever owns the complete line starting on the lowest cell.
+    #Multiplying by the incidence matrix counts each player's pieces on
+    #every line.
+    winner = np.zeros(count, dtype=np.int8)
+    for low in range(0, count, chunk):
+        part = flat[low:low + chunk]
+        first = []
+        for player in (1, 2):
+            complete = (part == player).astype(np.float32) @ incidence == geometry.win
+            first.append(np.where(complete, starts, geometry.cells).min(axis=1))
+        winner[low:low + chunk] = np.where(first[0] < first[1], 1,
+                                           np.where(first[1] < first[0], 2, 0))
+    winner[(winner == 0) & (flat != 0).all(axis=1)] = -1
+
+    empty = boards == 0
+    heights = np.where(empty.any(axis=1), empty.argmax(axis=1), geometry.layers)
+    moves = empty[:, -1]
+
+    ones = flat == 1
+    twos = flat == 2
+    if who is None:
+        who = np.where(ones.sum(axis=1) > twos.sum(axis=1), 2, 1)
+    balance = ones @ weights - twos @ weights
+    score = np.where(np.asarray(who) == 1, balance, -balance)
+
+    return {'Winner': winner, 'Moves': moves, 'Heights': heights, 'Score': score}
+
+
+def benchmarkBatchEvaluation(count=20000, seed=0):
+    """
+    Times evaluateBoards against evaluating the same boards one at a time
+    with isWinner, findValidMoves and posToIndex, and prints boards/sec.
+
+    Args:
+        count (int): Number of random positions to evaluate.
+        seed (int): Seed for generating the positions.
+
+    Returns:
+        dict: 'Per board' and 'Batch' rates in boards/sec.
+    """
+    _requireNumpy('benchmarkBatchEvaluation')
+    games = _randomGames(count, seed)
+    boards = boardArray(games)
+    engine = Engine(1)
+
+    started = time.perf_counter()
+    for game in games:
+        isWinner(game)
+        findValidMoves(game['Board'])
+        for move in findValidMoves(game['Board']):
+            posToIndex(move, game['Board'])
+        engine._static(getBitBoard(game))
+    single = count / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    evaluateBoards(boards, np.array([game['Who'] for game in games]))
+    batch = count / (time.perf_counter() - started)
+
+    print(f"Per board: {single:,.0f} boards/sec")
+    print(f"Batch:     {batch:,.0f} boards/sec ({batch / single:.1f}x)")
+    return {'Per board': single, 'Batch': batch}
+
+###############################################################################
+
+
+###############################################################################
+# Evaluation
+#
+# Scores a position that is not yet won by counting, for each player, the
+# lines that still only hold that player's pieces (open ones, twos and
+# threes), and the empty cells that would complete a line (threats). A
+# threat on a cell that can be played now is worth more than one floating
+# above an empty cell. Scores are from the point of view of the player to
+# move. The Evaluator keeps its counts up to date as moves are played and
+# taken back, so a search pays only for the lines through each new piece.
+
+DEFAULT_WEIGHTS = {'One': 1, 'Two': 4, 'Three': 16,
+                   'Playable threat': 48, 'Floating threat': 20, 'Tempo': 2}
+
+_evaluationWeights = dict(DEFAULT_WEIGHTS)
+_evaluationEngine = None
+
+
+def loadEvaluationWeights(path):
+    """
+    Reads evaluation weights from a JSON file holding an object with some
+    or all of the keys of DEFAULT_WEIGHTS. Missing keys keep their default.
+
+    Raises:
+        ValueError: If the file holds an unknown key or a value that is not
+                    a number.
+    """
+    with open(path, encoding='utf-8') as file:
+        weights = json.load(file)
+    return _checkWeights(weights)
+
+
+def saveEvaluationWeights(weights, path):
+    """Writes evaluation weights to a JSON file for loadEvaluationWeights."""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(_checkWeights(weights), file, indent=1)
+
+
+def _checkWeights(weights):
+    #Fills in missing weights with their defaults
+    checked = dict(DEFAULT_WEIGHTS)
+    for key, value in dict(weights).items():
+        if key not in DEFAULT_WEIGHTS:
+            raise ValueError(f"Unknown evaluation weight: {key}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Evaluation weight {key} must be a number: {value!r}")
+        checked[key] = value
+    return checked
+
+
+def setEvaluationWeights(weights):
+    """
+    Sets the weights used by evaluate and the 'eval' strategy.
+
+    Args:
+        weights (dict or str): Weights, a JSON file of them, or None for
+                               DEFAULT_WEIGHTS.
+    """
+    global _evaluationWeights, _evaluationEngine
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    elif isinstance(weights, str):
+        weights = loadEvaluationWeights(weights)
+    _evaluationWeights = _checkWeights(weights)
+    _evaluationEngine = None
+
+
+class Evaluator:
+    """
+    Threat counting evaluation, updated incrementally.
+
+    Call reset with a position, then played after each BitBoard.play and
+    undone after each BitBoard.undo; score is then always that of the
+    bitboard as it stands.
+
+    Attributes:
+        weights (dict): The weights in use, keyed as DEFAULT_WEIGHTS.
+        threats (list): threats[p] is the bitmask of empty cells that would
+                        complete a line for player p.
+    """
+
+    def __init__(self, weights=None):
+        self.weights = _checkWeights(weights if weights is not None else _evaluationWeights)
+        self.geometry = None
+        self.counts = None
+        self.threats = [0, 0, 0]
+        self._threat_lines = None
+        self._playable = 0
+        self._lines = 0
+
+    def _lineValue(self, mine, theirs):
+        #Value of one line to player 1, given each player's pieces on it
+        if mine and theirs:
+            return 0
+        values = self._values
+        return values[mine] - values[theirs]
+
+    def reset(self, bitboard):
+        """Counts everything afresh for a position."""
+        geometry = bitboard.geometry
+        if geometry is not self.geometry:
+            self.geometry = geometry
+            #Lines one piece short of a win score as threes, two short as
+            #twos, and any other unfinished line as ones. A complete line
+            #ends the game, so it is never scored.
+            names = {1: 'Three', 2: 'Two'}
+            self._values = [0] + [self.weights[names.get(geometry.win - count, 'One')]
+                                  for count in range(1, geometry.win)] + [0]
+        bits1, bits2 = bitboard.bits[1], bitboard.bits[2]
+        occupied = bits1 | bits2
+        self.counts = [None,
+                       [bin(line & bits1).count('1') for line in geometry.lines],
+                       [bin(line & bits2).count('1') for line in geometry.lines]]
+        self._threat_lines = [None, [0] * geometry.cells, [0] * geometry.cells]
+        self.threats = [0, 0, 0]
+        self._lines = 0
+        for index, line in enumerate(geometry.lines):
+            self._addLine(index, line, occupied, 1)
+        self._playable = 0
+        for column in range(geometry.columns):
+            if bitboard.heights[column] < geometry.layers:
+                self._playable |= 1 << (bitboard.heights[column] * geometry.columns + column)
+        return self
+
+    def _addLine(self, index, line, occupied, sign):
+        #Adds (sign 1) or removes (sign -1) one line's score and threat
+        counts1 = self.counts[1][index]
+        counts2 = self.counts[2][index]
+        self._lines += sign * self._lineValue(counts1, counts2)
+        need = self.geometry.win - 1
+        for player, mine, theirs in ((1, counts1, counts2), (2, counts2, counts1)):
+            if mine == need and not theirs:
+                cell = (line & ~occupied).bit_length() - 1
+                threat_lines = self._threat_lines[player]
+                threat_lines[cell] += sign
+                if threat_lines[cell]:
+                    self.threats[player] |= 1 << cell
+                else:
+                    self.threats[player] &= ~(1 << cell)
+
+    def _update(self, bitboard, cell, player, change):
+        geometry = self.geometry
+        lines = geometry.lines
+        occupied = bitboard.bits[1] | bitboard.bits[2]
+        before = occupied ^ (1 << cell)
+        counts = self.counts[player]
+        for index in geometry.cellLineIds[cell]:
+            self._addLine(index, lines[index], before, -1)
+            counts[index] += change
+            self._addLine(index, lines[index], occupied, 1)
+        column = cell % geometry.columns
+        self._playable &= ~geometry.columnCells[column]
+        height = bitboard.heights[column]
+        if height < geometry.layers:
+            self._playable |= 1 << (height * geometry.columns + column)
+
+    def played(self, bitboard, cell):
+        """Updates the counts after bitboard.play filled cell."""
+        self._update(bitboard, cell, 3 - bitboard.who, 1)
+
+    def undone(self, bitboard, cell):
+        """Updates the counts after bitboard.undo emptied cell."""
+        self._update(bitboard, cell, bitboard.who, -1)
+
+    def score(self, who):
+        """Returns the score of the position for player who."""
+        weights = self.weights
+        playable = self._playable
+        threats1, threats2 = self.threats[1], self.threats[2]
+        score = (self._lines
+                 + weights['Playable threat'] * (bin(threats1 & playable).count('1')
+                                                 - bin(threats2 & playable).count('1'))
+                 + weights['Floating threat'] * (bin(threats1 & ~playable).count('1')
+                                                 - bin(threats2 & ~playable).count('1')))
+        return (score if who == 1 else -score) + weights['Tempo']
+
+
+def evaluate(game, weights=None, player=None):
+    """
+    Scores a game that is not yet over. Larger is better for the player.
+
+    Args:
+        game (dict): The current game state.
+        weights (dict): Weights to score with, or None for those set with
+                        setEvaluationWeights (DEFAULT_WEIGHTS unless changed).
+        player (int): Player to score for, or None for the player to move.
+
+    Returns:
+        float: The score; 0 is an even position.
+    """
+    bitboard = getBitBoard(game)
+    return Evaluator(weights).reset(bitboard).score(player or bitboard.who)
+
+
+def _newEvaluationEngine():
+    #An engine scoring positions with the weights set now
+    return Engine(weights=_evaluationWeights)
+
+
+def evaluatedMove(game, time_ms=200, engine=None):
+    """
+    Suggests a move like suggestMove, with the search scoring positions
+    using the weights set with setEvaluationWeights. Without an engine the
+    one kept between calls is used.
+    """
+    global _evaluationEngine
+    if engine is None:
+        if _evaluationEngine is None:
+            _evaluationEngine = _newEvaluationEngine()
+        engine = _evaluationEngine
+    return searchMove(game, time_ms, engine=engine)['Move']
+
+###############################################################################
+
+
+###############################################################################
+# Opening book
+#
+# A book file is a header followed by fixed size entries sorted by the
+# Zobrist key of their position:
+#
+#   header: magic b'G3DB', format version, layers, rows, cols, win (bytes),
+#           number of entries (uint64)
+#   entry:  key (uint64), score (int32), best collumn (byte)
+#
+# From version 2 keys are canonical (see canonicalKey) and collumns are in
+# the canonical frame, so each family of symmetric positions takes one
+# entry. Entries are found by binary search over the memory-mapped file, so
+# opening a book reads nothing but its header.
+
+BOOK_MAGIC = b'G3DB'
+BOOK_VERSION = 2
+_BOOK_HEADER = struct.Struct('<4sBBBBBQ')
+_BOOK_ENTRY = struct.Struct('<QiB')
+
+
+class OpeningBook:
+    """
+    Read-only opening book, memory-mapped on first lookup.
+
+    Attributes:
+        path (str): The book file.
+        geometry (Geometry): Board size the book was built for.
+        count (int): Number of positions in the book.
+        version (int): Format version; 2 and later use canonical keys.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            header = file.read(_BOOK_HEADER.size)
+        if len(header) < _BOOK_HEADER.size:
+            raise ArchiveError(f"{path} is not an opening book")
+        magic, version, layers, rows, cols, win, count = _BOOK_HEADER.unpack(header)
+        if magic != BOOK_MAGIC:
+            raise ArchiveError(f"{path} is not an opening book")
+        if version not in (1, BOOK_VERSION):
+            raise ArchiveError(f"{path} has unsupported version {version}")
+        self.version = version
+        self.geometry = getGeometry(layers, rows, cols, win)
+        self.count = count
+        self._data = None
+
+    def _mapped(self):
+        if self._data is None:
+            with open(self.path, 'rb') as file:
+                self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    def close(self):
+        """Unmaps the file."""
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    def lookup(self, key):
+        """
+        Finds a position by Zobrist key.
+
+        Returns:
+            tuple: (collumn, score) or None if the position is not in the book.
+        """
+        data = self._mapped()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, score, column = _BOOK_ENTRY.unpack_from(
+                data, _BOOK_HEADER.size + middle * _BOOK_ENTRY.size)
+            if entry_key == key:
+                return column, score
+            if entry_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def probe(self, bitboard):
+        """
+        Looks up a position for searchMove.
+
+        Returns:
+            dict: As for Engine.search with 'Book' True, or None if the
+                  position is not in the book.
+        """
+        geometry = bitboard.geometry
+        if geometry is not self.geometry:
+            return None
+        if self.version == 1:
+            found = self.lookup(bitboard.key)
+        else:
+            key, symmetry = canonicalKey(bitboard)
+            found = self.lookup(key)
+            if found is not None and found[0] < geometry.columns:
+                found = (geometry.inverseSymmetries[symmetry][found[0]], found[1])
+        if found is None or found[0] >= geometry.columns or not bitboard.canPlay(found[0]):
+            return None
+        return {'Move': found[0], 'Score': found[1], 'Depth': 0, 'Nodes': 0,
+                'Time': 0.0, 'Nodes/sec': 0.0, 'Book': True}
+
+
+_openingBook = None
+
+
+def setOpeningBook(path):
+    """
+    Sets the opening book searchMove and suggestMove consult before
+    searching. Only the header is read now.
+
+    Args:
+        path (str): A book written by buildOpeningBook, or None for no book.
+    """
+    global _openingBook
+    if _openingBook is not None:
+        _openingBook.close()
+    _openingBook = OpeningBook(path) if path is not None else None
+
+
+def _bookPositions(plies, geometry):
+    #Every position within plies moves of the start that is not yet decided,
+    #one bitboard per canonical key
+    frontier = {canonicalKey(BitBoard(geometry))[0]: BitBoard(geometry)}
+    positions = dict(frontier)
+    for _ in range(plies):
+        following = {}
+        for bitboard in frontier.values():
+            for column in range(geometry.columns):
+                if not bitboard.canPlay(column):
+                    continue
+                child = bitboard.copy()
+                if child.wonAfter(child.play(column)) or child.occupied() == geometry.full:
+                    continue
+                following.setdefault(canonicalKey(child)[0], child)
+        positions.update(following)
+        frontier = following
+    return list(positions.values())
+
+
+def _bookEntries(bitboards, max_depth, time_ms):
+    engine = Engine()
+    entries = []
+    for bitboard in bitboards:
+        result = engine.search(bitboard, time_ms, max_depth)
+        key, symmetry = canonicalKey(bitboard)
+        entries.append((key, result['Score'], bitboard.geometry.symmetries[symmetry][result['Move']]))
+    return entries
+
+
+def buildOpeningBook(path, plies=2, max_depth=4, time_ms=None, workers=None,
+                     geometry=DEFAULT_GEOMETRY, quiet=False):
+    """
+    Searches every position up to a number of plies from the start and
+    writes the best moves as an opening book. Only one position of each
+    symmetric family is searched and stored.
+
+    Args:
+        path (str): The book file to write.
+        plies (int): Depth of the book: positions after 0 to plies moves.
+        max_depth (int): Search depth for each position.
+        time_ms (float): Time budget per position, or None for no limit.
+        workers (int): Processes to search with, None for one per core.
+        geometry (Geometry): Board size.
+        quiet (bool): If True, nothing is printed.
+
+    Returns:
+        int: The number of positions in the book.
+    """
+    started = time.perf_counter()
+    positions = _bookPositions(plies, geometry)
+    workers = workers or availableCores()
+    chunks = [positions[n::workers * 4] for n in range(min(len(positions), workers * 4))]
+
+    entries = []
+    if workers == 1:
+        entries = _bookEntries(positions, max_depth, time_ms)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            for part in pool.map(_bookEntries, chunks, [max_depth] * len(chunks),
+                                 [time_ms] * len(chunks)):
+                entries.extend(part)
+    entries.sort()
+
+    with open(path, 'wb') as file:
+        file.write(_BOOK_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, geometry.layers, geometry.rows,
+                                     geometry.cols, geometry.win, len(entries)))
+        file.write(b''.join(_BOOK_ENTRY.pack(*entry) for entry in entries))
+
+    if not quiet:
+        print(f"{len(entries)} positions written to {path} in {time.perf_counter() - started:.1f}s")
+    return len(entries)
+
+###############################################################################
+
+
+###############################################################################
+# Endgame solver
+#
+# Near the end of the game a search to the last ply is affordable and gives
+# the exact result. Solved positions are kept in an SQLite file keyed by
+# canonical key, so every run and every process shares them.
+
+class SolvedPositions:
+    """
+    Persistent store of solved positions in an SQLite file.
+
+    Each row holds a canonical key, the result for the player to move
+    (1 win, 0 draw, -1 loss), the number of plies until that result, and
+    the best collumn in the canonical frame. The database runs in WAL mode,
+    so many processes can read and write it at once.
+
+    Attributes:
+        path (str): The database file.
+        hits (int): Lookups answered from the store.
+        misses (int): Lookups that were not.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        #Connections cannot be shared with forked processes
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS solved (key INTEGER PRIMARY KEY, "
+                "result INTEGER NOT NULL, distance INTEGER NOT NULL, move INTEGER)")
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        """Closes this process's connection."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM solved").fetchone()[0]
+
+    _signed = staticmethod(_signedKey)
+
+    def lookup(self, bitboard):
+        """
+        Returns (result, distance, collumn) for a position, with the collumn
+        mapped onto bitboard (None if the game is over), or None if the
+        position has not been solved.
+        """
+        key, symmetry = canonicalKey(bitboard)
+        row = self._connect().execute("SELECT result, distance, move FROM solved WHERE key = ?",
+                                      (self._signed(key),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        result, distance, column = row
+        if column is not None:
+            column = bitboard.geometry.inverseSymmetries[symmetry][column]
+        return result, distance, column
+
+    def store(self, bitboard, result, distance, column):
+        """Records a solved position."""
+        key, symmetry = canonicalKey(bitboard)
+        if column is not None:
+            column = bitboard.geometry.symmetries[symmetry][column]
+        connection = self._connect()
+        connection.execute("INSERT OR REPLACE INTO solved VALUES (?, ?, ?, ?)",
+                           (self._signed(key), result, distance, column))
+        connection.commit()
+
+
+def _solve(bitboard, store=None):
+    #Returns (result, distance, collumn, nodes, cached) for the player to move
+    if store is not None:
+        found = store.lookup(bitboard)
+        if found is not None:
+            return found + (0, True)
+
+    winner = bitboard.winner()
+    if winner in (1, 2):
+        return (1 if winner == bitboard.who else -1), 0, None, 0, False
+    empty = bitboard.geometry.cells - bin(bitboard.occupied()).count('1')
+    if winner == -1 or not any(bitboard.canPlay(c) for c in range(bitboard.geometry.columns)):
+        return 0, 0, None, 0, False
+
+    #Searching as many plies as there are empty cells never reaches the
+    #static score, so the result is exact
+    engine = Engine(1 << 20)
+    found = engine.search(bitboard, None, empty)
+    score = found['Score']
+    if score > WIN_SCORE // 2:
+        result, distance = 1, WIN_SCORE - score
+    elif score < -WIN_SCORE // 2:
+        result, distance = -1, WIN_SCORE + score
+    else:
+        result, distance = 0, empty
+    if store is not None:
+        store.store(bitboard, result, distance, found['Move'])
+    return result, distance, found['Move'], found['Nodes'], False
+
+
+class EndgameSolver:
+    """
+    Solves positions with at most max_empty empty cells, for searchMove.
+
+    Attributes:
+        store (SolvedPositions): Where solved positions are kept.
+        max_empty (int): Most empty cells a position may have to be solved.
+    """
+
+    def __init__(self, store, max_empty=12):
+        self.store = store
+        self.max_empty = max_empty
+
+    def probe(self, bitboard):
+        """
+        Solves a position for searchMove.
+
+        Returns:
+            dict: As for Engine.search with 'Solved' True, or None if the
+                  position has too many empty cells or the game is over.
+        """
+        empty = bitboard.geometry.cells - bin(bitboard.occupied()).count('1')
+        if empty > self.max_empty:
+            return None
+        started = time.perf_counter()
+        result, distance, column, nodes, _ = _solve(bitboard, self.store)
+        if column is None:
+            return None
+        elapsed = time.perf_counter() - started
+        score = {1: WIN_SCORE - distance, 0: 0, -1: distance - WIN_SCORE}[result]
+        return {'Move': column, 'Score': score, 'Depth': empty, 'Nodes': nodes, 'Time': elapsed,
+                'Nodes/sec': nodes / elapsed if elapsed > 0 else 0.0, 'Book': False, 'Solved': True}
+
+
+_endgameSolver = None
+
+
+def setEndgameSolver(path, max_empty=12):
+    """
+    Makes searchMove and suggestMove solve positions with at most max_empty
+    empty cells exactly, keeping results in the SQLite file at path.
+
+    Args:
+        path (str): The solved-position database, or None to stop solving.
+        max_empty (int): Most empty cells a position may have to be solved.
+    """
+    global _endgameSolver
+    if _endgameSolver is not None:
+        _endgameSolver.store.close()
+    _endgameSolver = EndgameSolver(SolvedPositions(path), max_empty) if path is not None else None
+
+
+def solvePosition(game, path=None):
+    """
+    Solves a position by searching to the end of the game.
+
+    Only sensible near the end of a game; with many empty cells the search
+    takes a very long time.
+
+    Args:
+        game (dict): The current game state.
+        path (str): Solved-position database to read and update. Defaults to
+                    the one set with setEndgameSolver, if any.
+
+    Returns:
+        dict: 'Result' for the player to move (1 win, 0 draw, -1 loss),
+              'Distance' (plies until that result with best play), 'Move'
+              (the best move in the form 'Xx', None if the game is over),
+              'Nodes' searched and 'Cached' (True if the answer came from
+              the database).
+    """
+    if path is not None:
+        store = SolvedPositions(path)
+    else:
+        store = _endgameSolver.store if _endgameSolver is not None else None
+    try:
+        result, distance, column, nodes, cached = _solve(getBitBoard(game), store)
+    finally:
+        if path is not None:
+            store.close()
+    move = None
+    if column is not None:
+        move = getBitBoard(game).geometry.moveNames[column]
+    return {'Result': result, 'Distance': distance, 'Move': move, 'Nodes': nodes, 'Cached': cached}
+
+###############################################################################
+
+
+###############################################################################
+# Monte Carlo tree search
+#
+# An alternative to the alpha-beta engine. The tree grows towards the moves
+# that have done best in random games played out from its leaves. Leaves
+# are chosen a batch at a time, with a virtual loss on each chosen path so
+# one batch spreads over different leaves, and the random games of a batch
+# are played together on arrays: each step drops one piece in every
+# unfinished game and only checks the lines through the new pieces.
+#
+# The tree is kept between searches. When the next search is for a position
+# reached from the last root by the moves played since, the matching subtree
+# becomes the new root and the rest of the tree is dropped. The tree also
+# stops growing at max_nodes.
+
+_rolloutArrays = {}
+
+
+def _rolloutTables(geometry):
+    #Built once per geometry: the lines through each cell, padded with a
+    #dummy line that can never be completed
+    if geometry not in _rolloutArrays:
+        width = max(len(ids) for ids in geometry.cellLineIds)
+        cell_lines = np.full((geometry.cells, width), len(geometry.lines), dtype=np.int64)
+        for cell, ids in enumerate(geometry.cellLineIds):
+            cell_lines[cell, :len(ids)] = ids
+        _rolloutArrays[geometry] = cell_lines
+    return _rolloutArrays[geometry]
+
+
+def rolloutBatch(bitboards, rng):
+    """
+    Finishes copies of many positions with random moves, all at once.
+
+    Args:
+        bitboards (list): Positions, none of them already won, all of the
+                          same geometry.
+        rng (numpy.random.Generator): Source of the random moves.
+
+    Returns:
+        numpy.ndarray: The winner of each game, 1 or 2, or 0 for a draw.
+    """
+    _requireNumpy('rolloutBatch')
+    geometry = bitboards[0].geometry
+    cell_lines = _rolloutTables(geometry)
+    incidence = _lineTensor(geometry)[0]
+    count = len(bitboards)
+    size = (geometry.cells + 7) // 8
+    layers = geometry.layers
+    columns = geometry.columns
+
+    #Each player's pieces on every line, at counts[(game * 2 + player - 1)
+    #* stride + line]; the dummy line starts too low to ever reach a win
+    stride = len(geometry.lines) + 1
+    packed = np.frombuffer(b''.join(bitboard.bits[player].to_bytes(size, 'little')
+                                    for bitboard in bitboards for player in (1, 2)),
+                           dtype=np.uint8).reshape(count * 2, size)
+    owned = np.unpackbits(packed, axis=1, bitorder='little')[:, :geometry.cells]
+    counts = np.empty((count * 2, stride), dtype=np.int16)
+    counts[:, :-1] = owned.astype(np.float32) @ incidence
+    counts[:, -1] = -geometry.cells - geometry.win
+    counts = counts.reshape(-1)
+    occupied = owned.reshape(count, 2, -1).any(axis=1).reshape(-1)
+    empty = geometry.cells - occupied.reshape(count, -1).sum(axis=1)
+    heights = np.array([list(bitboard.heights) for bitboard in bitboards], dtype=np.int64).reshape(-1)
+    who = np.array([bitboard.who for bitboard in bitboards], dtype=np.int64)
+    winner = np.zeros(count, dtype=np.int8)
+
+    active = np.arange(count)
+    while True:
+        #A full board is a draw
+        active = active[empty[active] > 0]
+        if not active.size:
+            break
+
+        #Pick collumns at random, picking again for those that are full
+        choice = rng.integers(0, columns, active.size)
+        base = active * columns
+        full = np.flatnonzero(heights[base + choice] >= layers)
+        for _ in range(4):
+            if not full.size:
+                break
+            choice[full] = rng.integers(0, columns, full.size)
+            full = full[heights[base[full] + choice[full]] >= layers]
+        if full.size:
+            legal = heights[base[full, None] + np.arange(columns)] < layers
+            choice[full] = np.where(legal, rng.random(legal.shape), -1.0).argmax(axis=1)
+
+        level = heights[base + choice]
+        cell = level * columns + choice
+        player = who[active]
+        occupied[active * geometry.cells + cell] = True
+        empty[active] -= 1
+
+        #Step over any pieces already above, as BitBoard.play does
+        level = level + 1
+        while True:
+            blocked = np.flatnonzero(level < layers)
+            blocked = blocked[occupied[active[blocked] * geometry.cells
+                                       + level[blocked] * columns + choice[blocked]]]
+            if not blocked.size:
+                break
+            level[blocked] += 1
+        heights[base + choice] = level
+
+        #Only the lines through the new piece can have been completed
+        index = ((active * 2 + player - 1) * stride)[:, None] + cell_lines[cell]
+        counts[index] += 1
+        won = (counts[index] >= geometry.win).any(axis=1)
+        winner[active[won]] = player[won]
+        who[active] = 3 - player
+        active = active[~won]
+    return winner
+
+
+def _rolloutScalar(bitboard, rng):
+    #One random game with a BitBoard, for when numpy is not installed
+    board = bitboard.copy()
+    columns = board.geometry.columns
+    while board.legal:
+        open_columns = [c for c in range(columns) if board.legal >> c & 1]
+        cell = board.play(rng.choice(open_columns))
+        if board.wonAfter(cell):
+            return 3 - board.who
+    return 0
+
+
+class _TreeNode:
+    #visits and value count the games through this node; value is from the
+    #point of view of the player who moved into it (a win 1, a draw 0.5).
+    #terminal is the winner (1 or 2, 0 for a draw) of a finished game.
+    __slots__ = ('children', 'visits', 'value', 'prior', 'terminal')
+
+    def __init__(self, prior, terminal=None):
+        self.children = None
+        self.visits = 0
+        self.value = 0.0
+        self.prior = prior
+        self.terminal = terminal
+
+
+class MCTS:
+    """
+    Monte Carlo tree search player.
+
+    Attributes:
+        batch (int): Leaves chosen, and random games played, at a time.
+        exploration (float): Weight of the exploration term.
+        mode (str): 'uct' to try every move once before exploiting, or
+                    'puct' to favour moves whose cells lie on more lines.
+        max_nodes (int): Most tree nodes kept; leaves stop being expanded
+                         once the tree is this big.
+        nodes (int): Nodes in the tree.
+        playouts (int): Random games played by the last search.
+    """
+
+    def __init__(self, batch=64, exploration=1.4, mode='uct', max_nodes=200000, seed=0):
+        if mode not in ('uct', 'puct'):
+            raise ValueError(f"Unknown selection mode: {mode}")
+        self.batch = batch
+        self.exploration = exploration
+        self.mode = mode
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.playouts = 0
+        self._root = None
+        self._board = None
+        self._seed = seed
+        self._rng = np.random.default_rng(seed) if np is not None else None
+        self._random = random.Random(seed)
+
+    def reset(self):
+        """Drops the whole tree."""
+        self._root = None
+        self._board = None
+        self.nodes = 0
+
+    def _countNodes(self, node):
+        count = 0
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            count += 1
+            if node.children:
+                stack.extend(node.children.values())
+        return count
+
+    def _reroot(self, bitboard):
+        #Keeps the subtree of bitboard if it follows on from the last root.
+        #A board read from a list has no history, and the same history can
+        #follow on from different starting positions, so the moves since the
+        #last root are replayed and the position they reach must be bitboard.
+        old = self._board
+        if (old is None or old.geometry is not bitboard.geometry
+                or not bitboard.history
+                or bitboard.history[:len(old.history)] != old.history):
+            return False
+        node = self._root
+        board = old.copy()
+        for cell in bitboard.history[len(old.history):]:
+            column = cell % old.geometry.columns
+            if not node.children or column not in node.children:
+                return False
+            node = node.children[column]
+            board.play(column)
+        if (node.terminal is not None or board.bits != bitboard.bits
+                or board.key != bitboard.key or board.who != bitboard.who):
+            return False
+        self._root = node
+        self._board = bitboard.copy()
+        self.nodes = self._countNodes(node)
+        return True
+
+    def _expand(self, node, board):
+        geometry = board.geometry
+        weights = geometry.cellWeights
+        columns = [column for column in geometry.centreOrder if board.legal >> column & 1]
+        total = sum(weights[board.heights[column] * geometry.columns + column] for column in columns)
+        node.children = {}
+        for column in columns:
+            prior = weights[board.heights[column] * geometry.columns + column] / total
+            cell = board.play(column)
+            terminal = None
+            if board.wonAfter(cell):
+                terminal = 3 - board.who
+            elif not board.legal:
+                terminal = 0
+            board.undo()
+            node.children[column] = _TreeNode(prior, terminal)
+        self.nodes += len(columns)
+
+    def _select(self, node):
+        #The child with the best score for the player to move
+        log_visits = math.log(node.visits + 1)
+        sqrt_visits = math.sqrt(node.visits + 1)
+        best = None
+        best_score = -1.0
+        for column, child in node.children.items():
+            if child.terminal is not None and child.terminal != 0:
+                #A move that wins at once is always best
+                return column, child
+            if self.mode == 'uct':
+                if not child.visits:
+                    return column, child
+                score = (child.value / child.visits
+                         + self.exploration * math.sqrt(log_visits / child.visits))
+            else:
+                mean = child.value / child.visits if child.visits else 0.5
+                score = mean + self.exploration * child.prior * sqrt_visits / (1 + child.visits)
+            if score > best_score:
+                best, best_score = (column, child), score
+        return best
+
+    def search(self, bitboard, time_ms=200, playouts=None):
+        """
+        Grows the tree for a position until the budget runs out.
+
+        Args:
+            bitboard (BitBoard): The position to search. It is not changed.
+            time_ms (float): Time budget in milliseconds, or None for no limit.
+            playouts (int): Random games to play, or None for no limit.
+                            At least one of the budgets must be set.
+
+        Returns:
+            dict: 'Move' (the collumn number visited most), 'Value' (its
+                  share of wins, draws counting half), 'Visits', 'Playouts',
+                  'Reused' (games already below the root from earlier
+                  searches), 'Nodes', 'Time' and 'Playouts/sec'.
+
+        Raises:
+            GameOverError: If there are no valid moves.
+            ValueError: If neither budget is set.
+        """
+        if time_ms is None and playouts is None:
+            raise ValueError("MCTS needs a time or playout budget")
+        if not bitboard.legal:
+            raise GameOverError("No valid moves left. The board is full.")
+        started = time.perf_counter()
+        deadline = started + time_ms / 1000 if time_ms is not None else None
+
+        if not self._reroot(bitboard):
+            self._root = _TreeNode(1.0)
+            self._board = bitboard.copy()
+            self.nodes = 1
+        root = self._root
+        reused = root.visits
+        if root.children is None:
+            self._expand(root, self._board.copy())
+
+        self.playouts = 0
+        while playouts is None or self.playouts < playouts:
+            if deadline is not None and time.perf_counter() > deadline and self.playouts:
+                break
+            if any(child.terminal not in (None, 0) for child in root.children.values()):
+                break
+            size = self.batch if playouts is None else min(self.batch, playouts - self.playouts)
+            paths = []
+            leaves = []
+            for _ in range(size):
+                board = self._board.copy()
+                node = root
+                path = [node]
+                while node.terminal is None:
+                    if node.children is None:
+                        if not node.visits or self.nodes >= self.max_nodes:
+                            break
+                        self._expand(node, board)
+                    column, node = self._select(node)
+                    board.play(column)
+                    path.append(node)
+                for visited in path:
+                    visited.visits += 1
+                paths.append(path)
+                leaves.append(board if node.terminal is None else None)
+            self._backup(paths, leaves)
+            self.playouts += size
+
+        column, child = max(root.children.items(),
+                            key=lambda item: (item[1].terminal not in (None, 0), item[1].visits))
+        elapsed = time.perf_counter() - started
+        return {'Move': column, 'Value': child.value / child.visits if child.visits else 0.0,
+                'Visits': child.visits, 'Playouts': self.playouts, 'Reused': reused,
+                'Nodes': self.nodes, 'Time': elapsed,
+                'Playouts/sec': self.playouts / elapsed if elapsed > 0 else 0.0}
+
+    def _backup(self, paths, leaves):
+        #Plays out the unfinished leaves and credits every path with its
+        #result; the visits were counted when the paths were chosen
+        unfinished = [board for board in leaves if board is not None]
+        if not unfinished:
+            results = []
+        elif np is not None:
+            results = rolloutBatch(unfinished, self._rng).tolist()
+        else:
+            results = [_rolloutScalar(board, self._random) for board in unfinished]
+        results = iter(results)
+        mover = 3 - self._board.who
+        for path, board in zip(paths, leaves):
+            winner = next(results) if board is not None else path[-1].terminal
+            player = mover
+            for node in path:
+                if winner == 0:
+                    node.value += 0.5
+                elif winner == player:
+                    node.value += 1.0
+                player = 3 - player
+
+
+_defaultMCTS = None
+
+
+def mctsMove(game, time_ms=200, playouts=None, player=None):
+    """
+    Chooses a move by Monte Carlo tree search and reports how it went.
+
+    Args:
+        game (dict): The current game state.
+        time_ms (float): Time budget in milliseconds, or None for no limit.
+        playouts (int): Random games to play, or None for no limit.
+        player (MCTS): Player to search with. By default a shared player is
+                       used, so its tree carries over between moves.
+
+    Returns:
+        dict: As for MCTS.search, with 'Move' in the form 'Xx'.
+
+    Raises:
+        GameOverError: If no valid moves remain.
+    """
+    global _defaultMCTS
+    if player is None:
+        if _defaultMCTS is None:
+            _defaultMCTS = MCTS()
+        player = _defaultMCTS
+    bitboard = getBitBoard(game)
+    result = player.search(bitboard, time_ms, playouts)
+    result['Move'] = bitboard.geometry.moveNames[result['Move']]
+    return result
+
+
+def benchmarkRollouts(count=4096, plies=6, seed=0):
+    """
+    Prints how many random games per second are played out from early
+    positions, in batches on arrays and one at a time on bitboards.
+
+    Args:
+        count (int): Number of games.
+        plies (int): Random moves made before the games are played out.
+        seed (int): Seed for the positions and the games.
+
+    Returns:
+        dict: 'Batched' and 'Scalar' games per second.
+    """
+    _requireNumpy('benchmarkRollouts')
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        bitboard = BitBoard()
+        for _ in range(plies):
+            bitboard.play(rng.choice([c for c in range(bitboard.geometry.columns) if bitboard.canPlay(c)]))
+        positions.append(bitboard)
+    scalar = positions[:max(1, count // 8)]
+
+    started = time.perf_counter()
+    rolloutBatch(positions, np.random.default_rng(seed))
+    batched = count / (time.perf_counter() - started)
+    started = time.perf_counter()
+    for bitboard in scalar:
+        _rolloutScalar(bitboard, rng)
+    single = len(scalar) / (time.perf_counter() - started)
+    print(f"Batched: {batched:,.0f} playouts/sec, one at a time: {single:,.0f} playouts/sec "
+          f"({batched / single:.1f}x)")
+    return {'Batched': batched, 'Scalar': single}
+
+###############################################################################
+
+
+###############################################################################
+# Pondering
+#
+# While a person chooses a move, the engine searches the positions after
+# each of their possible moves in a background thread: the likeliest first,
+# as deep as the computer's own searches have been reaching, then all of
+# them round robin one ply deeper at a time. The thread has the processor
+# to itself, as the main thread is waiting in input().
+#
+# Once the move is made, a position pondered that deep is answered at once.
+# Otherwise the time already spent on it counts towards the computer's
+# budget, and its search finds the pondered results in the engine's
+# transposition table. The entries for the other positions are left there.
+# Every search starts a new generation, so they are no older than the
+# pondered ones, but like any entry from an earlier search each holds its
+# slot only until a result of the new search is stored there.
+
+class Ponderer:
+    """
+    Searches the computer's possible positions on the opponent's time.
+
+    Attributes:
+        engine (Engine): The engine pondering and then searching.
+        time_ms (float): The computer's budget per move.
+        results (dict): Zobrist key of each position pondered to
+                        (search result, seconds spent on it).
+        depth (int): Depth the computer's searches have been reaching
+                     within time_ms, or 0 before the first.
+        hits (int): Moves answered for a position that was pondered.
+        misses (int): Moves answered for one that was not.
+    """
+
+    def __init__(self, engine=None, time_ms=200):
+        global _defaultEngine
+        if engine is None:
+            if _defaultEngine is None:
+                _defaultEngine = Engine()
+            engine = _defaultEngine
+        self.engine = engine
+        self.time_ms = time_ms
+        self.results = {}
+        self.depth = 0
+        self.hits = 0
+        self.misses = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, game):
+        """
+        Starts pondering the positions after each move of the player to
+        move in game. Any earlier pondering is stopped and forgotten.
+        """
+        self.stop()
+        self.results = {}
+        bitboard = getBitBoard(game).copy()
+        if bitboard.winner() != 0 or not bitboard.legal:
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._ponder, args=(bitboard, self._stop), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops pondering, keeping what was found."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _ponder(self, bitboard, stop):
+        engine = self.engine
+        try:
+            #The opponent's likeliest move is the one the engine would make
+            guess = engine.search(bitboard, None, max_depth=2, stop=stop)['Move']
+        except GameOverError:
+            return
+        replies = [guess] + [column for column in bitboard.geometry.centreOrder
+                             if column != guess and bitboard.canPlay(column)]
+        positions = []
+        for column in replies:
+            position = bitboard.copy()
+            if not position.wonAfter(position.play(column)) and position.legal:
+                positions.append(position)
+        if positions and positions[0].history[-1] % bitboard.geometry.columns == guess:
+            self._search(positions[0], max(1, self.depth), stop)
+        depth = 1
+        while positions and not stop.is_set():
+            finished = []
+            for position in positions:
+                if stop.is_set():
+                    break
+                result = self.results.get(position.key, ({'Depth': 0, 'Score': 0},))[0]
+                if result['Depth'] < depth:
+                    result = self._search(position, depth, stop)
+                #A decided position or a search that ran out of plies needs
+                #no deeper look
+                if abs(result['Score']) > WIN_SCORE - bitboard.geometry.cells or result['Depth'] < depth:
+                    finished.append(position)
+            positions = [position for position in positions if position not in finished]
+            depth += 1
+
+    def _search(self, position, depth, stop):
+        #Searches one position, keeping the deepest result and the total time
+        started = time.perf_counter()
+        result = self.engine.search(position, None, max_depth=depth, stop=stop)
+        spent = time.perf_counter() - started
+        previous, before = self.results.get(position.key, (None, 0.0))
+        if previous is not None and previous['Depth'] > result['Depth']:
+            result = previous
+        self.results[position.key] = (result, before + spent)
+        return result
+
+    def suggest(self, game, time_ms=None):
+        """
+        Suggests a move as suggestMove does, starting from what was found
+        while pondering. Pondering is stopped first.
+
+        Args:
+            game (dict): The current game state.
+            time_ms (float): Budget in milliseconds, or None for time_ms.
+
+        Returns:
+            str: A valid move in the form 'Xx'.
+
+        Raises:
+            GameOverError: If no valid moves remain.
+        """
+        self.stop()
+        if time_ms is None:
+            time_ms = self.time_ms
+        bitboard = getBitBoard(game)
+        pondered = self.results.get(bitboard.key)
+        self.results = {}
+        if pondered is None:
+            self.misses += 1
+            return self._searchMove(game, time_ms)
+        self.hits += 1
+        result, spent = pondered
+        decided = abs(result['Score']) > WIN_SCORE - bitboard.geometry.cells
+        if result['Depth'] and (decided or result['Depth'] >= self.depth > 0):
+            return bitboard.geometry.moveNames[result['Move']]
+        #The rest of the search stops at the usual depth, which the
+        #pondered entries in the table make quick to reach
+        return searchMove(game, max(time_ms - spent * 1000, 1), max_depth=self.depth or None,
+                          engine=self.engine)['Move']
+
+    def _searchMove(self, game, time_ms):
+        result = searchMove(game, time_ms, engine=self.engine)
+        if not result['Book'] and 'Solved' not in result:
+            self.depth = result['Depth']
+        return result['Move']
+
+###############################################################################
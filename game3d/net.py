@@ -0,0 +1,539 @@
+"""Value and policy network trained from self-play."""
+
+import math
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the batch functions
+    np = None
+
+from .board import (
+    BitBoard, DEFAULT_GEOMETRY, _benchmarkPositions, _randomGames, getBitBoard, getGeometry)
+from .engine import Engine, Evaluator, _requireNumpy, boardArray, evaluateBoards, searchMove
+
+
+###############################################################################
+# Value network
+#
+# A small network that learns to score positions from games the engine
+# plays against itself. Boards are encoded as two planes of cells, the
+# pieces of the player to move and those of the other player, so a stack
+# of N boards is an array of shape (N, 2, layers, rows, cols). Two fully
+# connected ReLU layers lead to a value head (tanh, the expected result
+# for the player to move) and a policy head (a softmax over collumns, the
+# move the engine would play). Everything is plain NumPy.
+#
+# In a search the network is used through a NetEvaluator, which the Engine
+# hands all the leaves below a node at once, and which caches the value of
+# every position it has scored by Zobrist key.
+
+#Network values are in (-1, 1); the search works in whole points
+NET_SCALE = 1000
+
+
+def _planes(pairs, geometry):
+    #(N, 2, layers, rows, cols) uint8 planes from (mine, theirs) bitmasks
+    size = (geometry.cells + 7) // 8
+    data = b''.join(mine.to_bytes(size, 'little') + theirs.to_bytes(size, 'little')
+                    for mine, theirs in pairs)
+    packed = np.frombuffer(data, dtype=np.uint8).reshape(len(pairs), 2, size)
+    cells = np.unpackbits(packed, axis=2, bitorder='little')[:, :, :geometry.cells]
+    return cells.reshape(len(pairs), 2, geometry.layers, geometry.rows, geometry.cols)
+
+
+def encodePlanes(positions):
+    """
+    Encodes positions for a ValueNet.
+
+    Args:
+        positions (list): Games or BitBoards, all of one geometry.
+
+    Returns:
+        numpy.ndarray: Array of shape (N, 2, layers, rows, cols) and dtype
+                       uint8. Plane 0 holds the pieces of the player to
+                       move and plane 1 the other player's.
+    """
+    _requireNumpy('encodePlanes')
+    bitboards = [position if isinstance(position, BitBoard) else getBitBoard(position)
+                 for position in positions]
+    geometry = bitboards[0].geometry if bitboards else DEFAULT_GEOMETRY
+    return _planes([(bitboard.bits[bitboard.who], bitboard.bits[3 - bitboard.who])
+                    for bitboard in bitboards], geometry)
+
+
+class ValueNet:
+    """
+    Value and policy network for one board geometry.
+
+    Attributes:
+        geometry (Geometry): Size of the boards it scores.
+        hidden (tuple): Width of each hidden layer.
+        params (dict): 'W1', 'b1', 'W2', 'b2', 'Wv', 'bv', 'Wp' and 'bp'
+                       float32 arrays.
+    """
+
+    def __init__(self, geometry=DEFAULT_GEOMETRY, hidden=(128, 64), seed=0):
+        _requireNumpy('ValueNet')
+        self.geometry = geometry
+        self.hidden = tuple(hidden)
+        rng = np.random.default_rng(seed)
+        inputs = 2 * geometry.cells
+        first, second = self.hidden
+
+        def layer(fan_in, fan_out):
+            #He initialisation for the ReLU layers
+            return (rng.standard_normal((fan_in, fan_out)) * math.sqrt(2 / fan_in)).astype(np.float32)
+
+        self.params = {'W1': layer(inputs, first), 'b1': np.zeros(first, np.float32),
+                       'W2': layer(first, second), 'b2': np.zeros(second, np.float32),
+                       'Wv': layer(second, 1) * 0.1, 'bv': np.zeros(1, np.float32),
+                       'Wp': layer(second, geometry.columns) * 0.1,
+                       'bp': np.zeros(geometry.columns, np.float32)}
+
+    def _forward(self, planes):
+        #Activations of every layer, kept for training
+        p = self.params
+        x = np.asarray(planes, dtype=np.float32).reshape(len(planes), -1)
+        h1 = np.maximum(x @ p['W1'] + p['b1'], 0)
+        h2 = np.maximum(h1 @ p['W2'] + p['b2'], 0)
+        value = np.tanh(h2 @ p['Wv'] + p['bv'])[:, 0]
+        logits = h2 @ p['Wp'] + p['bp']
+        return x, h1, h2, value, logits
+
+    def predict(self, planes, chunk=4096):
+        """
+        Scores a stack of encoded boards.
+
+        Args:
+            planes (numpy.ndarray): Array of shape (N, 2, layers, rows, cols),
+                                    as from encodePlanes.
+            chunk (int): Boards handled per step, limiting memory use.
+
+        Returns:
+            tuple: (values, policy). values (N,) is the expected result for
+                   the player to move, from -1 (loss) to 1 (win); policy
+                   (N, collumns) is the probability of each move.
+
+        Raises:
+            TypeError: If planes does not have the right shape.
+        """
+        geometry = self.geometry
+        if np.ndim(planes) != 5 or np.shape(planes)[1:] != (2, geometry.layers, geometry.rows, geometry.cols):
+            raise TypeError("Invalid board structure.")
+        values = np.empty(len(planes), np.float32)
+        policy = np.empty((len(planes), geometry.columns), np.float32)
+        for low in range(0, len(planes), chunk):
+            _, _, _, value, logits = self._forward(planes[low:low + chunk])
+            logits = logits - logits.max(axis=1, keepdims=True)
+            odds = np.exp(logits)
+            values[low:low + chunk] = value
+            policy[low:low + chunk] = odds / odds.sum(axis=1, keepdims=True)
+        return values, policy
+
+    def save(self, path):
+        """Saves the network with numpy.savez."""
+        geometry = self.geometry
+        np.savez(path, dimensions=np.array([geometry.layers, geometry.rows, geometry.cols, geometry.win]),
+                 hidden=np.array(self.hidden), **self.params)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a network written by save."""
+        _requireNumpy('ValueNet')
+        with np.load(path) as data:
+            net = cls(getGeometry(*map(int, data['dimensions'])), tuple(map(int, data['hidden'])))
+            for name in net.params:
+                if data[name].shape != net.params[name].shape:
+                    raise ValueError(f"{path}: {name} has shape {data[name].shape}, "
+                                     f"expected {net.params[name].shape}")
+                net.params[name] = data[name].astype(np.float32)
+        return net
+
+
+class NetEvaluator:
+    """
+    Leaf evaluator for an Engine, scoring positions with a ValueNet. Scores
+    are cached by Zobrist key, so positions met again (as they are at each
+    iteration of a deepening search) are not scored twice.
+
+    Attributes:
+        net (ValueNet): The network.
+        capacity (int): Scores kept before the cache is emptied.
+        hits (int): Positions answered from the cache.
+        evaluated (int): Positions scored by the network.
+        batches (int): Calls to the network.
+    """
+
+    def __init__(self, net, capacity=1 << 18):
+        self.net = net
+        self.capacity = capacity
+        self.cache = {}
+        self.hits = 0
+        self.evaluated = 0
+        self.batches = 0
+        self._board = None
+
+    def reset(self, bitboard):
+        self._board = bitboard
+
+    def played(self, bitboard, cell):
+        pass
+
+    def undone(self, bitboard, cell):
+        pass
+
+    def score(self, who):
+        """Returns the score of the position being searched for player who."""
+        board = self._board
+        score = self.scorePositions([(board.key, board.bits[board.who], board.bits[3 - board.who])],
+                                    board.geometry)[0]
+        return score if who == board.who else -score
+
+    def scorePositions(self, positions, geometry):
+        """
+        Scores many positions with one call to the network.
+
+        Args:
+            positions (list): (key, mine, theirs) for each position: its
+                              Zobrist key and the bitmasks of the pieces of
+                              the player to move and of the other player.
+            geometry (Geometry): Their board size.
+
+        Returns:
+            list: The score of each for the player to move, in points.
+        """
+        cache = self.cache
+        scores = [cache.get(key) for key, mine, theirs in positions]
+        missing = [index for index, score in enumerate(scores) if score is None]
+        self.hits += len(scores) - len(missing)
+        if missing:
+            values, _ = self.net.predict(_planes([positions[index][1:] for index in missing], geometry))
+            if len(cache) + len(missing) > self.capacity:
+                cache.clear()
+            for index, value in zip(missing, (values * NET_SCALE).round().astype(int).tolist()):
+                scores[index] = cache[positions[index][0]] = value
+            self.evaluated += len(missing)
+            self.batches += 1
+        return scores
+
+    def order(self, bitboard, columns):
+        """Returns columns sorted by the network's policy, likeliest first."""
+        if len(columns) < 2:
+            return columns
+        _, policy = self.net.predict(encodePlanes([bitboard]))
+        return sorted(columns, key=lambda column: -policy[0, column])
+
+
+def _augmented(planes, moves, geometry):
+    #Every rotation and reflection of the footprint of each position, with
+    #its move mapped too (moves of -1 are left alone)
+    count = len(planes)
+    flat = planes.reshape(count, 2, geometry.layers, geometry.columns)
+    images = []
+    targets = []
+    for perm, inverse in zip(geometry.symmetries, geometry.inverseSymmetries):
+        images.append(flat[:, :, :, list(inverse)].reshape(planes.shape))
+        targets.append(np.where(moves >= 0, np.array(perm)[np.maximum(moves, 0)], -1))
+    return np.concatenate(images), np.concatenate(targets)
+
+
+def selfPlayData(games=100, max_depth=2, opening=4, explore=0.1, seed=0, net=None,
+                 geometry=DEFAULT_GEOMETRY, quiet=True):
+    """
+    Plays the engine against itself and records every position.
+
+    Args:
+        games (int): Number of games.
+        max_depth (int): Search depth for each move.
+        opening (int): Plies played at random at the start of each game.
+        explore (float): Chance of a random move after the opening.
+        seed (int): Seed for the random moves.
+        net (ValueNet): Scores the engine's leaves, or None for the default
+                        score.
+        geometry (Geometry): Board size and win length.
+        quiet (bool): If False, progress is printed.
+
+    Returns:
+        dict: 'Planes' (N, 2, layers, rows, cols) uint8 as from
+              encodePlanes, 'Moves' (N,) the collumn the engine chose, or
+              -1 for a random move, and 'Values' (N,) the result for the
+              player to move: 1 won, 0 drawn, -1 lost.
+    """
+    _requireNumpy('selfPlayData')
+    rng = random.Random(seed)
+    engine = Engine(evaluator=NetEvaluator(net) if net is not None else None)
+    pairs = []
+    moves = []
+    values = []
+    for number in range(games):
+        bitboard = BitBoard(geometry)
+        players = []
+        result = -1
+        while bitboard.legal:
+            open_columns = [column for column in range(geometry.columns) if bitboard.canPlay(column)]
+            if len(bitboard.history) < opening or rng.random() < explore:
+                column = rng.choice(open_columns)
+                moves.append(-1)
+            else:
+                column = engine.search(bitboard, None, max_depth)['Move']
+                moves.append(column)
+            pairs.append((bitboard.bits[bitboard.who], bitboard.bits[3 - bitboard.who]))
+            players.append(bitboard.who)
+            if bitboard.wonAfter(bitboard.play(column)):
+                result = players[-1]
+                break
+        values += [0 if result == -1 else 1 if player == result else -1 for player in players]
+        if not quiet:
+            print(f"Game {number + 1}: {len(players)} moves, "
+                  f"{'a draw' if result == -1 else f'player {result} won'}")
+    return {'Planes': _planes(pairs, geometry), 'Moves': np.array(moves, dtype=np.int64),
+            'Values': np.array(values, dtype=np.float32)}
+
+
+def trainValueNet(net, data, epochs=10, batch=256, rate=1e-3, policy_weight=1.0, decay=1e-4,
+                  augment=True, seed=0, quiet=False):
+    """
+    Trains a network on recorded positions with Adam.
+
+    The value head learns the results by squared error, and the policy head
+    the engine's moves by cross entropy (random moves are left out).
+
+    Args:
+        net (ValueNet): The network, changed in place.
+        data (dict): Positions as returned by selfPlayData.
+        epochs (int): Passes over the data.
+        batch (int): Positions per step.
+        rate (float): Adam step size.
+        policy_weight (float): Weight of the policy loss against the value
+                               loss.
+        decay (float): L2 penalty on the weights.
+        augment (bool): If True, train on every rotation and reflection of
+                        each position too.
+        seed (int): Seed for shuffling.
+        quiet (bool): If True, nothing is printed.
+
+    Returns:
+        list: For each epoch, a dict of 'Epoch', 'Value loss', 'Policy loss'
+              and 'Policy accuracy'.
+    """
+    geometry = net.geometry
+    planes, moves, values = data['Planes'], data['Moves'], data['Values']
+    if augment:
+        planes, moves = _augmented(planes, moves, geometry)
+        values = np.tile(values, len(geometry.symmetries))
+    rng = np.random.default_rng(seed)
+    params = net.params
+    first_moment = {name: np.zeros_like(value) for name, value in params.items()}
+    second_moment = {name: np.zeros_like(value) for name, value in params.items()}
+    steps = 0
+    history = []
+    for epoch in range(epochs):
+        order = rng.permutation(len(planes))
+        value_loss = policy_loss = correct = policy_count = 0.0
+        for low in range(0, len(order), batch):
+            index = order[low:low + batch]
+            size = len(index)
+            target = values[index]
+            move = moves[index]
+            x, h1, h2, value, logits = net._forward(planes[index])
+
+            #Loss gradients at the heads
+            error = value - target
+            value_loss += float((error ** 2).sum())
+            d_value = (2 * error * (1 - value ** 2) / size)[:, None]
+            logits = logits - logits.max(axis=1, keepdims=True)
+            odds = np.exp(logits)
+            odds /= odds.sum(axis=1, keepdims=True)
+            known = move >= 0
+            d_logits = np.zeros_like(odds)
+            if known.any():
+                chosen = odds[known, move[known]]
+                policy_loss += float(-np.log(np.maximum(chosen, 1e-12)).sum())
+                correct += float((odds[known].argmax(axis=1) == move[known]).sum())
+                policy_count += int(known.sum())
+                d_logits[known] = odds[known]
+                d_logits[known, move[known]] -= 1
+                d_logits *= policy_weight / size
+
+            #Back through the layers
+            grads = {'Wv': h2.T @ d_value, 'bv': d_value.sum(axis=0),
+                     'Wp': h2.T @ d_logits, 'bp': d_logits.sum(axis=0)}
+            d_h2 = (d_value @ params['Wv'].T + d_logits @ params['Wp'].T) * (h2 > 0)
+            grads['W2'] = h1.T @ d_h2
+            grads['b2'] = d_h2.sum(axis=0)
+            d_h1 = (d_h2 @ params['W2'].T) * (h1 > 0)
+            grads['W1'] = x.T @ d_h1
+            grads['b1'] = d_h1.sum(axis=0)
+
+            steps += 1
+            for name, grad in grads.items():
+                if name[0] == 'W':
+                    grad = grad + decay * params[name]
+                first_moment[name] = 0.9 * first_moment[name] + 0.1 * grad
+                second_moment[name] = 0.999 * second_moment[name] + 0.001 * grad ** 2
+                corrected = first_moment[name] / (1 - 0.9 ** steps)
+                scale = np.sqrt(second_moment[name] / (1 - 0.999 ** steps)) + 1e-8
+                params[name] -= (rate * corrected / scale).astype(np.float32)
+
+        record = {'Epoch': epoch + 1, 'Value loss': value_loss / len(order),
+                  'Policy loss': policy_loss / policy_count if policy_count else 0.0,
+                  'Policy accuracy': correct / policy_count if policy_count else 0.0}
+        history.append(record)
+        if not quiet:
+            print(f"Epoch {record['Epoch']}: value loss {record['Value loss']:.4f}, "
+                  f"policy loss {record['Policy loss']:.4f}, "
+                  f"policy accuracy {record['Policy accuracy']:.1%}")
+    return history
+
+
+def trainFromSelfPlay(path, rounds=3, games=100, max_depth=2, epochs=10, hidden=(128, 64),
+                      geometry=DEFAULT_GEOMETRY, seed=0, quiet=False):
+    """
+    Trains a network from scratch. Each round the engine plays games
+    against itself, scoring its leaves with the network as trained so far
+    (the default score in the first round), and the network is trained on
+    every position recorded. The network is saved after each round.
+
+    Args:
+        path (str): File to save the network to (see ValueNet.save).
+        rounds (int): Rounds of self-play and training.
+        games (int): Games played each round.
+        max_depth (int): Search depth for the self-play moves.
+        epochs (int): Training passes over the data each round.
+        hidden (tuple): Width of each hidden layer.
+        geometry (Geometry): Board size and win length.
+        seed (int): Seed for the network, the games and the training.
+        quiet (bool): If True, nothing is printed.
+
+    Returns:
+        ValueNet: The trained network.
+    """
+    net = ValueNet(geometry, hidden, seed)
+    data = None
+    for number in range(rounds):
+        fresh = selfPlayData(games, max_depth, seed=seed + number, net=net if number else None,
+                             geometry=geometry)
+        if data is None:
+            data = fresh
+        else:
+            data = {name: np.concatenate([data[name], fresh[name]]) for name in data}
+        if not quiet:
+            print(f"Round {number + 1}: {len(fresh['Values'])} new positions, {len(data['Values'])} in all")
+        trainValueNet(net, data, epochs, seed=seed + number, quiet=quiet)
+        net.save(path)
+    return net
+
+
+_valueNet = None
+_netEngine = None
+
+
+def setValueNet(net):
+    """
+    Sets the network netMove (and the 'net' strategy) searches with.
+
+    Args:
+        net (ValueNet or str): A network, a file saved with ValueNet.save,
+                               or None for none.
+    """
+    global _valueNet, _netEngine
+    _valueNet = ValueNet.load(net) if isinstance(net, str) else net
+    _netEngine = None
+
+
+def _newNetEngine():
+    #An engine scoring leaves with the network set now, or None if there is
+    #none, which netMove reports
+    if _valueNet is None:
+        return None
+    return Engine(evaluator=NetEvaluator(_valueNet))
+
+
+def netMove(game, time_ms=200, max_depth=None, max_nodes=None, engine=None):
+    """
+    Suggests a move like suggestMove, with the search scoring its leaves
+    with the network set with setValueNet. Without an engine the one kept
+    between calls is used, so the network's scores are cached along with
+    its table.
+
+    Raises:
+        GameOverError: If no valid moves remain.
+        ValueError: If no network has been set.
+    """
+    global _netEngine
+    if _valueNet is None:
+        raise ValueError("No value network set; see setValueNet")
+    if engine is None:
+        if _netEngine is None:
+            _netEngine = _newNetEngine()
+        engine = _netEngine
+    return searchMove(game, time_ms, max_depth, max_nodes, engine=engine)['Move']
+
+
+def benchmarkValueNet(count=4096, net=None, seed=0):
+    """
+    Compares the network's throughput with the hand-written evaluations on
+    random positions, and prints boards per second.
+
+    Args:
+        count (int): Number of positions.
+        net (ValueNet): The network, or None for an untrained one (as fast
+                        as a trained one).
+        seed (int): Seed for the positions.
+
+    Returns:
+        dict: Boards per second for 'Evaluator' (threat counting, one board
+              at a time), 'evaluateBoards' (the static score, batched),
+              'ValueNet (1)', 'ValueNet (36)' and 'ValueNet (N)' (batches of
+              1, 36 and count boards), 'NetEvaluator (cached)', and
+              search nodes per second with 'Engine' and 'Engine + net'.
+    """
+    _requireNumpy('benchmarkValueNet')
+    net = net or ValueNet()
+    games = _randomGames(count, seed)
+    bitboards = [getBitBoard(game) for game in games]
+    planes = encodePlanes(bitboards)
+    results = {}
+
+    def rate(name, function, boards):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        results[name] = boards / elapsed if elapsed > 0 else float('inf')
+
+    evaluator = Evaluator()
+
+    def hand():
+        for bitboard in bitboards:
+            evaluator.reset(bitboard)
+            evaluator.score(bitboard.who)
+
+    rate('Evaluator', hand, count)
+    boards = boardArray(games)
+    rate('evaluateBoards', lambda: evaluateBoards(boards), count)
+    single = min(count, 256)
+    rate('ValueNet (1)', lambda: [net.predict(planes[n:n + 1]) for n in range(single)], single)
+    rate('ValueNet (36)', lambda: [net.predict(planes[n:n + 36]) for n in range(0, count, 36)], count)
+    rate('ValueNet (N)', lambda: net.predict(planes), count)
+    rate('Encode + ValueNet (N)', lambda: net.predict(encodePlanes(bitboards)), count)
+    cached = NetEvaluator(net)
+    positions = [(bitboard.key, bitboard.bits[bitboard.who], bitboard.bits[3 - bitboard.who])
+                 for bitboard in bitboards]
+    cached.scorePositions(positions, net.geometry)
+    rate('NetEvaluator (cached)', lambda: cached.scorePositions(positions, net.geometry), count)
+
+    opening = getBitBoard(_benchmarkPositions(seed)['opening'])
+    for name, engine in (('Engine', Engine()), ('Engine + net', Engine(evaluator=NetEvaluator(net)))):
+        result = engine.search(opening, None, 4)
+        results[name] = result['Nodes/sec']
+
+    base = results['Evaluator']
+    for name, boards_per_sec in results.items():
+        unit = 'nodes/sec' if name.startswith('Engine') else 'boards/sec'
+        note = '' if name.startswith('Engine') else f" ({boards_per_sec / base:.1f}x)"
+        print(f"{name:<22}: {boards_per_sec:>12,.0f} {unit}{note}")
+    return results
+
+###############################################################################
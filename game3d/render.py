@@ -0,0 +1,202 @@
+"""Incremental board rendering for terminals."""
+
+import time
+
+from .board import (
+    DEFAULT_GEOMETRY, _boardText, _geometryOf, _randomMoveLists, getBitBoard, makeMove,
+    newGame, printBoard)
+
+
+###############################################################################
+# Incremental rendering
+#
+# A BoardRenderer keeps the text of the last board it rendered and rewrites
+# only the cells that changed since. For the board of a game the changed
+# cells come straight from the bitboard; a plain board list is compared
+# cell by cell. The text is exactly that of printBoard. For terminals,
+# ansiDiff gives the escape sequences that repaint just the changed cells
+# of a board printed earlier.
+
+_cellOffsetTables = {}
+
+
+def _cellOffsets(geometry=DEFAULT_GEOMETRY):
+    #Position in the printed text of each cell, by bit index. The template
+    #holds the cells row by row, each row running through the levels.
+    key = (geometry.layers, geometry.rows, geometry.cols)
+    if key not in _cellOffsetTables:
+        header, rows = _boardText(geometry)
+        marked = header + rows % (('\0',) * geometry.cells)
+        positions = [index for index, char in enumerate(marked) if char == '\0']
+        order = [geometry.cell(level, row, col) for row in range(geometry.rows)
+                 for level in range(geometry.layers) for col in range(geometry.cols)]
+        offsets = [0] * geometry.cells
+        for cell, position in zip(order, positions):
+            offsets[cell] = position
+        _cellOffsetTables[key] = offsets
+    return _cellOffsetTables[key]
+
+
+class BoardRenderer:
+    """
+    Renders boards as printBoard does, reusing the previous render.
+
+    Attributes:
+        geometry (Geometry): Size of the board last rendered. A board of
+                             another size is rendered in full.
+        changed (list): Bit indices (k*36 + j*6 + i) of the cells that the
+                        last call changed.
+    """
+
+    def __init__(self, geometry=DEFAULT_GEOMETRY):
+        self.geometry = geometry
+        header, rows = _boardText(geometry)
+        blank = header + rows % ((' ',) * geometry.cells)
+        self._offsets = _cellOffsets(geometry)
+        self._header = len(header)
+        self._lines = len(blank.splitlines())
+        self._row_width = (len(blank) - len(header)) // geometry.rows
+        self._text = bytearray(blank.encode('ascii'))
+        self._values = [0] * geometry.cells
+        self._bits = (0, 0)
+        self.changed = []
+
+    def _update(self, board):
+        #Brings the text up to date, or returns False for boards that only
+        #printBoard can render
+        game = getattr(board, 'game', None)
+        changed = []
+        text = self._text
+        offsets = self._offsets
+        values = self._values
+        geometry = self.geometry
+        if game is not None and game.tracked and dict.get(game, 'Board') is board:
+            bitboard = getBitBoard(game)
+            if bitboard.geometry is not geometry:
+                return False
+            bits1, bits2 = bitboard.bits[1], bitboard.bits[2]
+            if self._bits is None:
+                #The text was last drawn from a plain list, so there are no
+                #bits to compare with and every cell is redrawn
+                diff = (1 << geometry.cells) - 1
+            elif (bits1, bits2) == self._bits:
+                self.changed = changed
+                return True
+            else:
+                diff = (bits1 ^ self._bits[0]) | (bits2 ^ self._bits[1])
+            while diff:
+                low = diff & -diff
+                cell = low.bit_length() - 1
+                diff ^= low
+                value = 1 if bits1 & low else 2 if bits2 & low else 0
+                text[offsets[cell]] = 48 + value if value else 32
+                values[cell] = value
+                changed.append(cell)
+            self._bits = (bits1, bits2)
+        else:
+            if not (isinstance(board, list) and len(board) == geometry.layers and
+                    all(isinstance(layer, list) and len(layer) == geometry.rows for layer in board) and
+                    all(isinstance(row, list) and len(row) == geometry.cols for layer in board for row in layer)):
+                return False
+            cell = 0
+            for layer in board:
+                for row in layer:
+                    for value in row:
+                        if value is not values[cell] and value != values[cell]:
+                            if value.__class__ is not int or not 0 <= value <= 2:
+                                return False
+                            text[offsets[cell]] = 48 + value if value else 32
+                            values[cell] = value
+                            changed.append(cell)
+                        cell += 1
+            self._bits = None
+        self.changed = changed
+        return True
+
+    def _reset(self, board):
+        #Starts again from a blank board the size of this one
+        self.__init__(_geometryOf(board))
+
+    def render(self, board):
+        """
+        Returns the same string as printBoard(board).
+
+        Raises:
+            TypeError: If board is not a 3D list.
+        """
+        if not self._update(board):
+            text = printBoard(board)
+            self._reset(board)
+            return text
+        return self._text.decode('ascii')
+
+    def ansiDiff(self, board):
+        """
+        Returns terminal escape sequences that turn the board last rendered
+        into this one, for a terminal whose cursor is on the line just
+        below the printed board. The cursor is left where it was.
+
+        Raises:
+            TypeError: If board is not a 3D list.
+        """
+        if not self._update(board):
+            #Reprint the whole board over the old one
+            text = f"\x1b[{self._lines}F\x1b[J" + printBoard(board)
+            self._reset(board)
+            return text
+        if not self.changed:
+            return ""
+        parts = ["\x1b7"]
+        text = self._text
+        for cell in self.changed:
+            offset = self._offsets[cell]
+            line, column = divmod(offset - self._header, self._row_width)
+            up = self._lines - (3 + line)
+            parts.append(f"\x1b[{up}F\x1b[{column + 1}G{chr(text[offset])}\x1b8\x1b7")
+        parts[-1] = parts[-1][:-2]
+        return "".join(parts)
+
+
+def benchmarkRendering(count=500, seed=0):
+    """
+    Replays random games, rendering the board after every move with
+    printBoard and with a BoardRenderer, and prints renders per second.
+
+    Args:
+        count (int): Number of random games.
+        seed (int): Seed for the games.
+
+    Returns:
+        dict: Renders per second for 'printBoard', 'BoardRenderer' on game
+              boards and 'BoardRenderer (lists)' on plain board lists.
+    """
+    boards = []
+    for moves in _randomMoveLists(count, seed):
+        game = newGame('A', 'B')
+        boards.append([])
+        for move in moves:
+            game = makeMove(game, move)
+            boards[-1].append(game)
+    renders = sum(len(states) for states in boards)
+    plain = [[[[list(row) for row in layer] for layer in game['Board']] for game in states]
+             for states in boards]
+
+    result = {}
+    started = time.perf_counter()
+    for states in boards:
+        for game in states:
+            printBoard(game['Board'])
+    result['printBoard'] = renders / (time.perf_counter() - started)
+    for name, games in (('BoardRenderer', [[game['Board'] for game in states] for states in boards]),
+                        ('BoardRenderer (lists)', plain)):
+        started = time.perf_counter()
+        for states in games:
+            renderer = BoardRenderer()
+            for board in states:
+                renderer.render(board)
+        result[name] = renders / (time.perf_counter() - started)
+    for name, rate in result.items():
+        print(f"{name:22}: {rate:10,.0f} renders/sec ({rate / result['printBoard']:.1f}x)")
+    return result
+
+###############################################################################
@@ -0,0 +1,282 @@
+"""Asyncio server hosting games over a line protocol."""
+
+import asyncio
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .board import MoveNotMade, findValidMoves, isWinnerAfter, makeMove, newGame
+from .engine import availableCores
+from .strategies import suggestMove
+
+
+###############################################################################
+# Game server
+#
+# An asyncio TCP server hosting many games at once. Each request is one line
+# of text and gets one line back:
+#
+#   NEW <player 1> <player 2>    ->  GAME <id> <result> <who> <engine moves>
+#   MOVE <id> <move>             ->  OK <id> <result> <who> <engine moves>
+#   MOVES <id>                   ->  MOVES <id> <valid moves...>
+#   BOARD <id>                   ->  BOARD <id> <who> <cells, layer by layer>
+#   QUIT <id>                    ->  BYE <id>
+#   anything invalid             ->  ERR <message>
+#
+# <result> is isWinner's value after the request. A player named C is the
+# computer: after a move, the server plays for C until a person is to move
+# or the game is over, and lists those moves comma separated ('-' if none).
+# Engine searches run in a process pool so the event loop never waits.
+# Games are ended when the connection that started them closes.
+
+def _engineMove(game, time_ms):
+    return suggestMove(game, time_ms=time_ms)
+
+
+class GameServer:
+    """
+    Hosts games over a line protocol (see above).
+
+    Attributes:
+        host (str): Address to listen on.
+        port (int): Port to listen on; 0 picks a free port, which is stored
+                    here once the server has started.
+        time_ms (float): Engine budget per computer move.
+        games (dict): Game id to game state.
+        results (dict): Game id to isWinner's value.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, time_ms=100):
+        self.host = host
+        self.port = port
+        self.time_ms = time_ms
+        self.games = {}
+        self.results = {}
+        self._workers = workers
+        self._locks = {}
+        self._next_id = 1
+        self._pool = None
+        self._server = None
+
+    async def start(self):
+        """Starts listening and starts the engine pool."""
+        self._pool = ProcessPoolExecutor(self._workers or availableCores())
+        self._server = await asyncio.start_server(self._client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serveForever(self):
+        """Starts the server if needed and serves until cancelled."""
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stops listening and shuts down the engine pool."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def _client(self, reader, writer):
+        started = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self.handle(line.decode('utf-8', 'replace').strip(), started)
+                writer.write((reply + '\n').encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            #Nobody can play the games of a closed connection any more
+            for game_id in started:
+                await self._endGame(game_id)
+
+    async def handle(self, line, started=None):
+        """
+        Answers one request line.
+
+        Args:
+            line (str): The request, without its newline.
+            started (set): Optional ids of the games started by the caller's
+                           connection; NEW adds to it and QUIT removes from
+                           it.
+
+        Returns:
+            str: The reply, without a newline.
+        """
+        parts = line.split()
+        if not parts:
+            return "ERR empty request"
+        command = parts[0].upper()
+        try:
+            if command == 'NEW' and len(parts) == 3:
+                game_id = self._next_id
+                self._next_id += 1
+                self.games[game_id] = newGame(parts[1], parts[2])
+                self.results[game_id] = 0
+                self._locks[game_id] = asyncio.Lock()
+                if started is not None:
+                    started.add(game_id)
+                async with self._locks[game_id]:
+                    played = await self._playEngine(game_id)
+                return self._status('GAME', game_id, played)
+
+            if len(parts) < 2 or not parts[1].isdigit() or int(parts[1]) not in self.games:
+                return "ERR unknown game"
+            game_id = int(parts[1])
+            game = self.games[game_id]
+
+            if command == 'MOVE' and len(parts) == 3:
+                async with self._locks[game_id]:
+                    #The game may have been quit while this request waited
+                    if game_id not in self.games:
+                        return "ERR unknown game"
+                    game = self.games[game_id]
+                    if self.results[game_id] != 0:
+                        return "ERR game over"
+                    if game[f"Player {game['Who']}"] == 'C':
+                        return "ERR computer to move"
+                    self.games[game_id] = makeMove(game, parts[2])
+                    self.results[game_id] = isWinnerAfter(self.games[game_id], parts[2])
+                    played = await self._playEngine(game_id)
+                return self._status('OK', game_id, played)
+            if command == 'MOVES' and len(parts) == 2:
+                return ' '.join(['MOVES', str(game_id)] + findValidMoves(game['Board']))
+            if command == 'BOARD' and len(parts) == 2:
+                cells = ''.join(str(value) for layer in game['Board'] for row in layer for value in row)
+                return f"BOARD {game_id} {game['Who']} {cells}"
+            if command == 'QUIT' and len(parts) == 2:
+                if not await self._endGame(game_id):
+                    return "ERR unknown game"
+                if started is not None:
+                    started.discard(game_id)
+                return f"BYE {game_id}"
+        except MoveNotMade as e:
+            return f"ERR {e}"
+        except Exception as e:
+            #Any other failure answers this request, not the whole connection
+            return f"ERR {type(e).__name__}: {e}"
+        return "ERR bad request"
+
+    async def _endGame(self, game_id):
+        #Removes a game, returning False if it was already gone. Waits for a
+        #move in progress, so that its engine moves are not written back
+        #after the game is gone.
+        lock = self._locks.get(game_id)
+        if lock is None:
+            return False
+        async with lock:
+            if game_id not in self.games:
+                return False
+            del self.games[game_id], self.results[game_id], self._locks[game_id]
+        return True
+
+    async def _playEngine(self, game_id):
+        #Plays for C until a person is to move or the game is over
+        played = []
+        loop = asyncio.get_running_loop()
+        while self.results[game_id] == 0:
+            game = self.games[game_id]
+            if game[f"Player {game['Who']}"] != 'C':
+                break
+            move = await loop.run_in_executor(self._pool, _engineMove, game, self.time_ms)
+            if game_id not in self.games:
+                break
+            self.games[game_id] = makeMove(game, move)
+            self.results[game_id] = isWinnerAfter(self.games[game_id], move)
+            played.append(move)
+        return played
+
+    def _status(self, word, game_id, played):
+        return (f"{word} {game_id} {self.results[game_id]} {self.games[game_id]['Who']} "
+                f"{','.join(played) or '-'}")
+
+
+def _percentile(ordered, fraction):
+    #Nearest-rank percentile of an already sorted list. The rank is rounded
+    #first so that float error (0.7 * 10 is just over 7) cannot move it up.
+    if not ordered:
+        return 0.0
+    rank = math.ceil(round(fraction * len(ordered), 9)) - 1
+    return ordered[min(len(ordered) - 1, max(0, rank))]
+
+
+async def _loadClient(host, port, games, opponent, rng, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def request(line):
+        started = time.perf_counter()
+        writer.write((line + '\n').encode('utf-8'))
+        await writer.drain()
+        reply = (await reader.readline()).decode('utf-8').split()
+        latencies.append(time.perf_counter() - started)
+        if not reply or reply[0] == 'ERR':
+            raise ConnectionError(f"{line}: {' '.join(reply)}")
+        return reply
+
+    moves = 0
+    try:
+        for _ in range(games):
+            reply = await request(f"NEW load {opponent}")
+            game_id = reply[1]
+            while reply[2] == '0':
+                valid = (await request(f"MOVES {game_id}"))[2:]
+                reply = await request(f"MOVE {game_id} {rng.choice(valid)}")
+                moves += 1
+            await request(f"QUIT {game_id}")
+    finally:
+        writer.close()
+    return moves
+
+
+async def loadTest(host='127.0.0.1', port=8765, concurrency=100, games=1, opponent='C', seed=0):
+    """
+    Plays many games against a GameServer at once, with random moves, and
+    measures how long each request takes.
+
+    Args:
+        host (str): Server address.
+        port (int): Server port.
+        concurrency (int): Number of games in progress at once, one
+                           connection each.
+        games (int): Games each connection plays, one after another.
+        opponent (str): Name of player 2; 'C' makes the server's engine
+                        reply to every move.
+        seed (int): Seed for the random moves.
+
+    Returns:
+        dict: 'Requests', 'Moves', 'Time', 'Requests/sec' and latency
+              percentiles 'p50', 'p90', 'p99' and 'Max' in milliseconds.
+    """
+    latencies = []
+    started = time.perf_counter()
+    moves = await asyncio.gather(*[_loadClient(host, port, games, opponent,
+                                               random.Random(seed + n), latencies)
+                                   for n in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latency * 1000 for latency in latencies)
+    return {'Requests': len(ordered), 'Moves': sum(moves), 'Time': elapsed,
+            'Requests/sec': len(ordered) / elapsed if elapsed > 0 else 0.0,
+            'p50': _percentile(ordered, 0.50), 'p90': _percentile(ordered, 0.90),
+            'p99': _percentile(ordered, 0.99), 'Max': ordered[-1] if ordered else 0.0}
+
+
+def printLoadTest(report, concurrency):
+    """Prints the report returned by loadTest."""
+    print(f"{concurrency} concurrent games: {report['Requests']} requests, {report['Moves']} moves "
+          f"in {report['Time']:.2f}s ({report['Requests/sec']:.0f} requests/sec)")
+    print(f"Latency ms: p50 {report['p50']:.2f}  p90 {report['p90']:.2f}  "
+          f"p99 {report['p99']:.2f}  max {report['Max']:.2f}")
+
+###############################################################################
@@ -0,0 +1,385 @@
+"""Persistent store of many live game sessions."""
+
+import glob
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+from .board import DEFAULT_GEOMETRY, Game, _boardGeometry, applyMove, gameGeometry, makeMove, newGame
+
+
+###############################################################################
+# Session store
+#
+# Keeps many live games without holding them all in memory or rewriting a
+# whole save file per move. Every change is appended to a log (one JSON
+# object per line) and the log is fsynced in batches. Only the most recently
+# used games are kept as game dicts. Of any other session the store only
+# knows where its records are: its line in the snapshot and the offset of
+# its last record in the log, each record naming the offset of the one
+# before it. Such a game is rebuilt on demand by reading back along those
+# records and replaying its moves with applyMove. Every so often the
+# sessions are written to a snapshot (a header line, then one line per
+# session) and a new log is started, so no log grows without bound. A crash
+# loses at most the records written since the last fsync.
+#
+# Logs are numbered, and the snapshot names the log that follows it. A new
+# log is created before the snapshot that names it is put in place, and the
+# old log is only removed afterwards, so after a crash at any point the
+# snapshot and the log it names hold every session exactly once. Any other
+# log left behind is removed when the store is opened.
+
+class SessionStore:
+    """
+    Persistent store of game sessions in a directory.
+
+    Attributes:
+        directory (str): Holds the snapshot and the move log.
+        capacity (int): Most games kept in memory at once.
+        sync_interval (float): Longest time in seconds that a record waits
+                               before being written and fsynced, by a
+                               background timer if no later record does it;
+                               0 fsyncs every record.
+        sync_records (int): Records that trigger an fsync at once.
+        snapshot_every (int): Log records between snapshots.
+        generation (int): Number of the current log.
+        hits (int): Requests for a game that was in memory.
+        misses (int): Requests that needed a replay.
+        evictions (int): Games dropped from memory.
+        syncs (int): Calls to fsync on the log.
+        restore_time (float): Total seconds spent replaying games.
+        restore_max (float): Longest single replay in seconds.
+    """
+
+    SNAPSHOT = 'sessions.json'
+    LOG = 'sessions.{}.log'
+
+    def __init__(self, directory, capacity=1024, sync_interval=0.05, sync_records=256,
+                 snapshot_every=10000):
+        self.directory = directory
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        self.sync_records = sync_records
+        self.snapshot_every = snapshot_every
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.syncs = 0
+        self.restore_time = 0.0
+        self.restore_max = 0.0
+        #Session id to (offset of its snapshot line or None, offset of its
+        #last log record or None)
+        self._sessions = {}
+        self._games = OrderedDict()
+        self._next_id = 1
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._logged = 0
+        self._size = 0
+        self._snapshot = None
+        #The timer thread writes the log too, so every use of it holds the lock
+        self._lock = threading.RLock()
+        self._timer = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._log = open(self._logPath(self.generation), 'a', encoding='utf-8', newline='\n')
+        self._reader = open(self._logPath(self.generation), 'rb')
+
+    def _logPath(self, generation):
+        return os.path.join(self.directory, self.LOG.format(generation))
+
+    def _recover(self):
+        #Reads the snapshot, then every complete record of the log it names
+        path = os.path.join(self.directory, self.SNAPSHOT)
+        if os.path.exists(path):
+            self._snapshot = open(path, 'rb')
+            header = json.loads(self._snapshot.readline())
+            self._next_id = header['Next']
+            self.generation = header['Log']
+            offset = self._snapshot.tell()
+            for line in self._snapshot:
+                self._sessions[json.loads(line)[0]] = (offset, None)
+                offset += len(line)
+        #A log from before the snapshot is already in it, and one made for a
+        #snapshot that was never put in place holds no records
+        path = self._logPath(self.generation)
+        for stale in glob.glob(os.path.join(glob.escape(self.directory), self.LOG.format('*'))):
+            if stale != path:
+                os.remove(stale)
+        if not os.path.exists(path):
+            return
+        good = 0
+        with open(path, 'rb') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                self._apply(record, good)
+                self._logged += 1
+                good += len(line)
+        #A record cut short by a crash was never acknowledged; drop it so
+        #that new records do not run on from it
+        if good != os.path.getsize(path):
+            with open(path, 'r+b') as file:
+                file.truncate(good)
+        self._size = good
+
+    def _apply(self, record, offset):
+        session_id = record['Id']
+        if record['Op'] == 'new':
+            self._sessions[session_id] = (None, offset)
+            self._next_id = max(self._next_id, session_id + 1)
+        elif record['Op'] == 'move':
+            self._sessions[session_id] = (self._sessions[session_id][0], offset)
+        elif record['Op'] == 'delete':
+            self._sessions.pop(session_id, None)
+
+    def _write(self, record):
+        with self._lock:
+            line = json.dumps(record, separators=(',', ':')) + '\n'
+            self._log.write(line)
+            self._apply(record, self._size)
+            self._size += len(line.encode('utf-8'))
+            self._pending += 1
+            self._logged += 1
+            if (self._pending >= self.sync_records
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self.flush()
+            elif self._timer is None:
+                #Nothing may follow this record, so a timer syncs it in time
+                self._timer = threading.Timer(self._last_sync + self.sync_interval - time.monotonic(),
+                                              self._timedFlush)
+                self._timer.daemon = True
+                self._timer.start()
+            if self._logged >= self.snapshot_every:
+                self.snapshot()
+
+    def _timedFlush(self):
+        with self._lock:
+            self._timer = None
+            if not self._log.closed:
+                self.flush()
+
+    def flush(self):
+        """Writes and fsyncs any records not yet on disk."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._log.flush()
+            if self._pending:
+                os.fsync(self._log.fileno())
+                self.syncs += 1
+                self._pending = 0
+            self._last_sync = time.monotonic()
+
+    def snapshot(self):
+        """Writes every session to the snapshot and starts a new log."""
+        with self._lock:
+            self.flush()
+            generation = self.generation + 1
+            log = open(self._logPath(generation), 'w', encoding='utf-8', newline='\n')
+            path = os.path.join(self.directory, self.SNAPSHOT)
+            offsets = {}
+            with open(path + '.tmp', 'wb') as file:
+                header = {'Next': self._next_id, 'Log': generation}
+                file.write(json.dumps(header, separators=(',', ':')).encode('utf-8') + b'\n')
+                for session_id in self._sessions:
+                    offsets[session_id] = file.tell()
+                    line = json.dumps([session_id, *self._read(session_id)], separators=(',', ':'))
+                    file.write(line.encode('utf-8') + b'\n')
+                file.flush()
+                os.fsync(file.fileno())
+            if self._snapshot is not None:
+                self._snapshot.close()
+            os.replace(path + '.tmp', path)
+            self._syncDirectory()
+            self._snapshot = open(path, 'rb')
+            #Only once the snapshot is in place can the log it covers go
+            self._log.close()
+            self._reader.close()
+            os.remove(self._logPath(self.generation))
+            self._log = log
+            self._reader = open(self._logPath(generation), 'rb')
+            self._sessions = {session_id: (offset, None) for session_id, offset in offsets.items()}
+            self.generation = generation
+            self._logged = 0
+            self._size = 0
+
+    def _syncDirectory(self):
+        #Makes the new log and the renamed snapshot survive a crash. Windows
+        #cannot open a directory and keeps renames without it.
+        if os.name == 'nt':
+            return
+        descriptor = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def close(self):
+        """Flushes the log and closes it."""
+        with self._lock:
+            if not self._log.closed:
+                self.flush()
+                self._log.close()
+                self._reader.close()
+                if self._snapshot is not None:
+                    self._snapshot.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __iter__(self):
+        return iter(list(self._sessions))
+
+    def _remember(self, session_id, game):
+        self._games[session_id] = game
+        self._games.move_to_end(session_id)
+        while len(self._games) > self.capacity:
+            self._games.popitem(last=False)
+            self.evictions += 1
+
+    def create(self, player1, player2, game=None):
+        """
+        Starts a session.
+
+        Args:
+            player1 (str): Name of player 1.
+            player2 (str): Name of player 2.
+            game (dict): Optional position to start from, such as one read
+                         with loadGame; a new game if omitted.
+
+        Returns:
+            int: The new session's id.
+        """
+        if game is None:
+            game = newGame(player1, player2)
+        start = {'Player 1': player1, 'Player 2': player2, 'Who': int(game['Who']),
+                 'Board': [[list(row) for row in layer] for layer in game['Board']]}
+        geometry = gameGeometry(game)
+        if geometry.win != DEFAULT_GEOMETRY.win:
+            #The size of a board is plain from the board itself
+            start['Win'] = geometry.win
+        session_id = self._next_id
+        self._write({'Op': 'new', 'Id': session_id, 'Game': start})
+        self._remember(session_id, self._startGame(start))
+        return session_id
+
+    @staticmethod
+    def _startGame(start):
+        start = deepcopy(start)
+        win = start.pop('Win', DEFAULT_GEOMETRY.win)
+        game = Game(start)
+        game.geometry = _boardGeometry(game['Board'], win)
+        return game
+
+    def _read(self, session_id):
+        #Reads a session's starting game and moves back from the files
+        with self._lock:
+            snapshot_at, log_at = self._sessions[session_id]
+            self._log.flush()
+            moves = []
+            while log_at is not None:
+                self._reader.seek(log_at)
+                record = json.loads(self._reader.readline())
+                if record['Op'] == 'new':
+                    moves.reverse()
+                    return record['Game'], moves
+                moves.append(record['Move'])
+                log_at = record['Prev']
+            moves.reverse()
+            self._snapshot.seek(snapshot_at)
+            _, start, earlier = json.loads(self._snapshot.readline())
+            return start, earlier + moves
+
+    def _restore(self, session_id):
+        started = time.perf_counter()
+        start, moves = self._read(session_id)
+        game = self._startGame(start)
+        for move in moves:
+            applyMove(game, move)
+        elapsed = time.perf_counter() - started
+        self.restore_time += elapsed
+        self.restore_max = max(self.restore_max, elapsed)
+        return game
+
+    def get(self, session_id):
+        """
+        Returns a session's game, replaying its moves if it is not in memory.
+
+        Raises:
+            KeyError: If there is no such session.
+        """
+        if session_id in self._games:
+            self.hits += 1
+            self._games.move_to_end(session_id)
+            return self._games[session_id]
+        if session_id not in self._sessions:
+            raise KeyError(session_id)
+        self.misses += 1
+        game = self._restore(session_id)
+        self._remember(session_id, game)
+        return game
+
+    __getitem__ = get
+
+    def move(self, session_id, move):
+        """
+        Makes a move in a session and logs it.
+
+        Returns:
+            dict: The game after the move.
+
+        Raises:
+            KeyError: If there is no such session.
+            MoveNotMade: If the move is invalid; nothing is logged.
+        """
+        game = makeMove(self.get(session_id), move)
+        with self._lock:
+            self._write({'Op': 'move', 'Id': session_id, 'Move': move,
+                         'Prev': self._sessions[session_id][1]})
+        self._games[session_id] = game
+        return game
+
+    def moves(self, session_id):
+        """Returns the moves made in a session, oldest first."""
+        return self._read(session_id)[1]
+
+    def delete(self, session_id):
+        """Ends a session and forgets it."""
+        if session_id not in self._sessions:
+            raise KeyError(session_id)
+        self._write({'Op': 'delete', 'Id': session_id})
+        self._games.pop(session_id, None)
+
+    __delitem__ = delete
+
+    def metrics(self):
+        """Returns the store's counters as a dict."""
+        requests = self.hits + self.misses
+        return {'Sessions': len(self._sessions), 'Resident': len(self._games),
+                'Hits': self.hits, 'Misses': self.misses,
+                'Hit rate': self.hits / requests if requests else 0.0,
+                'Evictions': self.evictions, 'Syncs': self.syncs,
+                'Restore time': self.restore_time,
+                'Restore mean': self.restore_time / self.misses if self.misses else 0.0,
+                'Restore max': self.restore_max}
+
+###############################################################################
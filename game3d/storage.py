@@ -0,0 +1,669 @@
+"""Binary game archives and the position index."""
+
+import json
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import time
+
+from .board import (
+    BitBoard, DEFAULT_GEOMETRY, _randomMoveLists, applyMove, gameFromBitBoard, gameMoves,
+    getBitBoard, getGeometry, isWinnerAfter, loadGame, newGame, saveGame, transformBitBoard)
+
+
+###############################################################################
+# Binary game archive
+#
+# An archive file is a header followed by game records, appended one after
+# another:
+#
+#   header:  magic b'G3DA', format version, layers, rows, cols, win (bytes)
+#   record:  payload length (uint32), kind (byte), payload
+#   payload: Player 1 and Player 2 as (uint16 length, UTF-8), 'Who' (byte),
+#            then for kind 0 the number of moves (uint16) and one collumn
+#            number per move, or for kind 1 the bitmasks of both players.
+#
+# Games whose history rebuilds their board are stored as moves (kind 0),
+# anything else, such as a game loaded from CSV, as bitmasks (kind 1).
+# All numbers are little-endian. With a byte per dimension and per move,
+# boards of up to 255 in each dimension and 256 collumns fit.
+
+ARCHIVE_MAGIC = b'G3DA'
+ARCHIVE_VERSION = 1
+_ARCHIVE_HEADER = struct.Struct('<4sBBBBB')
+_RECORD_HEADER = struct.Struct('<IB')
+
+
+class ArchiveError(Exception):
+    """
+    Error raised when an archive file is damaged, of an unknown version or
+    for a different board size.
+    """
+    pass
+
+
+def _historyRebuilds(bitboard):
+    #True if replaying the history from an empty board gives this position
+    replay = BitBoard(bitboard.geometry)
+    for cell in bitboard.history:
+        column = cell % bitboard.geometry.columns
+        if not replay.canPlay(column) or replay.play(column) != cell:
+            return False
+    return replay.bits == bitboard.bits and replay.who == bitboard.who
+
+
+def _checkGeometry(geometry):
+    if (max(geometry.layers, geometry.rows, geometry.cols, geometry.win) > 255
+            or geometry.columns > 256):
+        raise ArchiveError(f"A {geometry.layers}x{geometry.rows}x{geometry.cols} board is too big "
+                           "for a game archive")
+
+
+def _packGame(game):
+    bitboard = getBitBoard(game)
+    geometry = bitboard.geometry
+    names = b''
+    for key in ('Player 1', 'Player 2'):
+        name = str(game[key]).encode('utf-8')
+        names += struct.pack('<H', len(name)) + name
+    if _historyRebuilds(bitboard):
+        columns = bytes(cell % geometry.columns for cell in bitboard.history)
+        payload = names + struct.pack('<BH', bitboard.who, len(columns)) + columns
+        kind = 0
+    else:
+        size = (geometry.cells + 7) // 8
+        payload = (names + struct.pack('<B', bitboard.who) +
+                   bitboard.bits[1].to_bytes(size, 'little') + bitboard.bits[2].to_bytes(size, 'little'))
+        kind = 1
+    return _RECORD_HEADER.pack(len(payload), kind) + payload
+
+
+def _unpackGame(data, offset, geometry):
+    #Returns the game stored at offset and the offset of the next record
+    length, kind = _RECORD_HEADER.unpack_from(data, offset)
+    start = offset + _RECORD_HEADER.size
+    end = start + length
+    if end > len(data):
+        raise ArchiveError(f"Record at byte {offset} is cut short")
+    position = start
+    names = []
+    for _ in range(2):
+        (size,) = struct.unpack_from('<H', data, position)
+        names.append(bytes(data[position + 2:position + 2 + size]).decode('utf-8'))
+        position += 2 + size
+    who = data[position]
+    position += 1
+
+    if kind == 0:
+        (count,) = struct.unpack_from('<H', data, position)
+        bitboard = BitBoard(geometry)
+        for column in data[position + 2:position + 2 + count]:
+            bitboard.play(column)
+    elif kind == 1:
+        size = (geometry.cells + 7) // 8
+        bitboard = BitBoard(geometry, who)
+        bitboard.bits[1] = int.from_bytes(data[position:position + size], 'little')
+        bitboard.bits[2] = int.from_bytes(data[position + size:position + 2 * size], 'little')
+        for player in (1, 2):
+            bits = bitboard.bits[player]
+            while bits:
+                low = bits & -bits
+                bitboard.key ^= geometry.zobrist[player][low.bit_length() - 1]
+                bits ^= low
+        bitboard._resetHeights()
+    else:
+        raise ArchiveError(f"Unknown record kind {kind} at byte {offset}")
+    return gameFromBitBoard(bitboard, names[0], names[1]), end
+
+
+class GameArchive:
+    """
+    Append-only file of games in the binary format.
+
+    Games are added with append() and read back lazily by iterating over
+    the archive; the file is memory-mapped rather than read into memory.
+    archive[n] finds the n-th game through an index of record offsets built
+    on first use.
+
+    Attributes:
+        path (str): The archive file.
+        geometry (Geometry): Board size of every game in the archive.
+
+    Raises:
+        ArchiveError: If the board is too big for the format.
+    """
+
+    def __init__(self, path, geometry=DEFAULT_GEOMETRY):
+        self.path = path
+        self.geometry = geometry
+        self._offsets = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as file:
+                self.geometry = self._readHeader(file.read(_ARCHIVE_HEADER.size))
+        else:
+            _checkGeometry(geometry)
+
+    def _readHeader(self, data):
+        if len(data) < _ARCHIVE_HEADER.size:
+            raise ArchiveError(f"{self.path} is not a game archive")
+        magic, version, layers, rows, cols, win = _ARCHIVE_HEADER.unpack_from(data)
+        if magic != ARCHIVE_MAGIC:
+            raise ArchiveError(f"{self.path} is not a game archive")
+        if version != ARCHIVE_VERSION:
+            raise ArchiveError(f"{self.path} has unsupported version {version}")
+        return getGeometry(layers, rows, cols, win)
+
+    def append(self, game):
+        """Adds a game to the end of the archive."""
+        self.extend([game])
+
+    def extend(self, games):
+        """Adds several games to the end of the archive in one write."""
+        chunks = []
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            geometry = self.geometry
+            chunks.append(_ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, geometry.layers,
+                                               geometry.rows, geometry.cols, geometry.win))
+        for game in games:
+            if getBitBoard(game).geometry is not self.geometry:
+                raise ArchiveError("Game board size does not match the archive")
+            chunks.append(_packGame(game))
+        with open(self.path, 'ab') as file:
+            file.write(b''.join(chunks))
+        self._offsets = None
+
+    def _records(self, start=None):
+        #Yields (offset, data) for each record from start (by default the
+        #first) while the file is mapped. A record at the end that is still
+        #being written is left out, as if it were not there yet.
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= _ARCHIVE_HEADER.size:
+            return
+        with open(self.path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self._readHeader(data[:_ARCHIVE_HEADER.size])
+                offset = start or _ARCHIVE_HEADER.size
+                while offset + _RECORD_HEADER.size <= len(data):
+                    (length,) = struct.unpack_from('<I', data, offset)
+                    end = offset + _RECORD_HEADER.size + length
+                    if end > len(data):
+                        break
+                    yield offset, data
+                    offset = end
+
+    def __iter__(self):
+        for offset, data in self._records():
+            yield _unpackGame(data, offset, self.geometry)[0]
+
+    def gamesFrom(self, offset=None):
+        """
+        Yields (game, end) for each record from a byte offset on, where end
+        is the offset of the next record, so a reader can later carry on
+        from where it stopped. A record at the end that is only partly
+        written is not read; it is read from its offset once complete.
+
+        Args:
+            offset (int): Offset of a record, as returned in end, or None
+                          for the first.
+        """
+        for start, data in self._records(offset):
+            yield _unpackGame(data, start, self.geometry)
+
+    def offsets(self):
+        """Returns the byte offset of every record."""
+        if self._offsets is None:
+            self._offsets = [offset for offset, _ in self._records()]
+        return self._offsets
+
+    def __len__(self):
+        return len(self.offsets())
+
+    def __getitem__(self, index):
+        offset = self.offsets()[index]
+        with open(self.path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _unpackGame(data, offset, self.geometry)[0]
+
+    def importCsv(self, fnames):
+        """Appends games saved with saveGame. Returns the number added."""
+        games = [loadGame(fname) for fname in fnames]
+        self.extend(games)
+        return len(games)
+
+    def exportCsv(self, directory, prefix='game'):
+        """
+        Writes every game with saveGame as directory/prefix-N.csv.
+
+        Returns:
+            list: The filenames written.
+        """
+        fnames = []
+        for number, game in enumerate(self):
+            fname = os.path.join(directory, f"{prefix}-{number}.csv")
+            saveGame(game, fname)
+            fnames.append(fname)
+        return fnames
+
+
+def saveGameBinary(game, fname):
+    """
+    Saves the game state in the binary format, as an archive of one game.
+
+    Args:
+        game (dict): The current game state.
+        fname (str): The filename to save the game to.
+
+    Raises:
+        ArchiveError: If the board is too big for the format; the file is
+                      left as it was.
+    """
+    geometry = getBitBoard(game).geometry
+    _checkGeometry(geometry)
+    if os.path.exists(fname):
+        os.remove(fname)
+    GameArchive(fname, geometry).append(game)
+
+
+def loadGameBinary(fname):
+    """
+    Loads a game saved with saveGameBinary (the first game of an archive).
+
+    Args:
+        fname (str): The filename to load the game from.
+
+    Returns:
+        Game: The restored game state dictionary.
+
+    Raises:
+        ArchiveError: If the file holds no game or is not an archive.
+    """
+    for game in GameArchive(fname):
+        return game
+    raise ArchiveError(f"{fname} holds no games")
+
+###############################################################################
+
+
+###############################################################################
+# Position index
+#
+# Finds stored games by what happened in them without replaying them at
+# query time. Each game is replayed once as it is added, and every position
+# it reached is recorded in an SQLite file: its Zobrist key and a few
+# pattern features, each with the game and the ply. Both tables are
+# ordered by what is looked up, so a query reads only its own rows.
+#
+# Features are threats: an 'Open three' is a line holding win - 1 pieces
+# of one player and an empty cell, counted on the layer of that cell; a
+# 'Playable three' is one whose cell can be played now; 'Two threats'
+# marks a player with two playable threats at once, which cannot both be
+# stopped. Layers are numbered from 1 at the bottom, like the players.
+#
+# The index remembers how far it has read each source (a byte offset in a
+# tournament record or a game archive), so updating it after games are
+# appended only replays the new ones.
+
+INDEX_FEATURES = ('Open three', 'Playable three', 'Two threats')
+
+
+def _signedKey(key):
+    #SQLite integers are signed 64 bit
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def _replayFeatures(columns, geometry):
+    #Replays collumn numbers, stopping at an invalid move or the end of the
+    #game. Returns (keys, features, winner, plies): the key of the position
+    #at each ply (0 the empty board), (kind, player, layer, ply) for each
+    #feature that holds, and the winner as isWinner (0 unfinished).
+    bitboard = BitBoard(geometry)
+    cell_lines = geometry.cellLines
+    columns_per_layer = geometry.columns
+    bottom = (1 << columns_per_layer) - 1
+    full = geometry.full
+    threats = [0, 0, 0]
+    keys = [bitboard.key]
+    features = []
+    winner = 0
+    for ply, column in enumerate(columns, 1):
+        if column is None or not bitboard.canPlay(column):
+            break
+        player = bitboard.who
+        cell = bitboard.play(column)
+        keys.append(bitboard.key)
+        bits = bitboard.bits[player]
+        for line in cell_lines[cell]:
+            missing = line & ~bits
+            if missing and not missing & (missing - 1):
+                threats[player] |= missing
+
+        #Each of these holds on many plies in a row, so all are recorded
+        #for every ply they hold on
+        occupied = bitboard.bits[1] | bitboard.bits[2]
+        playable = ((occupied << columns_per_layer) | bottom) & ~occupied & full
+        for who in (1, 2):
+            open_cells = threats[who] & ~occupied
+            if not open_cells:
+                continue
+            for layer in range(geometry.layers):
+                if open_cells >> (layer * columns_per_layer) & bottom:
+                    features.append((0, who, layer + 1, ply))
+            playable_cells = open_cells & playable
+            layer_cells = playable_cells
+            while layer_cells:
+                low = layer_cells & -layer_cells
+                features.append((1, who, (low.bit_length() - 1) // columns_per_layer + 1, ply))
+                layer_cells ^= low
+            if playable_cells & (playable_cells - 1):
+                features.append((2, who, 0, ply))
+
+        if bitboard.wonAfter(cell):
+            winner = player
+            break
+        if not bitboard.legal:
+            winner = -1
+            break
+    return keys, list(dict.fromkeys(features)), winner, len(keys) - 1
+
+
+class PositionIndex:
+    """
+    On-disk index of stored games by the positions reached in them and the
+    threats on the board (see INDEX_FEATURES), in an SQLite file.
+
+    Games are added from tournament records (.jsonl) and game archives with
+    update(), which only reads what was appended to a source since it was
+    last indexed, and are numbered from 1 in the order they were added.
+
+    Attributes:
+        path (str): The index file.
+        geometry (Geometry): Board size of every indexed game.
+    """
+
+    def __init__(self, path, geometry=DEFAULT_GEOMETRY):
+        self.path = path
+        self.geometry = geometry
+        self._connection = None
+        self._pid = None
+        row = self._connect().execute("SELECT layers, rows, cols, win FROM meta").fetchone()
+        if row is not None:
+            self.geometry = getGeometry(*row)
+
+    def _connect(self):
+        #Connections cannot be shared with forked processes
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                "CREATE TABLE IF NOT EXISTS meta (layers INTEGER, rows INTEGER, cols INTEGER, win INTEGER);"
+                "CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, offset INTEGER NOT NULL, "
+                "games INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS games (id INTEGER PRIMARY KEY, source TEXT NOT NULL, "
+                "number INTEGER NOT NULL, plies INTEGER NOT NULL, winner INTEGER NOT NULL, "
+                "moves TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS positions (key INTEGER, game INTEGER, ply INTEGER, "
+                "PRIMARY KEY (key, game, ply)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS features (kind INTEGER, player INTEGER, layer INTEGER, "
+                "game INTEGER, ply INTEGER, PRIMARY KEY (kind, player, layer, game, ply)) WITHOUT ROWID;")
+            connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        """Closes this process's connection."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def _newRecords(self, source, offset):
+        #Yields (moves, end) for each game in a source after byte offset
+        #(None for the start), where end is the offset after it. A record
+        #still being written, a line with no newline yet or an archive record
+        #shorter than its length, is left for later.
+        if str(source).endswith('.jsonl'):
+            with open(source, 'rb') as file:
+                file.seek(offset or 0)
+                end = offset or 0
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    end += len(line)
+                    if line.strip():
+                        yield json.loads(line).get('Moves') or [], end
+        else:
+            if os.path.getsize(source) < _ARCHIVE_HEADER.size:
+                #Not even the header is written yet
+                return
+            archive = GameArchive(source)
+            if archive.geometry is not self.geometry:
+                raise ArchiveError(f"{source} holds games of another board size")
+            for game, end in archive.gamesFrom(offset):
+                bitboard = getBitBoard(game)
+                yield (gameMoves(game) if _historyRebuilds(bitboard) else None), end
+
+    def update(self, sources, quiet=True):
+        """
+        Indexes the games added to each source since the last update.
+
+        Args:
+            sources (list): Tournament records (.jsonl, see runTournament)
+                            and game archives. Archived games without a
+                            history, such as those imported from CSV files,
+                            are skipped.
+            quiet (bool): If False, the games indexed from each source are
+                          printed.
+
+        Returns:
+            int: The number of games indexed.
+
+        Raises:
+            ArchiveError: If a source is for another board size, or is
+                          shorter than when it was last indexed.
+        """
+        connection = self._connect()
+        geometry = self.geometry
+        if connection.execute("SELECT COUNT(*) FROM meta").fetchone()[0] == 0:
+            connection.execute("INSERT INTO meta VALUES (?, ?, ?, ?)",
+                               (geometry.layers, geometry.rows, geometry.cols, geometry.win))
+        move_columns = geometry.moveColumns
+        signed = _signedKey
+        added = 0
+        for source in sources:
+            path = os.path.abspath(source)
+            row = connection.execute("SELECT offset, games FROM sources WHERE path = ?",
+                                     (path,)).fetchone()
+            offset, number = row if row is not None else (None, 0)
+            if offset is not None and os.path.getsize(path) < offset:
+                raise ArchiveError(f"{source} is shorter than when it was indexed; "
+                                   f"rebuild the index")
+            game_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM games").fetchone()[0]
+            games = []
+            positions = []
+            features = []
+            end = offset
+            for moves, end in self._newRecords(path, offset):
+                number += 1
+                if moves is None:
+                    continue
+                game_id += 1
+                keys, found, winner, plies = _replayFeatures(
+                    [move_columns.get(move) for move in moves], geometry)
+                games.append((game_id, path, number, plies, winner, ' '.join(moves[:plies])))
+                positions += [(signed(key), game_id, ply) for ply, key in enumerate(keys)]
+                features += [(kind, player, layer, game_id, ply) for kind, player, layer, ply in found]
+            connection.executemany("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?)", games)
+            connection.executemany("INSERT INTO positions VALUES (?, ?, ?)", positions)
+            connection.executemany("INSERT INTO features VALUES (?, ?, ?, ?, ?)", features)
+            connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (path, end or 0, number))
+            connection.commit()
+            added += len(games)
+            if not quiet:
+                print(f"{source}: {len(games)} games indexed")
+        return added
+
+    def find(self, game, symmetric=False, limit=None):
+        """
+        Finds every indexed game that reached a position.
+
+        Args:
+            game (dict): The position, as a game state or BitBoard.
+            symmetric (bool): If True, rotations and reflections of the
+                              position count too.
+            limit (int): Most results to return, or None for all.
+
+        Returns:
+            list: (game id, ply) for each time the position was reached,
+                  where ply is the number of moves played to reach it.
+        """
+        bitboard = game if isinstance(game, BitBoard) else getBitBoard(game)
+        keys = {bitboard.key}
+        if symmetric:
+            keys.update(transformBitBoard(bitboard, symmetry).key
+                        for symmetry in range(len(bitboard.geometry.symmetries)))
+        keys = [_signedKey(key) for key in keys]
+        query = (f"SELECT game, ply FROM positions WHERE key IN ({', '.join('?' * len(keys))}) "
+                 f"ORDER BY game, ply")
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return self._connect().execute(query, keys).fetchall()
+
+    def findFeature(self, feature, player, layer=None, first=True, limit=None):
+        """
+        Finds the indexed games in which a player had a feature.
+
+        Args:
+            feature (str): One of INDEX_FEATURES.
+            player (int): 1 or 2.
+            layer (int): Layer the threat was on, counted from 1 at the
+                         bottom, or None for any ('Two threats' has none).
+            first (bool): If True, only the first ply of each game with the
+                          feature is returned; otherwise every ply.
+            limit (int): Most results to return, or None for all.
+
+        Returns:
+            list: (game id, ply) pairs, by game and ply.
+
+        Raises:
+            ValueError: If the feature is not recognised.
+        """
+        if feature not in INDEX_FEATURES:
+            raise ValueError(f"Unknown feature: {feature}")
+        conditions = "kind = ? AND player = ?"
+        values = [INDEX_FEATURES.index(feature), player]
+        if layer is not None:
+            conditions += " AND layer = ?"
+            values.append(layer)
+        if first:
+            query = f"SELECT game, MIN(ply) FROM features WHERE {conditions} GROUP BY game ORDER BY game"
+        else:
+            query = f"SELECT DISTINCT game, ply FROM features WHERE {conditions} ORDER BY game, ply"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return self._connect().execute(query, values).fetchall()
+
+    def gameInfo(self, game_id):
+        """
+        Describes an indexed game.
+
+        Returns:
+            dict: 'Source' (the file it was read from), 'Number' (its place
+                  in that file, from 1), 'Plies', 'Winner' (as isWinner, 0
+                  if unfinished) and 'Moves', or None for an unknown id.
+        """
+        row = self._connect().execute("SELECT source, number, plies, winner, moves FROM games "
+                                      "WHERE id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+        source, number, plies, winner, moves = row
+        return {'Source': source, 'Number': number, 'Plies': plies, 'Winner': winner,
+                'Moves': moves.split()}
+
+    def game(self, game_id, ply=None):
+        """
+        Rebuilds an indexed game, as it stood after ply moves (by default
+        at the end), without reading its source.
+        """
+        info = self.gameInfo(game_id)
+        if info is None:
+            raise KeyError(game_id)
+        game = newGame('Player 1', 'Player 2', self.geometry)
+        for move in info['Moves'][:ply]:
+            applyMove(game, move)
+        return game
+
+
+def benchmarkPositionIndex(path, games=2000, queries=200, seed=0):
+    """
+    Indexes random games and times indexing, appending and querying.
+
+    Args:
+        path (str): Directory for the temporary records and index.
+        games (int): Number of games to index.
+        queries (int): Lookups of each kind to time.
+        seed (int): Seed for the games.
+
+    Returns:
+        dict: 'Games/sec' indexed, 'Append games/sec' for an update after
+              games are appended, 'Position ms' and 'Feature ms' (the mean
+              time per query in milliseconds) and 'Index MB' (the size of
+              the index file).
+    """
+    records = os.path.join(path, 'index-games.jsonl')
+    database = os.path.join(path, 'index-games.db')
+    for name in (records, database):
+        if os.path.exists(name):
+            os.remove(name)
+    move_lists = _randomMoveLists(games, seed)
+    half = games // 2
+
+    def write(lists):
+        with open(records, 'a', encoding='utf-8') as file:
+            for moves in lists:
+                file.write(json.dumps({'Moves': moves}) + '\n')
+
+    index = PositionIndex(database)
+    write(move_lists[:half])
+    started = time.perf_counter()
+    index.update([records])
+    elapsed = time.perf_counter() - started
+    write(move_lists[half:])
+    appended = time.perf_counter()
+    index.update([records])
+    append_elapsed = time.perf_counter() - appended
+
+    rng = random.Random(seed)
+    targets = []
+    for _ in range(queries):
+        moves = rng.choice(move_lists)
+        game = newGame('Player 1', 'Player 2')
+        for move in moves[:rng.randrange(1, 9)]:
+            applyMove(game, move)
+            if isWinnerAfter(game, move) != 0:
+                break
+        targets.append(game)
+    started = time.perf_counter()
+    found = sum(len(index.find(game)) for game in targets)
+    position_ms = (time.perf_counter() - started) * 1000 / queries
+    started = time.perf_counter()
+    for number in range(queries):
+        index.findFeature(INDEX_FEATURES[number % 2], number % 2 + 1, number % 4 + 1)
+    feature_ms = (time.perf_counter() - started) * 1000 / queries
+    index.close()
+
+    result = {'Games/sec': half / elapsed if elapsed > 0 else float('inf'),
+              'Append games/sec': (games - half) / append_elapsed if append_elapsed > 0 else float('inf'),
+              'Position ms': position_ms, 'Feature ms': feature_ms,
+              'Index MB': os.path.getsize(database) / 1e6}
+    print(f"Indexed {half} games at {result['Games/sec']:,.0f} games/sec, "
+          f"{games - half} more at {result['Append games/sec']:,.0f} games/sec "
+          f"({result['Index MB']:.1f} MB)")
+    print(f"Position lookups: {position_ms:.3f} ms each ({found} hits)")
+    print(f"Feature lookups:  {feature_ms:.3f} ms each")
+    return result
+
+###############################################################################
@@ -0,0 +1,289 @@
+"""Move suggestions, strategies and tournaments between them."""
+
+import functools
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .board import DEFAULT_GEOMETRY, findValidMoves, isWinnerAfter, makeMove, newGame
+from .engine import (
+    MCTS, Engine, _newEvaluationEngine, availableCores, evaluatedMove, mctsMove, searchMove)
+from .net import _newNetEngine, netMove
+
+
+###############################################################################
+# Suggested moves
+
+def suggestMove(game, time_ms=200, max_depth=None, max_nodes=None, workers=1, seed=None,
+                method='search', engine=None):
+    """
+    Suggests a valid move for the next player in the form 'xX' or 'Xx'.
+    If there are no valid moves, raises GameOverError.
+    
+    The move is chosen by an alpha-beta search (see searchMove), deepened
+    one ply at a time until the budget runs out. The best move found so far
+    is returned. With method 'mcts' it is chosen by Monte Carlo tree search
+    instead (see MCTS), which only uses time_ms. With method 'net'
+    the search scores positions with the network set with setValueNet (see
+    netMove), in this process.
+
+    Args:
+        game (dict): The current game state.
+        time_ms (float): Time budget in milliseconds, or None for no limit.
+        max_depth (int): Deepest search to run, or None for no limit.
+        max_nodes (int): Node budget, or None for no limit.
+        workers (int): Processes to search with, None for every available
+                       core. The default of 1 searches in this process.
+        seed (int): Seed for a parallel search. Given a seed and max_depth
+                    or max_nodes, time_ms is ignored so that the same
+                    position always gets the same move.
+        method (str): 'search' for alpha-beta, 'net' or 'mcts'.
+        engine (Engine): Engine to search with (an MCTS for 'mcts'), or None
+                         for the one kept between calls.
+
+    Returns:
+        str: A valid move, e.g., 'aA' or 'Aa'.
+
+    Raises:
+        GameOverError: If no valid moves remain (the board is full).
+        ValueError: If method is not recognised.
+    """
+    if method == 'mcts':
+        return mctsMove(game, time_ms, player=engine)['Move']
+    if method == 'net':
+        return netMove(game, time_ms, max_depth, max_nodes, engine=engine)
+    if method != 'search':
+        raise ValueError(f"Unknown search method: {method}")
+    return searchMove(game, time_ms, max_depth, max_nodes, engine=engine, workers=workers,
+                      seed=seed)['Move']
+
+###############################################################################
+
+
+###############################################################################
+# Tournaments
+#
+# A strategy is any function that takes a game dictionary and returns a move
+# string, like suggestMove. Strategies given to a tournament that runs on
+# several processes must be picklable: module level functions or
+# functools.partial objects of them. In each game, a strategy that searches
+# (suggestMove or evaluatedMove) gets an engine of its own, so the players
+# share no table or tree with each other or with earlier games.
+
+def randomMove(game):
+    """Returns a random valid move, drawn from the random module."""
+    return random.choice(findValidMoves(game['Board']))
+
+
+def firstMove(game):
+    """Returns the first valid move, as suggestMove originally did."""
+    return findValidMoves(game['Board'])[0]
+
+
+def parseStrategy(spec):
+    """
+    Turns a strategy name from the command line into a strategy.
+
+    Args:
+        spec (str): 'random', 'first', 'engine' (suggestMove with its default
+                    budget), 'engine:MS' (a budget of MS milliseconds),
+                    'depth:N' (a fixed N ply search), 'eval' and 'eval:MS'
+                    (the engine scoring positions with evaluate's weights),
+                    'net' and 'net:MS' (the engine scoring positions with the
+                    network set with setValueNet) or 'mcts' and 'mcts:MS'
+                    (Monte Carlo tree search).
+
+    Returns:
+        function: The strategy.
+
+    Raises:
+        ValueError: If spec is not recognised.
+    """
+    name, _, value = spec.partition(':')
+    if name == 'random' and not value:
+        return randomMove
+    if name == 'first' and not value:
+        return firstMove
+    if name == 'engine':
+        return functools.partial(suggestMove, time_ms=float(value)) if value else suggestMove
+    if name == 'depth' and value:
+        return functools.partial(suggestMove, time_ms=None, max_depth=int(value))
+    if name == 'eval':
+        return functools.partial(evaluatedMove, time_ms=float(value)) if value else evaluatedMove
+    if name == 'net':
+        if value:
+            return functools.partial(suggestMove, time_ms=float(value), method='net')
+        return functools.partial(suggestMove, method='net')
+    if name == 'mcts':
+        if value:
+            return functools.partial(suggestMove, time_ms=float(value), method='mcts')
+        return functools.partial(suggestMove, method='mcts')
+    raise ValueError(f"Unknown strategy: {spec}")
+
+
+def _ownEngine(strategy):
+    #The strategy searching with a new engine, if it searches
+    if isinstance(strategy, functools.partial):
+        function, keywords = strategy.func, strategy.keywords
+    else:
+        function, keywords = strategy, {}
+    if 'engine' in keywords:
+        return strategy
+    if function is suggestMove:
+        method = keywords.get('method', 'search')
+        engine = MCTS() if method == 'mcts' else _newNetEngine() if method == 'net' else Engine()
+    elif function is evaluatedMove:
+        engine = _newEvaluationEngine()
+    else:
+        return strategy
+    return functools.partial(strategy, engine=engine)
+
+
+def playHeadlessGame(strategy1, strategy2, seed=0, geometry=DEFAULT_GEOMETRY):
+    """
+    Plays one game between two strategies without any input or output.
+
+    A strategy that returns an invalid move or raises an error loses. One
+    that searches gets an engine of its own for the game.
+
+    Args:
+        strategy1 (function): Strategy for player 1.
+        strategy2 (function): Strategy for player 2.
+        seed (int): Seed for the random module before the game starts.
+        geometry (Geometry): Board size and win length.
+
+    Returns:
+        dict: 'Winner' (as isWinner, never 0), 'Moves' (list of move
+              strings), 'Plies', 'Times' (seconds taken by each move) and
+              'Error' (the reason for a forfeit, or None).
+    """
+    random.seed(seed)
+    game = newGame('Player 1', 'Player 2', geometry)
+    strategies = {1: _ownEngine(strategy1), 2: _ownEngine(strategy2)}
+    moves = []
+    times = []
+    while True:
+        who = game['Who']
+        started = time.perf_counter()
+        try:
+            move = strategies[who](game)
+            game = makeMove(game, move)
+        except Exception as e:
+            return {'Winner': 3 - who, 'Moves': moves, 'Plies': len(moves), 'Times': times,
+                    'Error': f"Player {who}: {type(e).__name__}: {e}"}
+        times.append(time.perf_counter() - started)
+        moves.append(move)
+
+        result = isWinnerAfter(game, move)
+        if result != 0:
+            return {'Winner': result, 'Moves': moves, 'Plies': len(moves), 'Times': times,
+                    'Error': None}
+
+
+def _tournamentGame(number, name1, strategy1, name2, strategy2, seed, geometry):
+    record = {'Game': number, 'Player 1': name1, 'Player 2': name2, 'Seed': seed}
+    record.update(playHeadlessGame(strategy1, strategy2, seed, geometry))
+    return record
+
+
+def _eloStandings(records, names, k=16):
+    #Elo ratings updated game by game in game order, starting from 1500
+    rating = {name: 1500.0 for name in names}
+    table = {name: {'Games': 0, 'Wins': 0, 'Draws': 0, 'Losses': 0} for name in names}
+    for record in sorted(records, key=lambda r: r['Game']):
+        first, second = record['Player 1'], record['Player 2']
+        score = {1: 1.0, 2: 0.0, -1: 0.5}[record['Winner']]
+        expected = 1 / (1 + 10 ** ((rating[second] - rating[first]) / 400))
+        rating[first] += k * (score - expected)
+        rating[second] -= k * (score - expected)
+        for name, points in ((first, score), (second, 1 - score)):
+            table[name]['Games'] += 1
+            table[name]['Wins' if points == 1 else 'Losses' if points == 0 else 'Draws'] += 1
+    for name in names:
+        table[name]['Elo'] = rating[name]
+    return table
+
+
+def runTournament(players, games=10, workers=None, output=None, seed=0, quiet=False,
+                  geometry=DEFAULT_GEOMETRY):
+    """
+    Plays every pair of players against each other without any input.
+
+    Each pair plays games games, taking turns to move first. Games are spread
+    over a pool of processes and each result is written to output as a line
+    of JSON as soon as the game finishes.
+
+    Args:
+        players (dict): Strategy for each player name. Strategy names as
+                        accepted by parseStrategy may be given instead.
+        games (int): Number of games for each pair of players.
+        workers (int): Number of processes, None for one per available core.
+                       With 1, games are played in this process.
+        output (str): JSONL file to append results to, or None.
+        seed (int): Game n is played with seed + n.
+        quiet (bool): If True, nothing is printed.
+        geometry (Geometry): Board size and win length of every game.
+
+    Returns:
+        dict: 'Games', 'Moves', 'Time' (seconds), 'Games/sec', 'Moves/sec'
+              and 'Standings' (per player 'Games', 'Wins', 'Draws',
+              'Losses' and 'Elo').
+    """
+    players = {name: parseStrategy(strategy) if isinstance(strategy, str) else strategy
+               for name, strategy in players.items()}
+    names = list(players)
+
+    schedule = []
+    for a in range(len(names)):
+        for b in range(a + 1, len(names)):
+            for n in range(games):
+                first, second = (names[a], names[b]) if n % 2 == 0 else (names[b], names[a])
+                number = len(schedule)
+                schedule.append((number, first, players[first], second, players[second], seed + number,
+                                 geometry))
+
+    workers = workers or availableCores()
+    records = []
+    started = time.perf_counter()
+    out = open(output, 'a') if output else None
+    try:
+        def finished(record):
+            records.append(record)
+            if out:
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+            if not quiet:
+                result = 'draw' if record['Winner'] == -1 else record[f"Player {record['Winner']}"] + ' wins'
+                print(f"Game {record['Game']}: {record['Player 1']} v {record['Player 2']}, "
+                      f"{result} in {record['Plies']} moves")
+
+        if workers == 1:
+            for args in schedule:
+                finished(_tournamentGame(*args))
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(_tournamentGame, *args) for args in schedule]
+                for future in as_completed(futures):
+                    finished(future.result())
+    finally:
+        if out:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    moves = sum(record['Plies'] for record in records)
+    summary = {'Games': len(records), 'Moves': moves, 'Time': elapsed,
+               'Games/sec': len(records) / elapsed if elapsed > 0 else 0.0,
+               'Moves/sec': moves / elapsed if elapsed > 0 else 0.0,
+               'Standings': _eloStandings(records, names)}
+
+    if not quiet:
+        print(f"\n{summary['Games']} games, {moves} moves in {elapsed:.2f}s: "
+              f"{summary['Games/sec']:.2f} games/sec, {summary['Moves/sec']:.1f} moves/sec\n")
+        print(f"{'Player':<16}{'Games':>6}{'Wins':>6}{'Draws':>6}{'Losses':>7}{'Elo':>7}")
+        for name, row in sorted(summary['Standings'].items(), key=lambda item: -item[1]['Elo']):
+            print(f"{name:<16}{row['Games']:>6}{row['Wins']:>6}{row['Draws']:>6}"
+                  f"{row['Losses']:>7}{row['Elo']:>7.0f}")
+    return summary
+
+###############################################################################
@@ -0,0 +1,338 @@
+"""
+The list-based game functions as they were before the bitboard, kept
+unchanged as a reference for the regression tests.
+"""
+
+from copy import deepcopy
+
+
+def printBoard(board):
+    """
+    Returns a formatted string representation of the game board.
+
+    Args:
+        board (list): A 3D list representing the board state.
+
+    Returns:
+        str: A string representation of the board with proper alignment and spacing.
+
+    Raises:
+        TypeError: If board is not a 3D list.
+    """
+
+    #Check if input is a valid board(4x6x6)
+    if not (isinstance(board, list) and len(board) == 4 and
+            all(isinstance(layer, list) and len(layer) == 6 for layer in board) and
+            all(isinstance(row, list) and len(row) == 6 for layer in board for row in layer)):
+        raise TypeError("Invalid board structure.")
+        
+        
+    #Row and collumn labels
+    row_labels = ['a', 'b', 'c', 'd', 'e', 'f']
+    col_labels = ['A', 'B', 'C', 'D', 'E', 'F']
+    
+    #Headers and collumn labels
+    board_str = "   Layer 1    |   Layer 2    |   Layer 3    |   Layer 4\n"
+    
+    #Add collumn labels for each layer, seperated by |
+    board_str += "  " + " |  ".join(["|".join(col_labels)] * 4) + "\n"
+    
+    #Seperators between labels and grid
+    board_str += " " + "| ".join(["-+-+-+-+-+-+-"] * 4) + "\n"
+    
+    
+    #Loop through each row
+    for row in range(6):
+        #Add label
+        row_str = [row_labels[row]] 
+        #Loop through each level
+        for level in range(4):
+            #Add row values. 0's replaced with spaces
+            row_str.append("|" + "|".join(
+                str(board[level][row][col]) if board[level][row][col] != 0 else " " for col in range(6))) 
+            #row seperators
+            if level < 3: row_str.append(" |" + row_labels[row])
+        board_str += "".join(row_str) + "\n"
+        
+
+    return board_str
+
+
+class ColumnFullError(Exception):
+    '''
+    
+    Error raised when there is an insertion attempt into a full collumn
+    
+    '''
+    
+    pass
+
+
+class InvalidColumnFormat(Exception):
+    
+    '''
+    
+    Error raised when inserted collumn format is incorrect
+    
+    '''
+
+
+def posToIndex(col,board):
+    
+    '''
+    
+    Converts collumn identifier in letter form (Eg. Aa) into board indices
+    
+    Input:
+        col(str): Collumn identifier of length 2. Contains 1 uppercase letter A-F (collumn)
+                  and 1 lower case letter a-f (row)
+        board (list): A 3D array representning the game board (4 x 6 x 6 board)
+        
+    Returns:
+        list: The indices of the first empty slot in the collumn col in form
+              [k, j, i] where k is the level, j is the row index, and i is the collumn index
+    
+    Raises:
+        ColumnFullError: If the column is full.
+        InvalidColumnFormatError: If col is wrongly formatted
+    
+    '''
+
+    #Create dictionaries (row_letters, col_letters) to map row and collumn
+    #letters to corresponding indices in the 3D board array
+    
+    row_letters = {'a': 0, 'b': 1, 'c': 2, 'd' : 3, 'e' : 4, 'f' : 5}
+    
+    col_letters = {'A': 0, 'B': 1, 'C': 2, 'D' : 3, 'E' : 4, 'F' : 5}
+    
+    
+    #Checks if col input is exactly 2 characters, one lower case and one upper
+    #case to define rows and collumns. If not, raise exception.
+    
+    if len(col) != 2 or not ((col[0] in row_letters and col[1] in col_letters) or 
+                             (col[1] in row_letters and col[0] in col_letters)):
+        
+        raise InvalidColumnFormat(f"Invalid column format: {col}")
+        
+
+    # Extracting indices from the letters
+
+    
+    #row index is the lowercase letter. For characters in col, find the lowercase letter
+    row_index = row_letters[col[0]] if col[0] in row_letters else row_letters[col[1]]
+    
+    #collumn index is the uppercase letter. For characters in col, find the uppercase letter
+    col_index = col_letters[col[0]] if col[0] in col_letters else col_letters[col[1]]
+    
+
+    # Iterate through all floor_lvls. 
+    #Find the first available slot in the column
+    
+    for floor_lvl in range(4):
+        if board[floor_lvl][row_index][col_index] == 0:
+            return [floor_lvl, row_index, col_index]
+
+
+    # No empty space found. Raise collumn full error
+    raise ColumnFullError(f"Column {col} is full")
+
+
+class IndexOutOfRange(Exception):
+    
+    '''
+    Error raised when inserted index is invalid
+    
+    '''
+    
+    pass
+
+
+def indexToPos(ind):
+    
+    '''
+    Converts a list of board indices to corresponding letter collumn indentifiers
+    
+    Input:
+        ind(list): List of integers representing the board indices in 2D or 3D cases.
+    
+    Return:
+        str: Letter collumn identifier in form 'Xx'
+        
+    Raises:
+        IndexOutOfRange: If i or j are not between 0 and 5.
+    
+    '''
+    
+    
+    #Map row and collumn indices to letter collumn identifiers
+    row_indices = {0:'a', 1:'b', 2:'c', 3:'d', 4:'e', 5:'f'}
+    
+    col_indices = {0:'A', 1:'B', 2:'C', 3:'D', 4:'E', 5:'F'}
+    
+    
+    #Splitting 2D,3D, and invalid cases
+    if len(ind) == 2:
+        j = ind[0] #j = row index
+        i = ind[1] #i = collumn index
+    elif len(ind) == 3:
+        j = ind[1] #j = row index
+        i = ind[2] #i = collumn index
+    else:
+        raise IndexOutOfRange(f" Index must be of length 2 or 3: {ind}")
+        
+    #Invalid index error checks
+    if j not in row_indices or i not in col_indices:
+        raise IndexOutOfRange(f"Invalid index: {ind}")
+        
+        
+    #Display collumn index first then row index to be in form 'Xx'
+    return col_indices[i] + row_indices[j]
+
+
+def findValidMoves(board):
+    """
+    Finds all non-full columns in the board and returns them as valid moves.
+
+    Args:
+        board (list): The 3D board representation.
+
+    Returns:
+        list: A list of valid moves in the form of 'xX' or 'Xx'.
+    """
+    row_labels = ['a', 'b', 'c', 'd', 'e', 'f']
+    col_labels = ['A', 'B', 'C', 'D', 'E', 'F']
+    valid_moves = []
+    
+    for row in range(6):
+        for col in range(6):
+            # If the top layer (highest) at (row, col) is empty (0), it's a valid move
+            if board[3][row][col] == 0:
+                #valid_moves.append(f"{row_labels[row]}{col_labels[col]}")
+                valid_moves.append(f"{col_labels[col]}{row_labels[row]}")
+    
+    return valid_moves
+
+
+class MoveNotMade(Exception):
+    """
+    Exception raised when a move cannot be made due to an invalid column reference,
+    incorrect format, or if the column is full.
+    """
+    pass
+
+
+def makeMove(game, move):
+    """
+    Attempts to place a piece in the specified column.
+    
+    Args:
+        game (dict): The current game state.
+        move (str): A string representing the column in the form 'xX' or 'Xx'.
+    
+    Returns:
+        dict: A new game state dictionary after the move is made.
+    
+    Raises:
+        MoveNotMade: If the move is invalid or the column is full.
+    """
+
+    # Validate move format
+    if len(move) != 2 or not (move[0].isalpha() and move[1].isalpha()):
+        raise MoveNotMade("Invalid move format. Must be 'xX' or 'Xx'.")
+        
+    try:
+        # Get the indices for the move
+        k, j, i = posToIndex(move, game['Board'])
+    except (InvalidColumnFormat, ColumnFullError) as e:
+        raise MoveNotMade(str(e))
+    
+    # Create a deep copy of the game
+    new_game = deepcopy(game)
+    
+    # Place the current player's piece in the determined location
+    new_game['Board'][k][j][i] = new_game['Who']
+    
+    # Switch to the next player
+    new_game['Who'] = 1 if new_game['Who'] == 2 else 2
+    
+    return new_game
+
+
+def isWinner(game):
+    """
+    Checks whether there is a winner in the current board of the given game.
+    
+    Args:
+        game (dict): The current game state.
+        
+    Returns:
+       1 if Player 1 has won,
+       2 if Player 2 has won,
+       0 if there is no winner and the board is not full,
+      -1 if there is no winner and the board is full.
+    """
+    board = game['Board']  # layer 4 x row 6 x col 6
+    
+    # A quick helper to check if the board is completely filled (no 0s).
+    def board_is_full(bd):
+        for k in range(4):
+            for j in range(6):
+                for i in range(6):
+                    if bd[k][j][i] == 0:
+                        return False
+        return True
+
+    # Directions in 3D to check for 4 in a row:
+    # (dk, dj, di) indicates how we move in layer (k), row (j), and col (i)
+    directions = [
+        (1, 0, 0),  # through layers
+        (0, 1, 0),  # along rows
+        (0, 0, 1),  # along columns
+        (1, 1, 0),
+        (1, 0, 1),
+        (0, 1, 1),
+        (1, -1, 0),
+        (1, 0, -1),
+        (0, 1, -1),
+        (1, 1, 1),
+        (1, 1, -1),
+        (1, -1, 1),
+        (1, -1, -1)
+    ]
+    
+    # Check all positions as potential "starting" points
+    for k in range(4):       # layer index
+        for j in range(6):   # row index
+            for i in range(6):  # column index
+                player = board[k][j][i]
+                # Only check if this cell is occupied (1 or 2)
+                if player != 0:
+                    # Explore each direction
+                    for dk, dj, di in directions:
+                        ''' 
+                        We want to see if we can get 3 more cells (total of 4)
+                        in that direction without going out of bounds,
+                        and if they match player.
+                        '''
+                        valid_line = True
+                        for step in range(1, 4):  # steps of 1,2,3
+                            nk = k + dk * step
+                            nj = j + dj * step
+                            ni = i + di * step
+                            # Check boundaries
+                            if not (0 <= nk < 4 and 0 <= nj < 6 and 0 <= ni < 6):
+                                valid_line = False
+                                break
+                            # Check if same player
+                            if board[nk][nj][ni] != player:
+                                valid_line = False
+                                break
+                        # If all 4 in a row matched, we have a winner
+                        if valid_line:
+                            return player  # either 1 or 2
+
+    # If no winner, check if board is full
+    if board_is_full(board):
+        return -1
+    else:
+        return 0
@@ -0,0 +1,18 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def pgame():
+    """The "Python Game.py" module, which cannot be imported by name."""
+    spec = importlib.util.spec_from_file_location('python_game', os.path.join(ROOT, 'Python Game.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['python_game'] = module
+    spec.loader.exec_module(module)
+    return module
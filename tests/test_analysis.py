@@ -0,0 +1,61 @@
+import tempfile
+import threading
+
+from game3d import analysis, board, strategies
+
+
+def test_benchmarks_time_each_case_and_find_slowdowns():
+    results = analysis.runBenchmarks(repeat=1, only='printBoard', quiet=True)
+    assert list(results['Results']) == ['printBoard']
+    slower = {'Results': {name: dict(timing, Median=timing['Median'] * 2)
+                          for name, timing in results['Results'].items()}}
+    assert analysis.compareBenchmarks(results, results, quiet=True) == []
+    assert analysis.compareBenchmarks(slower, results, quiet=True) == ['printBoard']
+
+
+def test_benchmarks_remove_the_file_they_save(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    results = analysis.runBenchmarks(repeat=1, only='saveGame', quiet=True)
+    assert list(results['Results']) == ['saveGame+loadGame']
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiling_records_calls_and_restores_functions():
+    make_move = board.makeMove
+    with analysis.profiling() as stats:
+        assert board.makeMove is not make_move
+        strategies.playHeadlessGame(strategies.randomMove, strategies.randomMove)
+    assert board.makeMove is make_move and strategies.makeMove is make_move
+    assert not analysis.instrumentationEnabled()
+    snapshot = stats.snapshot()
+    assert snapshot['makeMove']['Calls'] > 0
+    assert 'game_calls_total{function="makeMove"}' in stats.prometheus()
+
+
+def test_analysis_annotates_every_move(tmp_path):
+    records = str(tmp_path / 'games.jsonl')
+    strategies.runTournament({'random': 'random', 'first': 'first'}, games=2, workers=1,
+                             output=records, quiet=True)
+    output = str(tmp_path / 'games.ann')
+    report = analysis.analyzeGames([records], output, max_depth=1, workers=1, quiet=True)
+    geometry, columns = analysis.readAnnotations(output)
+    assert report['Games'] == 2 and len(columns['Move']) == report['Moves']
+    assert all(delta >= 0 for delta in columns['Delta'])
+
+
+def test_calls_recorded_from_several_threads_are_all_counted():
+    stats = analysis.Instrumentation()
+
+    def work():
+        for _ in range(5000):
+            stats.record('makeMove', 1e-6)
+        stats.recordSearch(0.01, 100, 10, 20, 5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = stats.snapshot()
+    assert snapshot['makeMove']['Calls'] == 20000 and len(stats.samples['makeMove']) == 4096
+    assert snapshot['Engine.search']['Calls'] == 4 and snapshot['Engine']['Nodes'] == 400
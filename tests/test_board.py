@@ -0,0 +1,210 @@
+import copy
+import pickle
+import random
+
+import pytest
+
+import baseline
+from game3d import board
+
+
+def _play(moves, game=None):
+    game = game or board.newGame('x', 'y')
+    for move in moves:
+        game = board.makeMove(game, move)
+    return game
+
+
+def _plainBoard(game):
+    return [[list(row) for row in layer] for layer in game['Board']]
+
+
+def test_invalid_moves_raise_move_not_made():
+    game = board.newGame('x', 'y')
+    for move in ['Zz', 'aa', 'A', 'Aaa', '11']:
+        with pytest.raises(board.MoveNotMade):
+            board.makeMove(game, move)
+    for _ in range(4):
+        game = board.makeMove(game, 'Aa')
+    with pytest.raises(board.MoveNotMade):
+        board.makeMove(game, 'aA')
+
+
+def test_wins_are_found_as_on_plain_lists():
+    game = _play(['Aa', 'Bb', 'Aa', 'Bb', 'Aa', 'Bb'])
+    assert board.isWinner(game) == 0
+    game = _play(['Aa'], game)
+    assert board.isWinner(game) == 1
+    plain = {'Player 1': 'x', 'Player 2': 'y', 'Who': game['Who'], 'Board': _plainBoard(game)}
+    assert board.isWinner(plain) == 1
+    assert board.findValidMoves(game['Board']) == board.findValidMoves(plain['Board'])
+    assert board.printBoard(game['Board']) == board.printBoard(plain['Board'])
+
+
+def test_games_pickle_and_copy():
+    game = _play(['Aa', 'Bb', 'Aa', 'Cc'])
+    restored = pickle.loads(pickle.dumps(game))
+    assert restored == game and type(restored) is board.Game and restored.tracked
+    duplicate = copy.deepcopy(game)
+    duplicate['Board'][0][0][0] = 2
+    assert duplicate != game
+    assert board.isWinner(duplicate) == board.isWinner(copy.deepcopy(dict(duplicate)))
+
+
+def test_script_exports_the_game(pgame):
+    from game3d import strategies
+    assert pgame.makeMove is board.makeMove and pgame.suggestMove is strategies.suggestMove
+
+
+def test_winner_after_a_move_matches_is_winner():
+    rng = random.Random(2)
+    for _ in range(30):
+        game = board.newGame('x', 'y')
+        while not board.isWinner(game):
+            move = rng.choice(board.findValidMoves(game['Board']))
+            game = board.makeMove(game, move)
+            assert board.isWinnerAfter(game, move) == board.isWinner(game)
+
+
+def test_symmetric_positions_share_a_canonical_key():
+    game = _play(['Ab', 'Cc', 'Ab', 'Fe'])
+    key, _ = board.canonicalKey(board.getBitBoard(game))
+    for symmetry in range(8):
+        image = _play([board.mapMove(move, symmetry) for move in ['Ab', 'Cc', 'Ab', 'Fe']])
+        assert board.canonicalKey(board.getBitBoard(image))[0] == key
+        canonical, found = board.canonicalForm(image)
+        assert board.canonicalKey(board.getBitBoard(canonical))[0] == key
+        for move in board.findValidMoves(image['Board']):
+            assert board.mapMove(board.mapMove(move, found), found, inverse=True) == move
+
+
+def test_moves_applied_in_place_undo_and_redo():
+    game = board.newGame('x', 'y')
+    board.applyMove(game, 'Aa')
+    board.applyMove(game, 'Bb')
+    assert game == _play(['Aa', 'Bb'])
+    with pytest.raises(board.MoveNotMade):
+        board.applyMove(game, 'Zz')
+    assert game == _play(['Aa', 'Bb'])
+    assert board.undoMove(game) is not None
+    assert game == _play(['Aa'])
+    board.redoMove(game)
+    assert game == _play(['Aa', 'Bb'])
+    board.undoMove(game)
+    board.undoMove(game)
+    assert game == board.newGame('x', 'y') and board.undoMove(game) is None
+
+
+def test_failed_redo_keeps_the_move():
+    game = _play(['Aa'])
+    board.undoMove(game)
+    game.redo.append('Zz')
+    with pytest.raises(board.MoveNotMade):
+        board.redoMove(game)
+    assert game.redo == ['Aa', 'Zz'] and game == board.newGame('x', 'y')
+
+
+def _allMoves():
+    return [upper + lower for upper in 'ABCDEF' for lower in 'abcdef'] + ['aA', 'fF', 'Zz', 'aa', 'A', 'Aaa', '11']
+
+
+def _outcome(function, *args):
+    #The result of a call, or the name of the error it raised
+    try:
+        return function(*args)
+    except Exception as e:
+        return type(e).__name__
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_lookups_match_plain_lists(seed):
+    rng = random.Random(seed)
+    for _ in range(20):
+        game = board.newGame('x', 'y')
+        while not board.isWinner(game):
+            plain = _plainBoard(game)
+            assert board.findValidMoves(game['Board']) == board.findValidMoves(plain)
+            for move in _allMoves():
+                assert _outcome(board.posToIndex, move, game['Board']) == \
+                    _outcome(board.posToIndex, move, plain)
+            game = board.makeMove(game, rng.choice(board.findValidMoves(game['Board'])))
+
+
+def test_other_geometries_keep_their_size_and_win_length(tmp_path):
+    geometry = board.getGeometry(5, 7, 7, 5)
+    game = board.newGame('x', 'y', geometry)
+    for _ in range(4):
+        game = _play(['Gg', 'Aa'], game)
+    assert board.isWinner(game) == 0
+    game = _play(['Gg'], game)
+    assert board.isWinner(game) == 1
+    board.saveGame(game, str(tmp_path / 'game.csv'))
+    loaded = board.loadGame(str(tmp_path / 'game.csv'))
+    assert board.gameGeometry(loaded) == geometry and board.isWinner(loaded) == 1
+
+
+def _baselineGame():
+    #newGame as it was
+    return {'Player 1': 'x', 'Player 2': 'y', 'Who': 1,
+            'Board': [[[0 for _ in range(6)] for _ in range(6)] for _ in range(4)]}
+
+
+def _checkPosition(game, expected):
+    assert game == expected
+    assert board.findValidMoves(game['Board']) == baseline.findValidMoves(expected['Board'])
+    assert board.isWinner(game) == baseline.isWinner(expected)
+    assert board.printBoard(game['Board']) == baseline.printBoard(expected['Board'])
+    for move in _allMoves():
+        assert _outcome(board.posToIndex, move, game['Board']) == \
+            _outcome(baseline.posToIndex, move, expected['Board'])
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_random_games_match_baseline(seed):
+    rng = random.Random(seed)
+    for _ in range(40):
+        game = board.newGame('x', 'y')
+        expected = _baselineGame()
+        while True:
+            _checkPosition(game, expected)
+            moves = baseline.findValidMoves(expected['Board'])
+            if not moves:
+                break
+            move = rng.choice(moves)
+            if rng.random() < 0.5:
+                move = move[::-1]
+            game = board.makeMove(game, move)
+            expected = baseline.makeMove(expected, move)
+
+            #Boards edited by hand, including pieces left floating
+            if rng.random() < 0.05:
+                k, j, i = rng.randrange(4), rng.randrange(6), rng.randrange(6)
+                value = rng.choice([0, 1, 2])
+                game['Board'][k][j][i] = value
+                expected['Board'][k][j][i] = value
+            if baseline.isWinner(expected) and rng.random() < 0.7:
+                break
+        _checkPosition(game, expected)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_plain_dict_games_match_baseline(seed):
+    #Games that are plain dicts, as a caller may build them, take the list
+    #paths through every function
+    rng = random.Random(seed)
+    for _ in range(20):
+        expected = _baselineGame()
+        for _ in range(rng.randrange(60)):
+            moves = baseline.findValidMoves(expected['Board'])
+            if not moves or baseline.isWinner(expected):
+                break
+            expected = baseline.makeMove(expected, rng.choice(moves))
+        game = copy.deepcopy(expected)
+        _checkPosition(game, expected)
+        for move in _allMoves():
+            assert _outcome(board.makeMove, game, move) == _outcome(baseline.makeMove, expected, move)
+
+
+def test_indexToPos_matches_baseline():
+    for index in ([0, 0], [5, 5], [3, 2, 1], [0, 6], [-1, 0], [1], [1, 2, 3, 4], [2, 5, 0]):
+        assert _outcome(board.indexToPos, index) == _outcome(baseline.indexToPos, index)
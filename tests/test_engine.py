@@ -0,0 +1,103 @@
+import random
+import time
+
+import pytest
+
+from game3d import board, engine
+
+
+def _play(moves, game=None):
+    game = game or board.newGame('x', 'y')
+    for move in moves:
+        game = board.makeMove(game, move)
+    return game
+
+
+def test_search_takes_a_win_and_blocks_a_loss():
+    #Both players have three stacked; the player to move wins first
+    game = _play(['Aa', 'Bb', 'Aa', 'Bb', 'Aa', 'Bb'])
+    assert engine.searchMove(game, None, 2, engine=engine.Engine())['Move'] == 'Aa'
+    game = _play(['Cc', 'Bb', 'Aa', 'Bb', 'Aa', 'Bb'])
+    assert engine.searchMove(game, None, 3, engine=engine.Engine())['Move'] == 'Bb'
+
+
+def test_parallel_search_finds_the_same_win():
+    game = _play(['Aa', 'Bb', 'Aa', 'Bb', 'Aa', 'Bb'])
+    for workers in (1, 2):
+        result = engine.searchMove(game, None, 3, workers=workers, engine=engine.Engine())
+        assert result['Move'] == 'Aa'
+
+
+def test_evaluate_boards_matches_single_boards():
+    pytest.importorskip('numpy')
+    games = board._randomGames(30, seed=4)
+    found = engine.evaluateBoards(engine.boardArray(games))
+    for n, game in enumerate(games):
+        assert found['Winner'][n] == board.isWinner(game)
+        moves = [board.indexToPos([j, i]) for j in range(6) for i in range(6) if found['Moves'][n][j][i]]
+        assert sorted(moves) == sorted(board.findValidMoves(game['Board']))
+
+
+def test_opening_book_answers_without_searching(tmp_path):
+    path = str(tmp_path / 'book.bin')
+    assert engine.buildOpeningBook(path, plies=1, max_depth=2, workers=1, quiet=True) > 1
+    engine.setOpeningBook(path)
+    try:
+        #A first move in any corner is the same position turned around
+        for first in ['Aa', 'Ff', 'Af', 'Fa']:
+            result = engine.searchMove(_play([first]), None, 2)
+            assert result['Book']
+            assert result['Move'] in board.findValidMoves(_play([first])['Board'])
+        assert not engine.searchMove(_play(['Aa', 'Bb']), None, 2, book=True)['Book']
+    finally:
+        engine.setOpeningBook(None)
+
+
+def test_endgame_solver_caches_results(tmp_path):
+    rng = random.Random(5)
+    geometry = board.getGeometry(2, 3, 3, 3)
+    while True:
+        bitboard = board.BitBoard(geometry)
+        for _ in range(10):
+            bitboard.play(rng.choice([column for column in range(geometry.columns)
+                                      if bitboard.canPlay(column)]))
+            if bitboard.winner():
+                break
+        if not bitboard.winner():
+            break
+    game = board.gameFromBitBoard(bitboard, 'x', 'y')
+    path = str(tmp_path / 'solved.db')
+    first = engine.solvePosition(game, path)
+    assert first['Result'] in (-1, 0, 1) and not first['Cached'] and first['Move']
+    again = engine.solvePosition(game, path)
+    assert again['Cached'] and (again['Result'], again['Move']) == (first['Result'], first['Move'])
+
+
+def test_evaluation_follows_threats():
+    #Three in a row on the bottom layer against two
+    game = _play(['Aa', 'Fd', 'Ab', 'Fc', 'Ac'])
+    assert engine.evaluate(game, player=1) > 0 > engine.evaluate(game, player=2)
+
+
+def test_ponderer_answers_the_pondered_position():
+    ponderer = engine.Ponderer(engine.Engine(), time_ms=50)
+    game = _play(['Cc', 'Dd'])
+    ponderer.suggest(game)
+    ponderer.start(game)
+    time.sleep(0.2)
+    reply = _play(['Cd'], game)
+    move = ponderer.suggest(reply)
+    assert move in board.findValidMoves(reply['Board'])
+    assert ponderer.hits + ponderer.misses == 2
+
+
+def test_entries_of_earlier_searches_give_way():
+    table = engine.TranspositionTable(16)
+    table.newSearch()
+    table.store(1, 9, table.EXACT, 5, 0)
+    table.store(17, 1, table.EXACT, 3, 0)
+    assert table.probe(1) and not table.probe(17)
+    #A new search replaces what the pondering left, however deep
+    table.newSearch()
+    table.store(17, 1, table.EXACT, 3, 0)
+    assert table.probe(17) and not table.probe(1)
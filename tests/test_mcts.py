@@ -0,0 +1,45 @@
+import baseline
+from game3d import board, engine
+
+
+def _emptyDict():
+    return {'Player 1': 'x', 'Player 2': 'y', 'Who': 1,
+            'Board': [[[0 for _ in range(6)] for _ in range(6)] for _ in range(4)]}
+
+
+def test_plain_dict_games_do_not_reuse_the_tree():
+    #Boards read from lists have no history, so every one of them used to
+    #look like it followed on from the last root
+    player = engine.MCTS(seed=0)
+    game = _emptyDict()
+    move = engine.mctsMove(game, None, 200, player)['Move']
+    for _ in range(4):
+        game = baseline.makeMove(game, move)
+    result = engine.mctsMove(game, None, 200, player)
+    assert result['Reused'] == 0
+    assert result['Move'] in baseline.findValidMoves(game['Board'])
+
+
+def test_tree_is_reused_after_the_moves_it_searched():
+    player = engine.MCTS(seed=0)
+    game = board.newGame('x', 'y')
+    move = engine.mctsMove(game, None, 400, player)['Move']
+    game = board.makeMove(game, move)
+    reply = engine.mctsMove(game, None, 400, player)
+    assert reply['Reused'] > 0
+    game = board.makeMove(game, reply['Move'])
+    assert engine.mctsMove(game, None, 400, player)['Reused'] > 0
+
+
+def test_same_history_from_another_position_resets_the_tree():
+    player = engine.MCTS(seed=0)
+    game = board.newGame('x', 'y')
+    game = board.makeMove(game, 'Aa')
+    engine.mctsMove(game, None, 200, player)
+
+    #A game that starts from an edited board can play the same moves
+    edited = board.newGame('x', 'y')
+    edited['Board'][0][5][5] = 2
+    edited = board.makeMove(edited, 'Aa')
+    result = engine.mctsMove(edited, None, 200, player)
+    assert result['Reused'] == 0
@@ -0,0 +1,27 @@
+import pytest
+
+from game3d import board, net
+
+pytest.importorskip('numpy')
+
+
+def test_network_trains_saves_and_plays(tmp_path):
+    geometry = board.getGeometry(2, 3, 3, 3)
+    data = net.selfPlayData(games=4, max_depth=1, seed=0, geometry=geometry)
+    model = net.ValueNet(geometry, hidden=(16, 8))
+    before, _ = model.predict(data['Planes'])
+    net.trainValueNet(model, data, epochs=2, quiet=True)
+    after, policy = model.predict(data['Planes'])
+    assert (after != before).any()
+    assert policy.shape == (len(after), geometry.columns)
+
+    path = str(tmp_path / 'net.npz')
+    model.save(path)
+    net.setValueNet(path)
+    try:
+        game = board.newGame('x', 'y', geometry)
+        assert net.netMove(game, None, max_depth=2) in board.findValidMoves(game['Board'])
+    finally:
+        net.setValueNet(None)
+    with pytest.raises(ValueError):
+        net.netMove(board.newGame('x', 'y'), None, max_depth=1)
@@ -0,0 +1,28 @@
+import pytest
+
+from game3d import analysis
+
+
+@pytest.mark.parametrize('backend', sorted(analysis.PERFT_BACKENDS))
+def test_backends_match_reference_counts(backend):
+    assert analysis.checkPerft(backend, max_nodes=20000, quiet=True) == []
+
+
+@pytest.mark.parametrize('backend', ['inplace', 'bitboard'])
+def test_backends_match_lists_on_a_small_board(backend):
+    #Wins and full collumns both come up five plies in
+    assert analysis.comparePerft(analysis.perftPosition('small'), 5, backend) is None
+
+
+def test_compare_finds_where_a_backend_is_wrong():
+    def missesWins(game, depth, counts):
+        found = [0, 0, 0, 0]
+        analysis._perftBitBoard(game, depth, found)
+        counts[0] += found[0] + found[1]
+        counts[2] += found[2]
+        counts[-1] += found[-1]
+
+    game = analysis.perftPosition('threats')
+    mismatch = analysis.comparePerft(game, 2, missesWins)
+    assert mismatch is not None and len(mismatch['Moves']) == 1
+    assert mismatch['Expected'][1] == 1 and mismatch['Found'][1] == 0
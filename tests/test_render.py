@@ -0,0 +1,36 @@
+import random
+
+from game3d import board, render
+
+
+def test_renders_match_print_board():
+    renderer = render.BoardRenderer()
+    rng = random.Random(0)
+    for game in board._randomGames(20, seed=6):
+        assert renderer.render(game['Board']) == board.printBoard(game['Board'])
+        #A board edited in place is rendered from the cells that changed
+        k, j, i = rng.randrange(4), rng.randrange(6), rng.randrange(6)
+        game['Board'][k][j][i] = rng.choice([0, 1, 2])
+        assert renderer.render(game['Board']) == board.printBoard(game['Board'])
+
+    small = board.newGame('x', 'y', board.getGeometry(2, 3, 3, 3))
+    assert renderer.render(small['Board']) == board.printBoard(small['Board'])
+
+
+def test_ansi_diff_lists_the_changed_cell():
+    renderer = render.BoardRenderer()
+    game = board.newGame('x', 'y')
+    renderer.render(game['Board'])
+    game = board.makeMove(game, 'Cb')
+    assert renderer.ansiDiff(game['Board'])
+    assert renderer.changed == [1 * 6 + 2]
+    assert renderer.ansiDiff(game['Board']) == ''
+
+
+def test_game_rendered_after_a_plain_list():
+    renderer = render.BoardRenderer()
+    for game in board._randomGames(5, seed=7):
+        played = board.makeMove(board.newGame('x', 'y'), 'Cc')
+        assert renderer.render(game['Board']) == board.printBoard(game['Board'])
+        assert renderer.render(played['Board']) == board.printBoard(played['Board'])
+        assert renderer.render(game['Board']) == board.printBoard(game['Board'])
@@ -0,0 +1,64 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from game3d import board, engine, strategies
+
+
+def _positions(count, seed=3):
+    rng = random.Random(seed)
+    games = []
+    while len(games) < count:
+        game = board.newGame('x', 'y')
+        for _ in range(rng.randrange(2, 8)):
+            game = board.makeMove(game, rng.choice(board.findValidMoves(game['Board'])))
+            if board.isWinner(game):
+                break
+        if not board.isWinner(game):
+            games.append(game)
+    return games
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_seeded_searches_ignore_the_time_budget(workers):
+    #A time budget far too short for the depth must not change the move
+    for game in _positions(3):
+        expected = engine.searchMove(game, None, 4, workers=workers, seed=1)
+        found = engine.searchMove(game, 1, 4, workers=workers, seed=1)
+        assert (found['Move'], found['Depth']) == (expected['Move'], expected['Depth'])
+
+
+def test_suggested_moves_are_repeatable():
+    games = _positions(4)
+    first = [strategies.suggestMove(game, max_nodes=3000, seed=0) for game in games]
+    again = [strategies.suggestMove(game, max_nodes=3000, seed=0) for game in reversed(games)]
+    assert first == again[::-1]
+    for game, move in zip(games, first):
+        assert move in board.findValidMoves(game['Board'])
+
+
+def test_overlapping_parallel_searches_have_their_own_bounds(monkeypatch):
+    made = []
+
+    def recording(bounds, *args):
+        init(bounds, *args)
+        made.append(bounds)
+    init = engine._SharedBounds.__init__
+    monkeypatch.setattr(engine._SharedBounds, '__init__', recording)
+    games = [board.newGame('x', 'y'), board.makeMove(board.newGame('x', 'y'), 'Cc')]
+    with ThreadPoolExecutor(2) as threads:
+        results = list(threads.map(lambda game: engine.searchMove(game, 300, workers=2), games))
+    assert len(made) == 2 and made[0].scores is not made[1].scores
+    for game, result in zip(games, results):
+        assert result['Move'] in board.findValidMoves(game['Board'])
+
+
+def test_seeded_searches_leave_the_shared_table_alone():
+    game = _positions(1)[0]
+    engine.searchMove(game, None, 3)
+    table = engine._defaultEngine.table
+    stored = sum(entry is not None for entry in table.entries)
+    engine.searchMove(game, None, 3, seed=1)
+    assert engine._defaultEngine.table is table
+    assert sum(entry is not None for entry in table.entries) == stored
@@ -0,0 +1,84 @@
+import asyncio
+
+from game3d import server
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_new_move_and_quit():
+    async def session():
+        host = server.GameServer(time_ms=10)
+        reply = await host.handle('NEW ann bob')
+        assert reply == 'GAME 1 0 1 -'
+        assert (await host.handle('MOVE 1 Aa')).startswith('OK 1 0 2')
+        assert (await host.handle('MOVE 1 Zz')).startswith('ERR')
+        assert (await host.handle('BOARD 1')).startswith('BOARD 1 2 1')
+        assert await host.handle('QUIT 1') == 'BYE 1'
+        assert await host.handle('MOVES 1') == 'ERR unknown game'
+    _run(session())
+
+
+def test_quit_during_an_engine_move():
+    #The computer is still thinking when the game is quit; its move must not
+    #bring the game back
+    async def session():
+        host = server.GameServer(time_ms=50)
+        await host.handle('NEW ann C')
+        move, quit = await asyncio.gather(host.handle('MOVE 1 Aa'), host.handle('QUIT 1'))
+        assert move.startswith('OK 1 0 1 ') and quit == 'BYE 1'
+        assert host.games == {} and host.results == {} and host._locks == {}
+        assert await host.handle('MOVE 1 Bb') == 'ERR unknown game'
+        assert await host.handle('QUIT 1') == 'ERR unknown game'
+    _run(session())
+
+
+def test_unexpected_errors_are_answered(monkeypatch):
+    def broken(game, time_ms):
+        raise RuntimeError('engine failed')
+    monkeypatch.setattr(server, '_engineMove', broken)
+
+    async def session():
+        host = server.GameServer(time_ms=10)
+        reply = await host.handle('NEW C bob')
+        assert reply == 'ERR RuntimeError: engine failed'
+    _run(session())
+
+
+def test_percentiles_use_the_nearest_rank():
+    ordered = list(range(1, 11))
+    assert server._percentile(ordered, 0.50) == 5
+    assert server._percentile(ordered, 0.70) == 7
+    assert server._percentile(ordered, 0.90) == 9
+    assert server._percentile(ordered, 0.99) == 10
+    assert server._percentile(ordered, 0.0) == 1
+    assert server._percentile([], 0.5) == 0.0
+
+
+def test_games_end_when_their_connection_closes():
+    async def session():
+        host = server.GameServer(port=0, workers=1)
+        await host.start()
+        try:
+            reader, writer = await asyncio.open_connection(host.host, host.port)
+            writer.write(b'NEW ann bob\nNEW cat dan\nQUIT 1\n')
+            for _ in range(3):
+                await reader.readline()
+            other_reader, other_writer = await asyncio.open_connection(host.host, host.port)
+            other_writer.write(b'NEW eve fay\n')
+            await other_reader.readline()
+            assert sorted(host.games) == [2, 3]
+
+            writer.close()
+            await writer.wait_closed()
+            for _ in range(500):
+                if 2 not in host.games:
+                    break
+                await asyncio.sleep(0.01)
+            assert sorted(host.games) == [3] and sorted(host._locks) == [3]
+            other_writer.close()
+            await other_writer.wait_closed()
+        finally:
+            await host.close()
+    _run(session())
@@ -0,0 +1,105 @@
+import os
+import shutil
+import time
+
+from game3d import board
+from game3d.sessions import SessionStore
+
+
+def _play(store, moves):
+    session_id = store.create('x', 'y')
+    for move in moves:
+        store.move(session_id, move)
+    return session_id
+
+
+def test_sessions_survive_reopening(tmp_path):
+    with SessionStore(str(tmp_path), capacity=1, snapshot_every=5) as store:
+        first = _play(store, ['Aa', 'Bb', 'Aa'])
+        second = _play(store, ['Cc', 'Cc'])
+        store.delete(first)
+        third = _play(store, ['Dd'])
+    store = SessionStore(str(tmp_path))
+    assert first not in store and len(store) == 2
+    assert store.moves(second) == ['Cc', 'Cc'] and store.moves(third) == ['Dd']
+    expected = board.makeMove(board.makeMove(board.newGame('x', 'y'), 'Cc'), 'Cc')
+    assert store.get(second) == expected
+    store.close()
+
+
+def test_record_cut_short_is_dropped(tmp_path):
+    store = SessionStore(str(tmp_path))
+    session_id = _play(store, ['Aa', 'Bb'])
+    store.flush()
+    store._log.write('{"Op":"mo')
+    store._log.flush()
+    store = SessionStore(str(tmp_path))
+    assert store.moves(session_id) == ['Aa', 'Bb']
+    store.move(session_id, 'Cc')
+    store.close()
+    assert SessionStore(str(tmp_path)).moves(session_id) == ['Aa', 'Bb', 'Cc']
+
+
+def test_evicted_sessions_are_rebuilt_from_the_files(tmp_path):
+    store = SessionStore(str(tmp_path), capacity=1)
+    first = _play(store, ['Aa', 'Bb'])
+    second = _play(store, ['Cc'])
+    store.snapshot()
+    store.move(first, 'Dd')
+    store.move(second, 'Ee')
+    third = _play(store, ['Ff'])
+    #Only where each session's records are is kept in memory
+    assert all(isinstance(offset, (int, type(None))) for where in store._sessions.values()
+               for offset in where)
+    assert store.get(first) == board.makeMove(board.makeMove(board.makeMove(
+        board.newGame('x', 'y'), 'Aa'), 'Bb'), 'Dd')
+    assert store.moves(second) == ['Cc', 'Ee'] and store.moves(third) == ['Ff']
+    assert store.metrics()['Resident'] == 1
+    store.close()
+
+
+def test_crash_after_the_snapshot_does_not_replay_its_log(tmp_path):
+    #The old log is still there when the new snapshot is in place
+    store = SessionStore(str(tmp_path))
+    session_id = _play(store, ['Aa', 'Bb'])
+    store.flush()
+    old_log = store._logPath(store.generation)
+    shutil.copy(old_log, str(tmp_path / 'kept'))
+    store.snapshot()
+    store.close()
+    os.replace(str(tmp_path / 'kept'), old_log)
+    store = SessionStore(str(tmp_path))
+    assert store.moves(session_id) == ['Aa', 'Bb']
+    assert store.get(session_id)['Who'] == 1
+    assert not os.path.exists(old_log)
+    store.close()
+
+
+def test_crash_before_the_snapshot_keeps_the_old_log(tmp_path):
+    #The new log was made but the snapshot naming it never put in place
+    store = SessionStore(str(tmp_path))
+    session_id = _play(store, ['Aa', 'Bb'])
+    store.close()
+    open(store._logPath(store.generation + 1), 'w').close()
+    store = SessionStore(str(tmp_path))
+    assert store.moves(session_id) == ['Aa', 'Bb']
+    store.move(session_id, 'Cc')
+    store.close()
+    assert SessionStore(str(tmp_path)).moves(session_id) == ['Aa', 'Bb', 'Cc']
+
+
+def test_quiet_records_are_synced_by_the_timer(tmp_path):
+    store = SessionStore(str(tmp_path), sync_interval=0.2)
+    store.flush()
+    store.create('x', 'y')
+    assert store.syncs == 0
+    deadline = time.monotonic() + 5
+    while not store.syncs and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.syncs == 1
+    assert os.path.getsize(store._logPath(store.generation)) > 0
+    store.close()
+
+
+def test_script_exports_the_store(pgame):
+    assert pgame.SessionStore is SessionStore
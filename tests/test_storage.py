@@ -0,0 +1,102 @@
+import os
+import random
+
+import pytest
+
+from game3d import board, storage
+
+
+def _playedGames(count, seed):
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = board.newGame('Player 1', 'Player 2')
+        for _ in range(rng.randrange(1, 40)):
+            game = board.makeMove(game, rng.choice(board.findValidMoves(game['Board'])))
+            if board.isWinner(game):
+                break
+        games.append(game)
+    return games
+
+
+def test_archive_round_trip(tmp_path):
+    games = _playedGames(10, 1) + board._randomGames(10, seed=1)
+    #A game loaded from CSV has no history and is stored by its bitmasks
+    board.saveGame(games[0], str(tmp_path / 'game.csv'))
+    loaded = board.loadGame(str(tmp_path / 'game.csv'))
+
+    archive = storage.GameArchive(str(tmp_path / 'games.g3d'))
+    archive.extend(games)
+    archive.append(loaded)
+    assert len(archive) == 21
+    assert [dict(game) for game in archive] == [dict(game) for game in games + [loaded]]
+    assert board.gameMoves(archive[3]) == board.gameMoves(games[3])
+
+    #Games appended later are read from where an earlier read stopped
+    _, end = list(archive.gamesFrom())[-1]
+    archive.append(games[5])
+    assert [dict(game) for game, _ in archive.gamesFrom(end)] == [dict(games[5])]
+
+
+def test_binary_save_and_load(tmp_path):
+    game = board._randomGames(1, seed=2)[0]
+    storage.saveGameBinary(game, str(tmp_path / 'game.g3d'))
+    assert dict(storage.loadGameBinary(str(tmp_path / 'game.g3d'))) == dict(game)
+
+
+def test_boards_too_big_for_the_format_are_refused(tmp_path):
+    geometry = board.getGeometry(2, 16, 17, 3)
+    game = board.makeMove(board.newGame('x', 'y', geometry), geometry.moveNames[-1])
+    path = str(tmp_path / 'game.g3d')
+    storage.saveGameBinary(board.newGame('x', 'y'), path)
+    with pytest.raises(storage.ArchiveError, match='too big'):
+        storage.saveGameBinary(game, path)
+    assert storage.loadGameBinary(path)['Player 1'] == 'x'
+    os.remove(path)
+    with pytest.raises(storage.ArchiveError, match='too big'):
+        storage.GameArchive(path, board.getGeometry(300, 2, 2, 3))
+
+
+def test_position_index_finds_games(tmp_path):
+    path = str(tmp_path / 'games.g3d')
+    archive = storage.GameArchive(path)
+    archive.extend(_playedGames(10, 3))
+    index = storage.PositionIndex(str(tmp_path / 'index.db'))
+    assert index.update([path]) == 10
+    assert index.update([path]) == 0
+
+    game = index.game(4, ply=3)
+    assert (4, 3) in index.find(game)
+    info = index.gameInfo(4)
+    assert info['Number'] == 4 and len(info['Moves']) == info['Plies']
+    assert dict(index.game(4)) == dict(archive[3])
+
+    #The first position turned over is found with its symmetries
+    first = board.makeMove(board.newGame('Player 1', 'Player 2'), info['Moves'][0])
+    mirrored = board.gameFromBitBoard(board.transformBitBoard(board.getBitBoard(first), 1),
+                                       'Player 1', 'Player 2')
+    assert all(found in index.find(mirrored, symmetric=True) for found in index.find(first))
+    index.close()
+
+
+def test_records_still_being_written_are_indexed_later(tmp_path):
+    path = str(tmp_path / 'games.g3d')
+    games = _playedGames(4, 5)
+    record = storage._packGame(games[3])
+    with open(path, 'wb') as file:
+        file.write(b'G3DA'[:2])
+    index = storage.PositionIndex(str(tmp_path / 'index.db'))
+    assert index.update([path]) == 0
+    os.remove(path)
+    storage.GameArchive(path).extend(games[:3])
+    #First the record's header is cut short, then its body
+    for part, added in ((record[:3], 3), (record[3:len(record) // 2], 0)):
+        with open(path, 'ab') as file:
+            file.write(part)
+        assert index.update([path]) == added
+        assert len(storage.GameArchive(path)) == 3
+    with open(path, 'ab') as file:
+        file.write(record[len(record) // 2:])
+    assert index.update([path]) == 1
+    assert dict(index.game(4)) == dict(games[3])
+    index.close()
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from game3d import board, strategies
+
+
+def test_headless_games_end_with_a_result():
+    for seed in range(5):
+        record = strategies.playHeadlessGame(strategies.randomMove, strategies.firstMove, seed)
+        assert record['Winner'] in (1, 2, -1) and record['Error'] is None
+        game = board.newGame('x', 'y')
+        for move in record['Moves']:
+            game = board.makeMove(game, move)
+        assert board.isWinner(game) == record['Winner']
+
+
+def test_invalid_moves_forfeit():
+    record = strategies.playHeadlessGame(lambda game: 'Zz', strategies.firstMove)
+    assert record['Winner'] == 2 and record['Error']
+
+
+def test_tournament_writes_every_game(tmp_path):
+    output = str(tmp_path / 'games.jsonl')
+    report = strategies.runTournament({'random': 'random', 'first': 'first', 'depth': 'depth:1'},
+                                      games=2, workers=1, output=output, quiet=True)
+    assert report['Games'] == 6
+    with open(output) as file:
+        records = [json.loads(line) for line in file]
+    assert len(records) == 6
+    for standing in report['Standings'].values():
+        assert standing['Games'] == 4
+        assert standing['Wins'] + standing['Draws'] + standing['Losses'] == 4
+
+
+def test_unknown_strategies_are_rejected():
+    with pytest.raises(ValueError):
+        strategies.parseStrategy('nobody')
+    with pytest.raises(ValueError):
+        strategies.suggestMove(board.newGame('x', 'y'), method='guess')
+
+
+def test_each_player_searches_with_its_own_engine(monkeypatch):
+    calls = []
+
+    def recording(game, *args, engine=None, **kwargs):
+        calls.append((game['Who'], engine))
+        return search(game, *args, engine=engine, **kwargs)
+    search = strategies.searchMove
+    monkeypatch.setattr(strategies, 'searchMove', recording)
+    strategy = strategies.parseStrategy('depth:1')
+    engines = []
+    for seed in range(2):
+        del calls[:]
+        strategies.playHeadlessGame(strategy, strategy, seed)
+        players = [{id(engine) for who, engine in calls if who == player} for player in (1, 2)]
+        assert all(len(found) == 1 for found in players) and players[0] != players[1]
+        engines += [engine for _, engine in calls]
+    assert None not in engines and len({id(engine) for engine in engines}) == 4